@@ -1,18 +1,41 @@
 """Plugin file for custom Panel server endpoints"""
 
+import asyncio
 import hashlib
 import json
+import os
 import secrets
+import threading
 import time
 from pathlib import Path
 from urllib.parse import urlparse
 
+import httpx
 from aind_data_access_api.document_db import MetadataDbClient
 from panel.config import config as panel_config
-from tornado.web import HTTPError, RequestHandler
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.web import HTTPError, RequestHandler, StaticFileHandler
 
 from aind_qc_portal.view_contents.data_utils import upload_temporary_metadata
-from aind_qc_portal.view_contents.panels.media.utils import clean_reference_prefix, get_s3_url
+from aind_qc_portal.view_contents.panels.media.disk_cache import get_media_disk_cache
+from aind_qc_portal.view_contents.panels.media.pool import get_thread_pool
+from aind_qc_portal.view_contents.panels.media.thumbnails import (
+    PREVIEW_WIDTH,
+    PREVIEW_WIDTHS,
+    get_preview,
+    needs_conversion,
+    supports_preview,
+)
+from aind_qc_portal.view_contents.panels.media.tiles import get_pyramid
+from aind_qc_portal.view_contents.panels.media.transcode import (
+    POSTER_FILE,
+    start_poster,
+    start_transcode,
+    streamable_name,
+    video_path,
+)
+from aind_qc_portal.view_contents.panels.media.utils import MEDIA_TTL, clean_reference_prefix, get_s3_url
 
 _docdb_client = MetadataDbClient(
     host="api.allenneuraldynamics.org",
@@ -31,9 +54,27 @@ ALLOWED_HOST_SUFFIXES = (
 )
 ALLOWED_CORS_SUFFIXES = (".allenneuraldynamics.org",)
 CORS_MAX_AGE_SECONDS = 3600
+# Media routes validate every request against DocDB, a tile viewer makes hundreds of requests per image
+LOCATED_REFERENCE_TTL_SECONDS = 60
+# Proxied media URLs are stable, browsers can keep them and revalidate with the S3 ETag
+MEDIA_PROXY_MAX_AGE_SECONDS = 60 * 60 * 24 * 7
+MEDIA_PROXY_CHUNK_SIZE = 256 * 1024
+MEDIA_PROXY_REQUEST_HEADERS = ("Range", "If-Range", "If-None-Match", "If-Modified-Since")
+MEDIA_PROXY_RESPONSE_HEADERS = (
+    "Content-Type",
+    "Content-Length",
+    "Content-Range",
+    "Content-Encoding",
+    "Accept-Ranges",
+    "ETag",
+    "Last-Modified",
+)
 
 _ISSUED_TOKENS: dict[str, dict] = {}
 _PENDING_UPSERTS: dict[tuple[str, str, str], dict] = {}
+_LOCATED_REFERENCES: dict[tuple[str, str], tuple[float, tuple[str, str]]] = {}
+# Lookups run on the event loop and on "media-io" threads
+_located_references_lock = threading.Lock()
 _PROCESS_STARTED_AT: float = time.time()
 
 
@@ -170,45 +211,250 @@ class GetSignedReferenceHandler(RequestHandler):
         if not reference:
             raise HTTPError(400, "Missing required query parameter: reference")
 
-        records = _docdb_client.retrieve_docdb_records(
-            filter_query={"name": asset_name},
-            projection={"quality_control": 1, "name": 1, "location": 1},
-        )
+        bucket, key = _locate_reference(asset_name, reference)
 
-        if not records:
-            raise HTTPError(404, f"Asset '{asset_name}' not found.")
+        url = get_s3_url(bucket, key)
+        if not url:
+            raise HTTPError(500, "Failed to generate pre-signed URL.")
 
-        record = records[0]
-        quality_control = record.get("quality_control", {})
-        metrics = quality_control.get("metrics", [])
+        self.set_header("Content-Type", "application/json")
+        self.write({"url": url})
 
-        reference_found = any(
-            metric.get("reference") == reference
-            for metric in metrics
-            if metric.get("reference") is not None
+
+def _locate_reference(asset_name: str, reference: str) -> tuple[str, str]:
+    """Validate that `reference` belongs to a metric of `asset_name` in DocDB and return its S3 (bucket, key).
+
+    Raises HTTPError 404 if the asset doesn't exist and 403 if the reference isn't used by any of its metrics.
+    Successful lookups are cached for LOCATED_REFERENCE_TTL_SECONDS.
+    """
+    with _located_references_lock:
+        cached = _LOCATED_REFERENCES.get((asset_name, reference))
+    if cached and cached[0] > _now():
+        return cached[1]
+
+    records = _docdb_client.retrieve_docdb_records(
+        filter_query={"name": asset_name},
+        projection={"quality_control": 1, "name": 1, "location": 1},
+    )
+
+    if not records:
+        raise HTTPError(404, f"Asset '{asset_name}' not found.")
+
+    record = records[0]
+    quality_control = record.get("quality_control", {})
+    metrics = quality_control.get("metrics", [])
+
+    reference_found = any(
+        metric.get("reference") == reference
+        for metric in metrics
+        if metric.get("reference") is not None
+    )
+
+    if not reference_found:
+        raise HTTPError(403, f"Reference '{reference}' is not associated with any metric in asset '{asset_name}'.")
+
+    if "s3" in reference:
+        bucket = reference.split("/")[2]
+        key = "/".join(reference.split("/")[3:])
+    else:
+        location = record.get("location", "")
+        if not location.startswith("s3://"):
+            raise HTTPError(500, f"Asset location '{location}' is not an s3:// URI.")
+        parts = location.split("/")
+        bucket = parts[2]
+        prefix = "/".join(parts[3:])
+        key = str(Path(prefix) / clean_reference_prefix(reference))
+
+    now = _now()
+    with _located_references_lock:
+        for expired in [k for k, (expires_at, _) in _LOCATED_REFERENCES.items() if expires_at <= now]:
+            del _LOCATED_REFERENCES[expired]
+        _LOCATED_REFERENCES[(asset_name, reference)] = (now + LOCATED_REFERENCE_TTL_SECONDS, (bucket, key))
+    return bucket, key
+
+
+class MediaPreviewHandler(RequestHandler):
+    """GET /media-preview/<asset_name>?reference=<reference>&width=<width>
+
+    Serves a WebP preview of an image reference, downscaled to `width` (one of PREVIEW_WIDTHS). With
+    width=full, formats browsers can display are redirected to a pre-signed URL and others (TIFF) are
+    converted at full resolution. Only references used by a metric of the asset in DocDB are served.
+    """
+
+    async def get(self, asset_name):
+        """Handle GET requests for a preview"""
+        reference = self.get_argument("reference", None)
+        width = self.get_argument("width", str(PREVIEW_WIDTH))
+
+        if not reference:
+            raise HTTPError(400, "Missing required query parameter: reference")
+        if width != "full" and width not in [str(w) for w in PREVIEW_WIDTHS]:
+            raise HTTPError(400, f"width must be 'full' or one of {PREVIEW_WIDTHS}.")
+
+        # DocDB, S3 and image processing are all blocking, run them off the IOLoop
+        pool = get_thread_pool("media-io")
+        loop = IOLoop.current()
+
+        bucket, key = await loop.run_in_executor(pool, _locate_reference, asset_name, reference)
+        url = await loop.run_in_executor(pool, get_s3_url, bucket, key)
+        if not url:
+            raise HTTPError(500, "Failed to generate pre-signed URL.")
+
+        if not supports_preview(key) or (width == "full" and not needs_conversion(key)):
+            self.redirect(url)
+            return
+
+        path = await loop.run_in_executor(
+            pool, get_preview, url, Path(key).suffix.lower(), None if width == "full" else int(width)
         )
+        if not path:
+            raise HTTPError(502, f"Failed to fetch '{reference}' from S3.")
 
-        if not reference_found:
-            raise HTTPError(403, f"Reference '{reference}' is not associated with any metric in asset '{asset_name}'.")
+        with open(path, "rb") as f:
+            content = f.read()
 
-        if "s3" in reference:
-            bucket = reference.split("/")[2]
-            key = "/".join(reference.split("/")[3:])
-        else:
-            location = record.get("location", "")
-            if not location.startswith("s3://"):
-                raise HTTPError(500, f"Asset location '{location}' is not an s3:// URI.")
-            parts = location.split("/")
-            bucket = parts[2]
-            prefix = "/".join(parts[3:])
-            key = str(Path(prefix) / clean_reference_prefix(reference))
+        self.set_header("Content-Type", "image/webp")
+        self.set_header("Cache-Control", f"private, max-age={MEDIA_TTL}")
+        self.write(content)
 
-        url = get_s3_url(bucket, key)
+
+class MediaTilesHandler(RequestHandler):
+    """GET /media-tiles/<asset_name>/<tile_path>?reference=<reference>
+
+    Serves the tile pyramid of a very large image reference, built on first access (see tiles.py).
+    `tile_path` is info.json, describing the pyramid levels, or <level>/<col>_<row>.webp. Only references
+    used by a metric of the asset in DocDB are served.
+    """
+
+    async def get(self, asset_name, tile_path):
+        """Handle GET requests for the pyramid description or a tile"""
+        reference = self.get_argument("reference", None)
+
+        if not reference:
+            raise HTTPError(400, "Missing required query parameter: reference")
+        if not supports_preview(reference):
+            raise HTTPError(400, f"Reference '{reference}' is not an image that can be tiled.")
+
+        pool = get_thread_pool("media-io")
+        loop = IOLoop.current()
+
+        bucket, key = await loop.run_in_executor(pool, _locate_reference, asset_name, reference)
+        url = await loop.run_in_executor(pool, get_s3_url, bucket, key)
         if not url:
             raise HTTPError(500, "Failed to generate pre-signed URL.")
 
-        self.set_header("Content-Type", "application/json")
-        self.write({"url": url})
+        pyramid_dir = await loop.run_in_executor(pool, get_pyramid, url, Path(key).suffix.lower())
+        if not pyramid_dir:
+            raise HTTPError(502, f"Failed to fetch '{reference}' from S3.")
+
+        path = Path(pyramid_dir) / tile_path
+        if not path.is_file():
+            raise HTTPError(404, f"Tile '{tile_path}' not found.")
+
+        with open(path, "rb") as f:
+            content = f.read()
+
+        self.set_header("Content-Type", "application/json" if tile_path == "info.json" else "image/webp")
+        self.set_header("Cache-Control", f"private, max-age={MEDIA_TTL}")
+        self.write(content)
+
+
+class MediaProxyHandler(RequestHandler):
+    """GET /media/<asset_name>/<reference>
+
+    Streams the S3 object behind a metric reference, passing Range and conditional request headers through
+    to S3 so that videos can seek and browsers can revalidate cached copies. Only references used by a
+    metric of the asset in DocDB are served. The reference is URL-encoded as a single path segment.
+    """
+
+    def compute_etag(self):
+        """The ETag from S3 is passed through instead"""
+        return None
+
+    async def get(self, asset_name, reference):
+        """Handle GET requests, streaming the response from S3"""
+        pool = get_thread_pool("media-io")
+        loop = IOLoop.current()
+
+        bucket, key = await loop.run_in_executor(pool, _locate_reference, asset_name, reference)
+        url = await loop.run_in_executor(pool, get_s3_url, bucket, key)
+        if not url:
+            raise HTTPError(500, "Failed to generate pre-signed URL.")
+
+        request_headers = self.request.headers
+        headers = {name: request_headers[name] for name in MEDIA_PROXY_REQUEST_HEADERS if name in request_headers}
+        async with httpx.AsyncClient() as client, client.stream("GET", url, headers=headers) as response:
+            if response.status_code not in (200, 206, 304, 416):
+                await response.aread()
+                print(f"[ERROR] Failed to proxy {bucket}/{key}: {response.status_code} / {response.text}")
+                raise HTTPError(502, f"Failed to fetch '{reference}' from S3.")
+
+            self.set_status(response.status_code)
+            for name in MEDIA_PROXY_RESPONSE_HEADERS:
+                if name in response.headers:
+                    self.set_header(name, response.headers[name])
+            self.set_header("Cache-Control", f"private, max-age={MEDIA_PROXY_MAX_AGE_SECONDS}")
+
+            if response.status_code in (304, 416):
+                return
+
+            # Raw bytes, Content-Length and Content-Encoding are passed through as they are
+            async for chunk in response.aiter_raw(MEDIA_PROXY_CHUNK_SIZE):
+                self.write(chunk)
+                try:
+                    await self.flush()
+                except StreamClosedError:
+                    # The browser stopped reading, e.g. it seeked elsewhere in a video
+                    return
+
+
+class MediaVideoHandler(StaticFileHandler):
+    """GET /media-video/<asset_name>/<reference>/(video.mp4|poster.jpg)
+
+    Serves the streamable copy or the poster frame of a video reference that has to be transcoded (see
+    transcode.py), from the media disk cache with Range support. Requesting either starts the video's
+    transcode job, which extracts the poster frame first. Videos return 404 until the job has finished.
+    Only references used by a metric of the asset in DocDB are served.
+    """
+
+    def initialize(self):
+        """Serve files from the media disk cache"""
+        super().initialize(path=str(get_media_disk_cache().data_dir))
+
+    def get_cache_time(self, path, modified, mime_type):
+        """Transcoded files are named by the source's ETag and never change"""
+        return MEDIA_PROXY_MAX_AGE_SECONDS
+
+    async def head(self, *args):
+        """Only GET is supported, locating the file takes S3 requests"""
+        raise HTTPError(405)
+
+    async def get(self, asset_name, reference, file_name, include_body=True):
+        """Handle GET requests for a streamable video or its poster"""
+        pool = get_thread_pool("media-io")
+        loop = IOLoop.current()
+
+        bucket, key = await loop.run_in_executor(pool, _locate_reference, asset_name, reference)
+        url = await loop.run_in_executor(pool, get_s3_url, bucket, key)
+        if not url:
+            raise HTTPError(500, "Failed to generate pre-signed URL.")
+
+        name = await loop.run_in_executor(pool, streamable_name, url, key)
+        if not name:
+            raise HTTPError(404, f"'{reference}' can be streamed as it is, use /media instead.")
+
+        if file_name == POSTER_FILE:
+            # Extracted by the video's transcode job, without holding a media-io thread
+            path = await asyncio.wrap_future(start_poster(url, name, key))
+        else:
+            path = video_path(name)
+            if not os.path.isfile(path):
+                start_transcode(url, name, key)
+                raise HTTPError(404, f"'{reference}' is still being transcoded.")
+
+        if not path:
+            raise HTTPError(502, f"Failed to extract a poster frame from '{reference}'.")
+        await super().get(os.path.basename(path), include_body)
 
 
 def _origin_is_allowed(origin: str) -> bool:
@@ -505,6 +751,10 @@ class PendingMetadataAllHandler(_CrossOriginMixin, RequestHandler):
 ROUTES = [
     ("/upload_metadata", UploadMetadataHandler, {}),
     (r"/get-signed-reference/([^/]+)", GetSignedReferenceHandler, {}),
+    (r"/media-preview/([^/]+)", MediaPreviewHandler, {}),
+    (r"/media/([^/]+)/([^/]+)", MediaProxyHandler, {}),
+    (r"/media-video/([^/]+)/([^/]+)/(video\.mp4|poster\.jpg)", MediaVideoHandler, {}),
+    (r"/media-tiles/([^/]+)/(info\.json|\d+/\d+_\d+\.webp)", MediaTilesHandler, {}),
     ("/metadata/token", IssueMetadataTokenHandler, {}),
     ("/metadata/v1", UpsertMetadataV1Handler, {}),
     ("/metadata/v2", UpsertMetadataV2Handler, {}),
@@ -14,6 +14,7 @@ from aind_qc_portal.view_contents.data_utils import (
     decode_dict_value,
     encode_dict_value,
 )
+from aind_qc_portal.view_contents.search import MetricSearchIndex
 
 TIMEOUT_1M = 60
 TIMEOUT_1H = 60 * 60
@@ -43,6 +44,8 @@ class ViewData(param.Parameterized):
         super().__init__()
         self._client = client
         self.asset_name = asset_name
+        self.search_index = None
+        self.from_docdb = False
 
         self._load_record()
         self._parse_record()
@@ -145,6 +148,7 @@ class ViewData(param.Parameterized):
             # Update metric_status to reflect reversion to original
             if column_name == "status":
                 self.metric_status.loc[self.metric_status["name"] == metric_name, "evaluated_status"] = original_value
+                self.search_index.update_status(metric_name, original_value)
             return
 
         # Value differs from original - add or update the change
@@ -162,6 +166,7 @@ class ViewData(param.Parameterized):
         # Update metric_status to reflect pending change
         if column_name == "status":
             self.metric_status.loc[self.metric_status["name"] == metric_name, "evaluated_status"] = value
+            self.search_index.update_status(metric_name, value)
 
         # Save changes to cache
         self.save_changes_to_cache()
@@ -235,6 +240,7 @@ class ViewData(param.Parameterized):
                 return
         else:
             self.record = records[0]
+            self.from_docdb = True
 
         quality_control = self.record.get("quality_control", {})
 
@@ -258,6 +264,31 @@ class ViewData(param.Parameterized):
         # Compute the evaluated status for each metric
         self._compute_metric_statuses()
 
+        # Index metrics for search, statuses are kept up to date by submit_change
+        self.search_index = MetricSearchIndex(self.dataframe, self.metric_status)
+
+    def search_metrics(self, query: str, limit: int | None = None) -> tuple[list, int]:
+        """Search metrics by name, description, tag values and status
+
+        Parameters
+        ----------
+        query : str
+            Free-text terms and key:value filters, e.g. "psd status:Pending"
+        limit : int, optional
+            Maximum number of rows to return, the total still counts every match
+
+        Returns
+        -------
+        tuple[list, int]
+            Metric rows from the dataframe, best match first, and the total number of matches
+        """
+        if self.search_index is None:
+            return [], 0
+        doc_ids = self.search_index.search(query)
+        # Rows are only built for the matches that are returned, previews while typing need just a few
+        rows = [self.dataframe.loc[doc_id] for doc_id in doc_ids[:limit]]
+        return rows, len(doc_ids)
+
     def _compute_metric_statuses(self):
         """Compute the evaluated status for each metric using the metric's status_history"""
         if self.dataframe.empty:
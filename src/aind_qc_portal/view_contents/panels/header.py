@@ -22,12 +22,6 @@ class Header(PyComponent):
         self.record = record
         self.settings = settings
 
-        self.settings.param.watch(self._update_status_panel, "default_grouping")
-
-    def _update_status_panel(self, event):
-        """Trigger update when default_grouping changes"""
-        self.param.trigger("status")
-
     def _init_panel_objects(self):
         """Initialize empty panel objects"""
         self.header_text = pn.pane.Markdown()
@@ -0,0 +1,122 @@
+"""Percentile contrast from a cumulative histogram, applied with a lookup table"""
+
+import numpy as np
+
+from aind_qc_portal.view_contents.panels.media.process_pool import SessionTasks, SharedArray
+
+# Integer images spanning at most this many values get one bin per value, others are binned
+MAX_EXACT_BINS = 65536
+FLOAT_BINS = 4096
+
+
+class ContrastHistogram:
+    """Cumulative histogram of an image, computed once so that contrast changes are cheap
+
+    The image is stored as bin indices (uint16). Percentiles are looked up in the cumulative counts in
+    O(bins) and rendering is a single lookup table application, np.take(lut, indices).
+    """
+
+    def __init__(self, arr: np.ndarray, bins: int = FLOAT_BINS):
+        """Bin an image
+
+        Parameters
+        ----------
+        arr : np.ndarray
+            Image of any numeric dtype
+        bins : int, optional
+            Number of bins for float images and integer images with a wider range than MAX_EXACT_BINS
+        """
+        self.shape = arr.shape
+        low, high = (arr.min(), arr.max()) if arr.size else (0, 0)
+        if np.issubdtype(arr.dtype, np.integer) and int(high) - int(low) < MAX_EXACT_BINS:
+            # Exact: one bin per value
+            self.values = np.arange(int(low), int(high) + 1, dtype=np.float64)
+            self.indices = np.subtract(arr, low, dtype=np.int64 if arr.dtype.kind == "i" else arr.dtype)
+            self.indices = self.indices.astype(np.uint16, copy=False)
+        else:
+            low, high = float(low), float(high)
+            scale = (bins - 1) / (high - low) if high > low else 0.0
+            self.values = low + np.arange(bins, dtype=np.float64) / scale if scale else np.full(bins, low)
+            self.indices = ((arr - low) * scale).round().astype(np.uint16)
+        self.counts = np.bincount(self.indices.ravel(), minlength=len(self.values))
+        self.cdf = np.cumsum(self.counts)
+
+    def percentile(self, p: float) -> float:
+        """Value at percentile p (0-100), as np.percentile(arr, p, method="lower") up to the bin width"""
+        if self.cdf[-1] == 0:
+            return float(self.values[0])
+        rank = int(np.clip(p, 0, 100) / 100 * (self.cdf[-1] - 1))
+        return float(self.values[np.searchsorted(self.cdf, rank, side="right")])
+
+    def lut(self, low_p: float, high_p: float) -> np.ndarray:
+        """Lookup table from bin index to uint8, stretching percentiles low_p..high_p to 0..255"""
+        low, high = self.percentile(low_p), self.percentile(high_p)
+        if high <= low:
+            high = low + 1e-6
+        lut = np.clip((self.values - low) / (high - low), 0, 1) * 255
+        return lut.astype(np.uint8)
+
+    def to_uint8(self, low_p: float, high_p: float, out: np.ndarray | None = None) -> np.ndarray:
+        """Render the image with percentile contrast
+
+        Parameters
+        ----------
+        low_p : float
+            Percentile (0-100) mapped to 0
+        high_p : float
+            Percentile (0-100) mapped to 255
+        out : np.ndarray, optional
+            uint8 array of the image's shape to write into
+
+        Returns
+        -------
+        np.ndarray
+        """
+        return np.take(self.lut(low_p, high_p), self.indices, out=out)
+
+
+def _project_histogram(stack: SharedArray, axis: int | None, indices: SharedArray) -> ContrastHistogram:
+    """Max project a stack and bin it, in a worker process
+
+    The bin indices are written to shared memory, the rest of the histogram is small enough to return.
+    """
+    try:
+        histogram = ContrastHistogram(stack.array if axis is None else np.max(stack.array, axis=axis))
+        indices.array[...] = histogram.indices
+        histogram.indices = None
+        return histogram
+    finally:
+        stack.detach()
+        indices.detach()
+
+
+def project_histogram(
+    stack: np.ndarray, axis: int | None, tasks: SessionTasks, background: bool = False
+) -> ContrastHistogram:
+    """Max project a stack along an axis and bin the projection in the process pool
+
+    Parameters
+    ----------
+    stack : np.ndarray
+        Images to project, or a single image when axis is None
+    axis : int | None
+        Axis to project along
+    tasks : SessionTasks
+        Queue of the session the projection is for
+    background : bool, optional
+        Whether the projection is a prefetch, see SessionTasks.submit
+
+    Returns
+    -------
+    ContrastHistogram
+
+    Raises
+    ------
+    CancelledError
+        If a newer task of the session replaced this one before it started
+    """
+    shape = stack.shape if axis is None else stack.shape[:axis] + stack.shape[axis + 1 :]
+    with SharedArray.copy_of(stack) as shared_stack, SharedArray(shape, np.uint16) as indices:
+        histogram = tasks.submit(_project_histogram, shared_stack, axis, indices, background=background).result()
+        histogram.indices = indices.array.copy()
+    return histogram
@@ -329,47 +329,6 @@ class EphysCuration(PyComponent):
         self.iframe_container.objects = [self._iframe_placeholder()]
         self._iframe_loaded = False
 
-    @classmethod
-    def bind_lazy_to_accordion(cls, accordion, tabs):
-        """Wire an accordion's active state to load/unload iframes on demand.
-
-        Why: each iframe boots a full ephys GUI app; rendering them all at once
-        can OOM the browser when an asset has many probes.
-
-        Parameters
-        ----------
-        accordion : pn.Accordion
-            The accordion whose ``active`` param will be watched.
-        tabs : list of (name, panel) tuples
-            The accordion's children, in order. Panels exposing a
-            ``curation_panel`` attribute of type ``EphysCuration`` are managed;
-            others are ignored.
-        """
-        ephys_by_index = {
-            idx: tab.curation_panel
-            for idx, (_, tab) in enumerate(tabs)
-            if isinstance(getattr(tab, "curation_panel", None), cls)
-        }
-        if not ephys_by_index:
-            return
-
-        def _on_active_change(event):
-            """Inline callback to load/unload iframes based on accordion active state changes."""
-            new_active = set(event.new or [])
-            old_active = set(event.old or [])
-            for idx in new_active - old_active:
-                if idx in ephys_by_index:
-                    ephys_by_index[idx].load_iframe()
-            for idx in old_active - new_active:
-                if idx in ephys_by_index:
-                    ephys_by_index[idx].unload_iframe()
-
-        accordion.param.watch(_on_active_change, "active")
-
-        for idx in accordion.active or []:
-            if idx in ephys_by_index:
-                ephys_by_index[idx].load_iframe()
-
     def _build_curation_options(self):
         """Build dropdown options from curation history"""
         options = {}
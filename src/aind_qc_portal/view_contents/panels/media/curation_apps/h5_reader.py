@@ -0,0 +1,224 @@
+"""Block-cached remote file for h5py, fetched with parallel ranged reads and prefetched chunk by chunk"""
+
+import io
+import itertools
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from aind_qc_portal.view_contents.panels.media.pool import get_thread_pool
+
+# Raw (compressed) bytes kept per open file
+H5_CACHE_MB = int(os.getenv("QC_PORTAL_H5_CACHE_MB", "256"))
+# Decoded chunks kept by h5py per open file
+H5_CHUNK_CACHE_MB = int(os.getenv("QC_PORTAL_H5_CHUNK_CACHE_MB", "64"))
+# Slices prefetched ahead of the one being viewed, in the direction the user is scrolling
+H5_READ_AHEAD_SLICES = int(os.getenv("QC_PORTAL_H5_READ_AHEAD_SLICES", "16"))
+H5_IO_WORKERS = 16
+# Cached blocks are aligned to this size, missing runs of blocks are fetched with one GET of at most
+# MAX_RUN_BLOCKS blocks so that large reads are split across parallel requests
+BLOCK_SIZE = 256 * 1024
+MAX_RUN_BLOCKS = 16
+
+
+def _runs(indices: list[int], max_length: int = MAX_RUN_BLOCKS) -> list[tuple[int, int]]:
+    """Group sorted block indices into [start, stop) runs of consecutive blocks"""
+    runs = []
+    for i in indices:
+        if runs and runs[-1][1] == i and runs[-1][1] - runs[-1][0] < max_length:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return [tuple(run) for run in runs]
+
+
+class RangeCacheFile(io.RawIOBase):
+    """Read-only file over an fsspec path that caches fixed-size blocks in a bounded LRU
+
+    h5py issues many small reads (B-tree nodes, then one read per chunk). Every block they touch is kept,
+    so metadata is only fetched once, and prefetch() fetches the bytes of whole chunks with parallel ranged
+    GETs before h5py asks for them. Concurrent reads of a block that is being fetched wait for that fetch.
+    """
+
+    def __init__(self, fs, path: str, block_size: int = BLOCK_SIZE, max_bytes: int = H5_CACHE_MB * 1024 * 1024):
+        """Open a path on an fsspec filesystem
+
+        Parameters
+        ----------
+        fs : fsspec.AbstractFileSystem
+            Filesystem, only size() and cat_file() are used
+        path : str
+        block_size : int, optional
+            Size of cached blocks
+        max_bytes : int, optional
+            Size of the cache, least recently used blocks are dropped above it
+        """
+        super().__init__()
+        self.fs = fs
+        self.path = path
+        self.size = fs.size(path)
+        self.block_size = block_size
+        self.max_blocks = max(1, max_bytes // block_size)
+        self._blocks: OrderedDict[int, bytes] = OrderedDict()
+        self._pending: dict[int, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._pos = 0
+
+    def readable(self) -> bool:
+        """The file can be read"""
+        return True
+
+    def seekable(self) -> bool:
+        """The file supports random access"""
+        return True
+
+    def tell(self) -> int:
+        """Current position"""
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        """Move to a position relative to the start, current position or end of the file"""
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        """Read from the current position into a buffer"""
+        n = min(len(buffer), self.size - self._pos)
+        if n <= 0:
+            return 0
+        buffer[:n] = self.read_range(self._pos, self._pos + n)
+        self._pos += n
+        return n
+
+    def clear(self):
+        """Drop the cached blocks, they are fetched again when read"""
+        with self._lock:
+            self._blocks.clear()
+
+    def close(self):
+        """Drop the cached blocks"""
+        self.clear()
+        super().close()
+
+    def read_range(self, start: int, end: int) -> bytes:
+        """Read bytes [start, end) through the cache"""
+        first, last = start // self.block_size, (end - 1) // self.block_size
+        blocks = self._get_blocks(list(range(first, last + 1)))
+        data = b"".join(blocks[i] for i in range(first, last + 1))
+        offset = start - first * self.block_size
+        return data[offset : offset + end - start]
+
+    def prefetch(self, byte_ranges: list[tuple[int, int]]):
+        """Fetch the blocks covering byte ranges that aren't cached yet, with parallel requests
+
+        Ranges beyond half of the cache are ignored so that a prefetch can't evict its own blocks.
+        """
+        indices = set()
+        for start, end in byte_ranges:
+            indices.update(range(start // self.block_size, (min(end, self.size) - 1) // self.block_size + 1))
+        self._get_blocks(sorted(indices)[: self.max_blocks // 2])
+
+    def _get_blocks(self, indices: list[int]) -> dict[int, bytes]:
+        """Get blocks from the cache, fetching the missing ones and waiting on the ones being fetched"""
+        found, missing, waiting = {}, [], []
+        with self._lock:
+            for i in indices:
+                if i in self._blocks:
+                    self._blocks.move_to_end(i)
+                    found[i] = self._blocks[i]
+                elif i in self._pending:
+                    waiting.append((i, self._pending[i]))
+                else:
+                    self._pending[i] = threading.Event()
+                    missing.append(i)
+
+        if missing:
+            try:
+                found.update(self._fetch(missing))
+            finally:
+                with self._lock:
+                    for i in missing:
+                        self._pending.pop(i).set()
+
+        for i, event in waiting:
+            event.wait()
+            with self._lock:
+                data = self._blocks.get(i)
+            # The other fetch failed, or the block was already evicted
+            found[i] = data if data is not None else self._get_blocks([i])[i]
+        return found
+
+    def _fetch(self, indices: list[int]) -> dict[int, bytes]:
+        """Fetch blocks with one ranged GET per run of consecutive blocks, in parallel, and cache them"""
+
+        def fetch_run(run: tuple[int, int]) -> bytes:
+            """Fetch the bytes of a run of blocks"""
+            start, stop = run
+            return self.fs.cat_file(
+                self.path, start=start * self.block_size, end=min(stop * self.block_size, self.size)
+            )
+
+        runs = _runs(indices)
+        if len(runs) == 1:
+            contents = [fetch_run(runs[0])]
+        else:
+            contents = list(get_thread_pool("media-h5-io", H5_IO_WORKERS).map(fetch_run, runs))
+
+        fetched = {}
+        for (start, stop), content in zip(runs, contents):
+            for i in range(start, stop):
+                fetched[i] = content[(i - start) * self.block_size : (i - start + 1) * self.block_size]
+
+        with self._lock:
+            self._blocks.update(fetched)
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+        return fetched
+
+
+def chunk_byte_ranges(dset, z_start: int, z_stop: int, yx: tuple[slice, slice] | None = None) -> list[tuple[int, int]]:
+    """Byte ranges in the file of the chunks that hold slices [z_start, z_stop) of a dataset
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        Dataset with z as its first axis
+    z_start : int
+    z_stop : int
+    yx : tuple[slice, slice], optional
+        Region of the plane, only chunks overlapping it are included. Contiguous datasets always return
+        whole planes.
+
+    Returns
+    -------
+    list[tuple[int, int]]
+        (start, end) byte offsets, empty when the layout can't be inspected
+    """
+    z_start, z_stop = max(0, z_start), min(dset.shape[0], z_stop)
+    if z_start >= z_stop:
+        return []
+    try:
+        if dset.chunks is None:
+            offset = dset.id.get_offset()
+            if offset is None:
+                return []
+            plane_bytes = math.prod(dset.shape[1:]) * dset.dtype.itemsize
+            return [(offset + z_start * plane_bytes, offset + z_stop * plane_bytes)]
+
+        ranges = []
+        chunk_z = dset.chunks[0]
+        other_axes = []
+        for axis, (size, chunk) in enumerate(zip(dset.shape[1:], dset.chunks[1:])):
+            start, stop, _ = yx[axis].indices(size) if yx and axis < len(yx) else (0, size, 1)
+            other_axes.append(range(start - start % chunk, stop, chunk))
+        for coord in itertools.product(range(z_start - z_start % chunk_z, z_stop, chunk_z), *other_axes):
+            info = dset.id.get_chunk_info_by_coord(coord)
+            # Chunks that were never written have no storage
+            if info.byte_offset is not None and info.size:
+                ranges.append((info.byte_offset, info.byte_offset + info.size))
+        return ranges
+    except Exception as e:
+        print(f"[ERROR] Failed to inspect the chunk layout of {dset.name}: {e}")
+        return []
@@ -0,0 +1,125 @@
+"""Bounded per-viewer cache of projections, filled on demand and by background prefetch"""
+
+import inspect
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Executor, Future
+from typing import Any, Callable, Hashable
+
+# Projections kept per viewer, they are at most display_size x display_size uint16
+PROJECTION_CACHE_SIZE = 16
+# Projections prefetched in the direction the user is stepping through z
+PROJECTION_PREFETCH_DEPTH = 4
+
+
+class ProjectionCache:
+    """Least recently used cache of futures, so that a projection being prefetched isn't computed twice
+
+    Unlike pn.cache on a method, entries belong to one viewer and are dropped with it. A bound method is held
+    weakly, so that neither the cache nor prefetches queued in shared pools keep the viewer alive.
+    """
+
+    def __init__(self, compute: Callable[..., Any], max_entries: int = PROJECTION_CACHE_SIZE):
+        """Create an empty cache
+
+        Parameters
+        ----------
+        compute : Callable[..., Any]
+            Called with the items of a key to compute its value
+        max_entries : int, optional
+            Number of entries kept, least recently used ones are dropped above it
+        """
+        self._compute = weakref.WeakMethod(compute) if inspect.ismethod(compute) else lambda: compute
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, Future] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def compute(self) -> Callable[..., Any]:
+        """The compute function
+
+        Raises
+        ------
+        ReferenceError
+            If it was a bound method and its object was garbage collected
+        """
+        compute = self._compute()
+        if compute is None:
+            raise ReferenceError("The object computing the cache's values was garbage collected")
+        return compute
+
+    def _run(self, key: tuple, kwargs: dict) -> Any:
+        """Compute a value in the background, looking up the compute function only once it runs"""
+        return self.compute(*key, **kwargs)
+
+    def __len__(self) -> int:
+        """Number of cached or pending entries"""
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Check if a key is cached or being computed"""
+        return key in self._entries
+
+    def _put(self, key: Hashable, future: Future):
+        """Add an entry, dropping the least recently used ones above max_entries"""
+        with self._lock:
+            self._entries[key] = future
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: tuple) -> Any:
+        """Get a value, waiting for its prefetch if one is running and computing it here otherwise"""
+        with self._lock:
+            future = self._entries.get(key)
+            if future is not None:
+                self._entries.move_to_end(key)
+        if future is not None:
+            try:
+                return future.result()
+            except CancelledError:
+                pass
+            except Exception as e:
+                # Retried here so that the error reaches the caller
+                print(f"[ERROR] Prefetch of {key} failed: {e}")
+
+        value = self.compute(*key)
+        future = Future()
+        future.set_result(value)
+        self._put(key, future)
+        return value
+
+    def prefetch(self, keys: list[tuple], executor: Executor, **kwargs) -> list[Future]:
+        """Compute values that aren't cached yet in the background
+
+        Parameters
+        ----------
+        keys : list[tuple]
+            Keys to compute
+        executor : Executor
+            Pool to compute them in
+        **kwargs
+            Passed to the compute function, e.g. to tell prefetches apart
+
+        Returns
+        -------
+        list[Future]
+            Futures of the submitted computations, cancel them when they're no longer needed
+        """
+        futures = []
+        for key in keys:
+            with self._lock:
+                if key in self._entries:
+                    continue
+            future = executor.submit(self._run, key, kwargs)
+            self._put(key, future)
+            futures.append(future)
+        return futures
+
+    def clear(self):
+        """Drop all entries, cancelling prefetches that haven't started"""
+        with self._lock:
+            for future in self._entries.values():
+                future.cancel()
+            self._entries.clear()
@@ -0,0 +1,186 @@
+"""SliceCanvas"""
+
+from typing import Callable
+
+import numpy as np
+import param
+from bokeh import palettes
+from panel.custom import JSComponent
+from PIL import Image
+
+from aind_qc_portal.view_contents.panels.media.curation_apps.contrast import ContrastHistogram
+
+COLORMAPS = {
+    "gray": palettes.Greys256,
+    "viridis": palettes.Viridis256,
+    "magma": palettes.Magma256,
+    "inferno": palettes.Inferno256,
+    "cividis": palettes.Cividis256,
+    "turbo": palettes.Turbo256,
+}
+
+
+class SliceCanvas(JSComponent):
+    """Canvas that applies percentile contrast and a colormap to a binned image in the browser
+
+    The image is sent once as a binary buffer of bin indices (see ContrastHistogram), uint8 when there are
+    at most 256 bins and uint16 otherwise. Changing the contrast or the palette only sends those values, the
+    browser redraws from the buffer it already has.
+
+    Callbacks registered with on_unload() run when the page showing the canvas is closed or navigated away from.
+    """
+
+    data = param.Bytes(default=None, doc="Bin index of each pixel, row major, little endian")
+    image_shape = param.List(default=[0, 0], doc="(height, width) of the image")
+    bins = param.Integer(default=256, doc="Number of bins, pixel values are in [0, bins)")
+    contrast = param.Range(default=(0, 99), bounds=(0, 100), doc="Percentiles stretched to the ends of the palette")
+    palette = param.List(default=list(COLORMAPS["gray"]), doc="Colors as hex strings, from low to high")
+
+    _esm = r"""
+    function toBytes(value) {
+      if (!value) return null;
+      if (value instanceof ArrayBuffer) return new Uint8Array(value);
+      if (ArrayBuffer.isView(value)) return new Uint8Array(value.buffer, value.byteOffset, value.byteLength);
+      if (typeof value === "string") return Uint8Array.from(atob(value), (c) => c.charCodeAt(0));
+      return null;
+    }
+
+    function parseColor(hex) {
+      const n = parseInt(hex.slice(1, 7), 16);
+      return [(n >> 16) & 255, (n >> 8) & 255, n & 255];
+    }
+
+    export function render({ model }) {
+      const canvas = document.createElement("canvas");
+      canvas.style.cssText = "width: 100%; height: 100%; object-fit: contain; display: block;";
+      const ctx = canvas.getContext("2d");
+      let pixels = null;
+      let cdf = null;
+      let image = null;
+      let dataChanged = true;
+      let drawRequested = false;
+
+      function load() {
+        dataChanged = false;
+        pixels = null;
+        const bytes = toBytes(model.data);
+        const [height, width] = model.image_shape;
+        if (!bytes || !width || !height) return;
+        // Copy so that the uint16 view is aligned
+        const values = model.bins > 256 ? new Uint16Array(bytes.slice().buffer) : bytes;
+        // Properties of one update can arrive in separate events, wait until they match
+        if (values.length !== width * height) return;
+        const counts = new Float64Array(model.bins);
+        for (let i = 0; i < values.length; i++) counts[values[i]]++;
+        for (let i = 1; i < counts.length; i++) counts[i] += counts[i - 1];
+        pixels = values;
+        cdf = counts;
+        canvas.width = width;
+        canvas.height = height;
+        image = ctx.createImageData(width, height);
+      }
+
+      // Same as ContrastHistogram.percentile, in bins
+      function percentile(p) {
+        const rank = Math.floor((Math.min(100, Math.max(0, p)) / 100) * (cdf[cdf.length - 1] - 1));
+        let low = 0;
+        let high = cdf.length - 1;
+        while (low < high) {
+          const mid = (low + high) >> 1;
+          if (cdf[mid] > rank) high = mid;
+          else low = mid + 1;
+        }
+        return low;
+      }
+
+      function draw() {
+        drawRequested = false;
+        if (dataChanged) load();
+        if (!pixels) {
+          ctx.clearRect(0, 0, canvas.width, canvas.height);
+          return;
+        }
+        const low = percentile(model.contrast[0]);
+        let high = percentile(model.contrast[1]);
+        if (high <= low) high = low + 1e-6;
+        const colors = model.palette.map(parseColor);
+        // Bin index to RGBA, packed for a little endian Uint32Array over the image data
+        const lut = new Uint32Array(model.bins);
+        for (let i = 0; i < lut.length; i++) {
+          const level = Math.floor(Math.min(1, Math.max(0, (i - low) / (high - low))) * 255);
+          const [r, g, b] = colors[Math.floor((level * (colors.length - 1)) / 255)];
+          lut[i] = ((255 << 24) | (b << 16) | (g << 8) | r) >>> 0;
+        }
+        const out = new Uint32Array(image.data.buffer);
+        for (let i = 0; i < pixels.length; i++) out[i] = lut[pixels[i]];
+        ctx.putImageData(image, 0, 0);
+      }
+
+      function requestDraw() {
+        if (drawRequested) return;
+        drawRequested = true;
+        requestAnimationFrame(draw);
+      }
+
+      model.on(["data", "image_shape", "bins"], () => {
+        dataChanged = true;
+        requestDraw();
+      });
+      model.on(["contrast", "palette"], requestDraw);
+      requestDraw();
+
+      // Lets the server release the image's files right away, rather than when the session expires
+      const unload = () => model.send_msg("unload");
+      window.addEventListener("pagehide", unload);
+      model.on("remove", () => window.removeEventListener("pagehide", unload));
+      return canvas;
+    }
+    """
+
+    def __init__(self, **params):
+        """Create a canvas without an image"""
+        super().__init__(**params)
+        self._unload_callbacks: list[Callable[[], None]] = []
+
+    def on_unload(self, callback: Callable[[], None]):
+        """Call a callback when the page showing the canvas is closed or navigated away from"""
+        self._unload_callbacks.append(callback)
+
+    def _handle_msg(self, msg):
+        """Run the unload callbacks when the browser reports that the page is going away"""
+        if msg != "unload":
+            return
+        for callback in self._unload_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[ERROR] Unload callback failed: {e}")
+
+    def set_image(self, histogram: ContrastHistogram):
+        """Send a binned image to the browser"""
+        bins = len(histogram.values)
+        dtype = "<u1" if bins <= 256 else "<u2"
+        self.param.update(
+            data=histogram.indices.astype(dtype, copy=False).tobytes(),
+            image_shape=list(histogram.shape),
+            bins=bins,
+        )
+
+
+def colormap_palette(colormap: str) -> list[int]:
+    """Flat RGB palette of a colormap, for PIL's Image.putpalette"""
+    return [channel for color in COLORMAPS[colormap] for channel in bytes.fromhex(color[1:7])]
+
+
+def apply_colormap(arr: np.ndarray, colormap: str) -> Image.Image:
+    """Convert a uint8 image to a PIL image with a colormap
+
+    Returns
+    -------
+    Image.Image
+        Grayscale image for "gray", palette image otherwise
+    """
+    image = Image.fromarray(arr)
+    if colormap != "gray":
+        image.putpalette(colormap_palette(colormap))
+    return image
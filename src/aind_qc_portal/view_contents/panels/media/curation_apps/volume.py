@@ -0,0 +1,330 @@
+"""Array backends for the volume viewer, H5 files and OME-Zarr/N5 stores with multiscale levels"""
+
+import math
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import h5py
+import numpy as np
+
+from aind_qc_portal.view_contents.panels.media.curation_apps.h5_reader import (
+    H5_CHUNK_CACHE_MB,
+    RangeCacheFile,
+    chunk_byte_ranges,
+)
+
+ZARR_EXTENSIONS = (".zarr", ".n5")
+# H5 files kept open per server process, the least recently read ones are closed above it and reopened when
+# they are read again
+MAX_OPEN_H5_FILES = int(os.getenv("QC_PORTAL_MAX_OPEN_H5_FILES", "16"))
+
+
+def is_zarr_url(url: str) -> bool:
+    """Check if a path or URL points to a Zarr or N5 store"""
+    return url.rstrip("/").lower().endswith(ZARR_EXTENSIONS)
+
+
+class Volume:
+    """A (z, y, x) array at one or more resolutions, level 0 is full resolution and each next level is coarser
+
+    Levels can be any arrays that support numpy slicing (numpy, h5py, zarr). Arrays with more than three
+    dimensions are read at index 0 of the leading ones, e.g. the first time point and channel of OME-Zarr.
+    """
+
+    # Whether prefetch() fetches anything, the viewer skips read-ahead otherwise
+    can_prefetch = False
+
+    def __init__(self, levels: list, name: str = "Volume"):
+        """Wrap arrays, from finest to coarsest
+
+        Parameters
+        ----------
+        levels : list
+            Arrays with at least three dimensions, the last three are (z, y, x)
+        name : str, optional
+            Display name
+        """
+        if not levels:
+            raise ValueError(f"{name} has no arrays")
+        self.levels = levels
+        self.name = name
+        self._prefixes = [(0,) * (len(level.shape) - 3) for level in levels]
+        # Kept so that they are known while the backend's files are closed
+        self._shapes = [tuple(level.shape[-3:]) for level in levels]
+        self._dtype = np.dtype(levels[0].dtype)
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        """Shape of the full resolution level"""
+        return self.level_shape(0)
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Data type of the volume"""
+        return self._dtype
+
+    def level_shape(self, level: int) -> tuple[int, int, int]:
+        """(z, y, x) shape of a level"""
+        return self._shapes[level]
+
+    def read(self, selection: tuple[slice, slice, slice], level: int = 0) -> np.ndarray:
+        """Read a (z, y, x) selection of a level"""
+        return np.asarray(self.levels[level][self._prefixes[level] + tuple(selection)])
+
+    def prefetch(self, selection: tuple[slice, slice, slice], level: int = 0):
+        """Fetch the data of a selection ahead of reading it, when the backend supports it"""
+
+    def release(self) -> bool:
+        """Close the backend's files and drop cached data, they are reopened by the next read
+
+        Returns
+        -------
+        bool
+            False if a read is in progress and nothing was released
+        """
+        return True
+
+    def close(self):
+        """Release the backend's files for good"""
+
+
+class _OpenFiles:
+    """Process-wide least recently used set of open H5Volumes, the ones read least recently are released above
+    max_open. Volumes are held weakly, a volume that is garbage collected leaves the set."""
+
+    def __init__(self, max_open: int = MAX_OPEN_H5_FILES):
+        """Create an empty set"""
+        self.max_open = max(1, max_open)
+        self._volumes: OrderedDict[int, weakref.ref] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of open volumes"""
+        with self._lock:
+            return len(self._volumes)
+
+    def touch(self, volume: "H5Volume"):
+        """Mark a volume as just read, releasing the least recently read volumes that aren't being read above
+        max_open"""
+        with self._lock:
+            self._volumes[id(volume)] = weakref.ref(volume)
+            self._volumes.move_to_end(id(volume))
+            for key, ref in list(self._volumes.items()):
+                if len(self._volumes) <= self.max_open:
+                    break
+                other = ref()
+                if other is None:
+                    del self._volumes[key]
+                elif other is not volume and other._release():
+                    print(f"[INFO] Closed {other.name}, more than {self.max_open} H5 files are open")
+                    del self._volumes[key]
+
+    def discard(self, volume: "H5Volume"):
+        """Forget a volume that was released"""
+        with self._lock:
+            self._volumes.pop(id(volume), None)
+
+
+_open_files = _OpenFiles()
+
+
+class H5Volume(Volume):
+    """Single-resolution volume from a dataset of an H5 file
+
+    Files opened through a RangeCacheFile fetch the chunks intersecting each read with parallel requests.
+    At most MAX_OPEN_H5_FILES are open per process, a file that was released is reopened by the next read.
+    """
+
+    def __init__(self, file_path_or_object, dataset: str = "data", name: str = "H5 Data"):
+        """Open an H5 file
+
+        Parameters
+        ----------
+        file_path_or_object
+            Path or file-like object
+        dataset : str, optional
+            Location of the volume within the file
+        name : str, optional
+            Display name
+        """
+        self.file_obj = file_path_or_object
+        self.dataset = dataset
+        self._h5file = None
+        self._readers = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._prefetch = getattr(self.file_obj, "prefetch", None)
+        self.can_prefetch = self._prefetch is not None
+        self._open()
+        super().__init__(self.levels, name=name)
+        _open_files.touch(self)
+
+    def _open(self):
+        """Open the H5 file. Call with the lock held."""
+        # Room for decoded chunks of a few neighbouring slices
+        self._h5file = h5py.File(self.file_obj, "r", rdcc_nbytes=H5_CHUNK_CACHE_MB * 1024 * 1024, rdcc_nslots=10007)
+        self.levels = [self._h5file[self.dataset]]
+
+    @contextmanager
+    def _reading(self):
+        """Keep the file open while reading, reopening it if it was released"""
+        with self._lock:
+            if self._closed:
+                raise ValueError(f"{self.name} is closed")
+            if self._h5file is None:
+                self._open()
+            self._readers += 1
+        try:
+            _open_files.touch(self)
+            yield
+        finally:
+            with self._lock:
+                self._readers -= 1
+                closing = self._closed and not self._readers
+            if closing:
+                # close() was called during the read
+                self.release()
+
+    def read(self, selection: tuple[slice, slice, slice], level: int = 0) -> np.ndarray:
+        """Read a (z, y, x) selection, fetching the chunks it intersects first"""
+        with self._reading():
+            self._fetch(selection, level)
+            return self.levels[level][tuple(selection)]
+
+    def prefetch(self, selection: tuple[slice, slice, slice], level: int = 0):
+        """Fetch the chunks intersecting a selection into the file's cache"""
+        if self._prefetch:
+            with self._reading():
+                self._fetch(selection, level)
+
+    def _fetch(self, selection: tuple[slice, slice, slice], level: int):
+        """Fetch the chunks intersecting a selection, with the file open"""
+        if self._prefetch:
+            z_start, z_end, _ = selection[0].indices(self.shape[0])
+            self._prefetch(chunk_byte_ranges(self.levels[level], z_start, z_end, tuple(selection[1:])))
+
+    def _release(self) -> bool:
+        """Close the H5 file and drop the cached blocks of the file object, unless a read is in progress"""
+        with self._lock:
+            if self._readers:
+                return False
+            if self._h5file is not None:
+                self._h5file.close()
+                self._h5file = None
+            clear = getattr(self.file_obj, "clear", None)
+            if clear:
+                clear()
+            return True
+
+    def release(self) -> bool:
+        """Close the H5 file and drop cached data, the next read reopens it"""
+        released = self._release()
+        if released:
+            _open_files.discard(self)
+        return released
+
+    def close(self):
+        """Close the H5 file, and the file object when it is a file object"""
+        with self._lock:
+            self._closed = True
+        self.release()
+        if hasattr(self.file_obj, "close"):
+            self.file_obj.close()
+
+
+def _multiscale_paths(group) -> list[str]:
+    """Paths of the arrays of a multiscale group, from finest to coarsest
+
+    OME-Zarr lists them in its multiscales metadata (under "ome" since 0.5), N5 pyramids written by
+    BigStitcher and n5-spark name them s0, s1, ...
+    """
+    attrs = dict(group.attrs)
+    multiscales = attrs.get("ome", {}).get("multiscales") or attrs.get("multiscales")
+    if multiscales:
+        return [dataset["path"] for dataset in multiscales[0]["datasets"]]
+
+    keys = list(group.array_keys())
+    scales = sorted((key for key in keys if re.fullmatch(r"s\d+", key)), key=lambda key: int(key[1:]))
+    if scales:
+        return scales
+    for key in ("data", "0"):
+        if key in keys:
+            return [key]
+    raise ValueError(f"No multiscale metadata or arrays found in {group}")
+
+
+class ZarrVolume(Volume):
+    """Multiscale volume from an OME-Zarr or N5 store, read with the store's native chunking"""
+
+    def __init__(self, url: str, storage_options: dict | None = None, name: str | None = None):
+        """Open a store, zarr is only imported when a store is opened
+
+        Parameters
+        ----------
+        url : str
+            Path or URL (e.g. s3://bucket/key.ome.zarr) of the store, or of one array in it
+        storage_options : dict, optional
+            Passed to fsspec, defaults to signed S3 requests
+        name : str, optional
+            Display name, defaults to the store's name
+        """
+        try:
+            import zarr
+        except ImportError as e:
+            raise ImportError("Viewing Zarr and N5 volumes requires the zarr package") from e
+
+        storage_options = storage_options if storage_options is not None else {"anon": False}
+        if url.rstrip("/").lower().endswith(".n5"):
+            if not hasattr(zarr, "n5"):
+                raise ImportError("Viewing N5 volumes requires zarr<3")
+            node = zarr.open(zarr.n5.N5FSStore(url, **storage_options), mode="r")
+        else:
+            node = zarr.open(url, mode="r", storage_options=storage_options if "://" in url else None)
+
+        if isinstance(node, zarr.Array):
+            levels = [node]
+        else:
+            levels = [node[path] for path in _multiscale_paths(node)]
+        super().__init__(levels, name=name or url.rstrip("/").split("/")[-1])
+
+
+def pick_level(volume: Volume, axes: tuple[int, int], zoom: int, display_size: int) -> int:
+    """Coarsest level that still has at least display_size pixels across the zoomed region
+
+    Parameters
+    ----------
+    volume : Volume
+    axes : tuple[int, int]
+        (z, y, x) axes of the image
+    zoom : int
+        Magnification, the region covers 1 / zoom of each axis
+    display_size : int
+        Largest side of the rendered image
+
+    Returns
+    -------
+    int
+        Level to read, 0 when no coarser level is large enough
+    """
+    for level in reversed(range(len(volume.levels))):
+        shape = volume.level_shape(level)
+        if max(math.ceil(shape[axis] / zoom) for axis in axes) >= display_size:
+            return level
+    return 0
+
+
+def open_volume(url: str) -> Volume:
+    """Open a Zarr/N5 store or an H5 file from S3 or a local path"""
+    if is_zarr_url(url):
+        return ZarrVolume(url)
+
+    import fsspec
+
+    name = url.split("/")[-1]
+    if url.startswith("s3://"):
+        return H5Volume(RangeCacheFile(fsspec.filesystem("s3", anon=False), url), name=name)
+    return H5Volume(url, name=name)
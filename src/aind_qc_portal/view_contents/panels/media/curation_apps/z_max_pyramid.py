@@ -0,0 +1,152 @@
+"""Block-wise max pyramid over the z axis of a volume, for fast max projections over any z window"""
+
+import math
+import os
+import threading
+from typing import Callable
+
+import numpy as np
+
+# Memory budget of a pyramid, the smallest block size that fits is used
+Z_PYRAMID_MAX_MB = int(os.getenv("QC_PORTAL_Z_PYRAMID_MAX_MB", "512"))
+# Smallest block size, windows are answered by at most 2 * (block - 1) raw slices plus O(log n) planes
+Z_PYRAMID_MIN_BLOCK = 8
+FULL_PLANE = (slice(None), slice(None))
+
+
+class ZMaxPyramid:
+    """Max projections over z windows from precomputed block maxima
+
+    Level k holds the max over each aligned block of 2**k slices (the last block may be shorter). A window
+    [start, stop) is split into the largest aligned blocks that fit, plus raw slices at its edges that
+    aren't covered by a block of the smallest level. The lowest level is chosen so that all levels fit in
+    `max_bytes`, the pyramid is disabled when even a single block level over half the volume doesn't fit.
+    """
+
+    def __init__(
+        self,
+        read: Callable[[int, int], np.ndarray],
+        shape: tuple,
+        dtype,
+        min_block: int = Z_PYRAMID_MIN_BLOCK,
+        max_bytes: int = Z_PYRAMID_MAX_MB * 1024 * 1024,
+    ):
+        """Plan the pyramid, call build() to compute it
+
+        Parameters
+        ----------
+        read : Callable[[int, int, tuple[slice, slice]], np.ndarray]
+            Read slices [start, stop) of the volume restricted to a (y, x) region, shape (stop - start, y, x)
+        shape : tuple
+            Shape of the volume (z, y, x)
+        dtype
+            Data type of the volume
+        min_block : int, optional
+            Smallest block size, rounded up to a power of two
+        max_bytes : int, optional
+            Memory budget for all levels
+        """
+        self.read = read
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.levels: list[np.ndarray] = []
+        self._ready = threading.Event()
+        self._cancelled = False
+
+        n = self.shape[0]
+        plane_bytes = math.prod(self.shape[1:]) * self.dtype.itemsize
+        self.min_level = None
+        level = max(1, math.ceil(math.log2(max(min_block, 2))))
+        while 2**level <= n // 2:
+            planes = sum(math.ceil(n / 2**k) for k in range(level, math.ceil(math.log2(n)) + 1))
+            if planes * plane_bytes <= max_bytes:
+                self.min_level = level
+                break
+            level += 1
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the volume is large enough, and the pyramid small enough, for it to be built"""
+        return self.min_level is not None
+
+    @property
+    def ready(self) -> bool:
+        """Whether build() has finished"""
+        return self._ready.is_set()
+
+    @property
+    def block(self) -> int:
+        """Number of slices in the blocks of the lowest level"""
+        return 2**self.min_level
+
+    def cancel(self):
+        """Stop a running build()"""
+        self._cancelled = True
+
+    def build(self):
+        """Read the whole volume once, block by block, and compute every level"""
+        if not self.enabled or self.ready:
+            return
+
+        n = self.shape[0]
+        lowest = np.empty((math.ceil(n / self.block),) + self.shape[1:], dtype=self.dtype)
+        for i, start in enumerate(range(0, n, self.block)):
+            if self._cancelled:
+                return
+            np.max(self.read(start, min(start + self.block, n), FULL_PLANE), axis=0, out=lowest[i])
+
+        levels = [lowest]
+        while len(levels[-1]) > 1:
+            previous = levels[-1]
+            level = previous[::2].copy()
+            np.maximum(level[: len(previous) // 2], previous[1::2], out=level[: len(previous) // 2])
+            levels.append(level)
+
+        self.levels = levels
+        self._ready.set()
+
+    def project(self, start: int, stop: int, yx: tuple[slice, slice] = FULL_PLANE) -> np.ndarray:
+        """Max projection over slices [start, stop)
+
+        Parameters
+        ----------
+        start : int
+        stop : int
+        yx : tuple[slice, slice], optional
+            Region of the plane to project, slices can have a step to downsample it
+
+        Returns
+        -------
+        np.ndarray
+            Projection with the volume's dtype, shape of the region
+        """
+        n = self.shape[0]
+        start, stop = max(0, start), min(n, stop)
+        if not self.ready:
+            return np.max(self.read(start, stop, yx), axis=0)
+
+        block = self.block
+        # Blocks can end at the end of the volume even when it isn't a multiple of the block size
+        first = -(-start // block) * block
+        last = stop if stop == n else (stop // block) * block
+        if first >= last:
+            return np.max(self.read(start, stop, yx), axis=0)
+
+        result = None
+        for raw_start, raw_stop in ((start, first), (last, stop)):
+            if raw_start < raw_stop:
+                plane = np.max(self.read(raw_start, raw_stop, yx), axis=0)
+                result = plane if result is None else np.maximum(result, plane, out=result)
+
+        i = first
+        while i < last:
+            k = self.min_level
+            while (
+                k - self.min_level + 1 < len(self.levels) and i % 2 ** (k + 1) == 0 and min(i + 2 ** (k + 1), n) <= last
+            ):
+                k += 1
+            plane = self.levels[k - self.min_level][i >> k][yx]
+            result = plane.copy() if result is None else np.maximum(result, plane, out=result)
+            i = min(i + 2**k, n)
+
+        return result
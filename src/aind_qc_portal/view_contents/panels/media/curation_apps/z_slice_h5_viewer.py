@@ -1,43 +1,97 @@
 """ZSliceH5Viewer"""
 
+import math
+import os
+import weakref
+from concurrent.futures import CancelledError, Future
 from pathlib import Path
 
-import h5py
 import numpy as np
 import panel as pn
 import param
 from panel.custom import PyComponent
-from PIL import Image
+
+from aind_qc_portal.view_contents.panels.media.curation_apps.contrast import ContrastHistogram, project_histogram
+from aind_qc_portal.view_contents.panels.media.curation_apps.h5_reader import H5_READ_AHEAD_SLICES
+from aind_qc_portal.view_contents.panels.media.curation_apps.projection_cache import (
+    PROJECTION_PREFETCH_DEPTH,
+    ProjectionCache,
+)
+from aind_qc_portal.view_contents.panels.media.curation_apps.slice_canvas import (
+    COLORMAPS,
+    SliceCanvas,
+    colormap_palette,
+)
+from aind_qc_portal.view_contents.panels.media.curation_apps.volume import H5Volume, Volume, pick_level
+from aind_qc_portal.view_contents.panels.media.curation_apps.z_max_pyramid import ZMaxPyramid
+from aind_qc_portal.view_contents.panels.media.pool import call_on_document, current_document, get_thread_pool
+from aind_qc_portal.view_contents.panels.media.process_pool import SharedArray, encode_png, get_session_tasks
+
+# Default largest side of the rendered image, in pixels
+DISPLAY_SIZE = 1024
+# Axis (of z, y, x) normal to each view, the other two are the image's vertical and horizontal axes
+VIEW_AXES = {"XY": 0, "XZ": 1, "YZ": 2}
+AXIS_NAMES = ("z", "y", "x")
+# Whether viewers apply contrast and the colormap in the browser by default, "0" sends a PNG for every change
+H5_RENDER_IN_BROWSER = os.getenv("QC_PORTAL_H5_RENDER_IN_BROWSER", "1") == "1"
 
 
 class ZSliceH5Viewer(PyComponent):
     """Panel component to visualize z-slices of 3d data stored in an H5 file with max projection.
 
+    Orthogonal XZ and YZ sections, with a max projection over a y or x window, are read from the chunks
+    that intersect the section only. Volumes with several resolution levels (OME-Zarr, N5) are read from the
+    coarsest level that still fills the display, full resolution is only read when zoomed in.
+
     Args:
-        file_path_or_object: Either a string path to the H5 file or a file-like object (e.g., from fsspec).
+        file_path_or_object: A Volume (see volume.py), or a string path to an H5 file or a file-like object
+            (e.g., from fsspec) with the volume in its "data" dataset.
         filename (str, optional): Display name for the file. If not provided, will try to extract from
             file_path_or_object.
 
     Attributes:
+        view (str): Plane shown, "XY", "XZ" or "YZ".
         z (int): Current z slice index (center of max projection).
-        window (int): Half-window size for max projection.
+        y, x (int): Current y and x section indices, for the XZ and YZ views.
+        window (int): Half-window size for max projection, along the axis normal to the view.
+        zoom (int): Magnification of the region shown, 1 shows the whole plane.
+        center_y, center_x (float): Vertical and horizontal center of the region shown, as fractions of the
+            plane.
+        display_size (int): Largest side of the rendered image, planes are downsampled with strided reads
+            to fit it and full resolution is only read once zoomed in far enough.
+        colormap (str): Colormap applied after contrast.
+        render_in_browser (bool): Send each projection once as a binary buffer and apply contrast and the
+            colormap in the browser, instead of sending a PNG for every change. Set when the viewer is
+            created, defaults to QC_PORTAL_H5_RENDER_IN_BROWSER.
     """
 
     # Param state
+    view = param.Selector(default="XY", objects=list(VIEW_AXES))
     z = param.Integer(default=0, bounds=(0, 0))  # bounds fixed in __init__
+    y = param.Integer(default=0, bounds=(0, 0))  # bounds fixed in __init__
+    x = param.Integer(default=0, bounds=(0, 0))  # bounds fixed in __init__
     window = param.Integer(default=0, bounds=(0, 0))  # bounds fixed in __init__
     contrast = param.Range(default=(0, 99), bounds=(0, 100), step=1)
-
-    def __init__(self, file_path_or_object, filename=None):
+    zoom = param.Selector(default=1, objects=[1, 2, 4, 8, 16, 32])
+    center_y = param.Number(default=0.5, bounds=(0, 1), step=0.01)
+    center_x = param.Number(default=0.5, bounds=(0, 1), step=0.01)
+    display_size = param.Integer(default=DISPLAY_SIZE, bounds=(64, None))
+    colormap = param.Selector(default="gray", objects=list(COLORMAPS))
+    render_in_browser = param.Boolean(default=True, constant=True)
+
+    def __init__(self, file_path_or_object, filename=None, **params):
         """Initialize ZSliceH5Viewer with file path or object"""
-        super().__init__()
+        params.setdefault("render_in_browser", H5_RENDER_IN_BROWSER)
+        super().__init__(**params)
 
         self.file_obj = file_path_or_object
-        self.dataset = "data"  # location within the H5 file
 
-        # Open H5 file once and keep it open
-        self._h5file = h5py.File(self.file_obj, "r")
-        self._h5dset = self._h5file[self.dataset]
+        # Open the volume once and keep it open
+        if isinstance(file_path_or_object, Volume):
+            self.volume = file_path_or_object
+        else:
+            self.volume = H5Volume(file_path_or_object, dataset="data")
+        self._read_ahead_future = None
 
         # Determine filename for display
         if filename:
@@ -45,55 +99,208 @@ class ZSliceH5Viewer(PyComponent):
         elif isinstance(file_path_or_object, str):
             self.filename = Path(file_path_or_object).name
         else:
-            self.filename = "H5 Data"
+            self.filename = self.volume.name
 
-        self.shape = self._h5dset.shape  # (z, y, x)
+        self.shape = self.volume.shape  # (z, y, x)
 
         self.param.z.bounds = (0, self.shape[0] - 1)
+        self.param.y.bounds = (0, self.shape[1] - 1)
+        self.param.x.bounds = (0, self.shape[2] - 1)
         self.param.window.bounds = (0, self.shape[0] // 2)
         self.z = 0
+        self.y = self.shape[1] // 2
+        self.x = self.shape[2] // 2
         self.window = 0
 
-        self.image = pn.pane.Image(sizing_mode="stretch_both")
+        # Built in the background the first time a max projection window is used
+        self._z_pyramid = ZMaxPyramid(self._read_z, self.shape, self.volume.dtype)
+        self._z_pyramid_future = None
+        # Projections for this viewer only, the next few in the direction of travel are computed in the background
+        self._projections = ProjectionCache(self._compute_projection)
+        self._projection_prefetches = []
+        # Projections and PNGs are computed in the process pool, within the session's share of it
+        self._cpu_tasks = get_session_tasks(current_document())
+        self._render_future = None
 
-        self.z_controls = self._build_z_slider_controls()
+        self.image = pn.pane.Image(sizing_mode="stretch_both")
+        self.canvas = SliceCanvas(sizing_mode="stretch_both", min_height=400)
+        # The page may come back from the browser's back/forward cache, files are reopened if it does
+        self.canvas.on_unload(self.release)
+        self._closed = False
+        self._close_with_session(current_document())
+
+        self.view_buttons = pn.widgets.RadioButtonGroup.from_param(self.param.view, name="View")
+        self.z_controls = self._build_slice_controls("z")
+        self.y_controls = self._build_slice_controls("y", visible=False)
+        self.x_controls = self._build_slice_controls("x", visible=False)
         self.window_controls = self._build_max_projection_window_controls()
         self.contrast_controls = self._build_contrast_controls()
-
-        self.param.watch(self.image_view, ["z", "window", "contrast"])
+        self.zoom_controls = self._build_zoom_controls()
+
+        self.param.watch(self._update_view_controls, "view")
+        self.param.watch(self._start_z_pyramid, ["window", "view"])
+        self.param.watch(self._read_ahead, "z")
+        self.param.watch(
+            self.image_view,
+            ["view", "z", "y", "x", "window", "contrast", "colormap", "zoom", "center_y", "center_x", "display_size"],
+        )
+        self.param.watch(self._prefetch_projections, ["z", "y", "x"])
         self.image_view()
 
     def __del__(self):
-        """Close the H5 file when the object is destroyed."""
-        if hasattr(self, "_h5file") and self._h5file:
-            self._h5file.close()
+        """Close the volume when the object is destroyed, if close() wasn't called."""
+        if hasattr(self, "_closed"):
+            self.close()
+
+    def _close_with_session(self, doc):
+        """Close the viewer when its session is destroyed, without the session keeping it alive."""
+        if doc is None:
+            return
+        ref = weakref.ref(self)
+
+        def close(session_context):
+            """Close the viewer of a destroyed session"""
+            viewer = ref()
+            if viewer is not None:
+                viewer.close()
+
+        doc.on_session_destroyed(close)
+
+    def release(self):
+        """Stop background work and drop cached projections, the z max pyramid and the volume's open files.
+        They are recomputed and reopened when the viewer is used again."""
+        for future in [self._read_ahead_future, self._z_pyramid_future, self._render_future]:
+            if future is not None:
+                future.cancel()
+        for future in self._projection_prefetches:
+            future.cancel()
+        self._projection_prefetches = []
+        self._projections.clear()
+        self._z_pyramid.cancel()
+        self._z_pyramid = ZMaxPyramid(self._read_z, self.shape, self.volume.dtype)
+        self._z_pyramid_future = None
+        self.volume.release()
+
+    def close(self):
+        """Release everything release() does and close the volume for good. Called when the session is
+        destroyed, safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+        self.release()
+        self.volume.close()
+
+    def _read(self, selection: tuple[slice, slice, slice], level: int = 0) -> np.ndarray:
+        """Read a (z, y, x) selection of a level of the volume"""
+        return self.volume.read(selection, level)
+
+    def _read_z(self, z_start: int, z_end: int, yx: tuple[slice, slice]) -> np.ndarray:
+        """Read a region of full resolution slices z_start:z_end"""
+        return self._read((slice(z_start, z_end),) + yx)
+
+    def _to_level(self, index: int, level: int, axis: int, round_up: bool = False) -> int:
+        """Convert a full resolution index along an axis to a level's index"""
+        scaled = index * self.volume.level_shape(level)[axis]
+        return -(-scaled // self.shape[axis]) if round_up else scaled // self.shape[axis]
+
+    @property
+    def _axis(self) -> int:
+        """Axis normal to the current view"""
+        return VIEW_AXES[self.view]
+
+    @property
+    def _position(self) -> int:
+        """Index of the current slice or section along the axis normal to the view"""
+        return getattr(self, AXIS_NAMES[self._axis])
+
+    def _region(self) -> tuple[int, int, int, int, int, int]:
+        """Level and region of the plane to render for the current view, zoom and center, and the stride that
+        fits it in display_size
 
-    def _build_z_slider_controls(self) -> pn.Row:
-        """Create slider and buttons to select z slice.
         Returns:
-            pn.Row: Panel row containing the z slice controls. Links to the class's 'z' param.
+            tuple: Level, (start, stop) of the vertical axis, (start, stop) of the horizontal axis in the level's
+                coordinates, and the stride
+        """
+        axes = tuple(axis for axis in range(3) if axis != self._axis)
+        level = pick_level(self.volume, axes, self.zoom, self.display_size)
+        sizes = [self.volume.level_shape(level)[axis] for axis in axes]
+        bounds = []
+        for size, center in zip(sizes, (self.center_y, self.center_x)):
+            length = max(1, math.ceil(size / self.zoom))
+            start = min(max(0, round(center * size - length / 2)), size - length)
+            bounds += [start, start + length]
+        stride = max(1, math.ceil(max(bounds[1] - bounds[0], bounds[3] - bounds[2]) / self.display_size))
+        return (level, *bounds, stride)
+
+    def _read_ahead(self, event):
+        """Prefetch the chunks of the slices past the current window in the direction the user is scrolling"""
+        if not self.volume.can_prefetch or event.new == event.old or self.view != "XY":
+            return
+        if self._read_ahead_future is not None and not self._read_ahead_future.done():
+            return
+        if event.new > event.old:
+            z_start = event.new + self.window + 1
+            z_end = z_start + H5_READ_AHEAD_SLICES
+        else:
+            z_end = event.new - self.window
+            z_start = z_end - H5_READ_AHEAD_SLICES
+        level, y_start, y_stop, x_start, x_stop, _ = self._region()
+        z_start, z_end = self._to_level(max(0, z_start), level, 0), self._to_level(max(0, z_end), level, 0)
+        selection = (slice(z_start, z_end), slice(y_start, y_stop), slice(x_start, x_stop))
+        self._read_ahead_future = get_thread_pool("media-prefetch").submit(self._prefetch_slices, selection, level)
+
+    def _prefetch_slices(self, selection: tuple[slice, slice, slice], level: int):
+        """Fetch the chunks of a (z, y, x) selection of a level into the volume's cache"""
+        try:
+            self.volume.prefetch(selection, level)
+        except Exception as e:
+            print(f"[ERROR] Failed to prefetch {selection} of {self.filename}: {e}")
+
+    def _start_z_pyramid(self, *events):
+        """Start building the z max pyramid in the background when an XY projection window is first used"""
+        # Multiscale volumes project coarse levels instead, which read fewer slices
+        if len(self.volume.levels) > 1 or self.window == 0 or self.view != "XY":
+            return
+        if self._z_pyramid_future is None and self._z_pyramid.enabled:
+            self._z_pyramid_future = get_thread_pool("media-volume", 2).submit(self._z_pyramid.build)
+
+    def _update_view_controls(self, event):
+        """Show the slider of the axis normal to the new view and fit the window to that axis"""
+        for name in AXIS_NAMES:
+            getattr(self, f"{name}_controls").visible = name == AXIS_NAMES[self._axis]
+        self.window_slider.name = f"Max projection half-window ({AXIS_NAMES[self._axis]}±window)"
+        self.param.window.bounds = (0, self.shape[self._axis] // 2)
+        self.window = min(self.window, self.shape[self._axis] // 2)
+
+    def _build_slice_controls(self, name: str, visible: bool = True) -> pn.Row:
+        """Create slider and buttons to select the slice along an axis.
+        Args:
+            name (str): Axis param, 'z', 'y' or 'x'.
+            visible (bool, optional): Whether the controls are shown initially.
+        Returns:
+            pn.Row: Panel row containing the slice controls. Links to the class's param for the axis.
         """
 
-        # Create slider linked to z param
-        self.z_slider = pn.widgets.IntSlider.from_param(self.param.z, width=300, name="Z Slice")
+        # Create slider linked to the axis param
+        slider = pn.widgets.IntSlider.from_param(self.param[name], width=300, name=f"{name.upper()} Slice")
+        setattr(self, f"{name}_slider", slider)
 
         # Create increment buttons
         btn_minus = pn.widgets.Button(name="-", width=40)
         btn_plus = pn.widgets.Button(name="+", width=40)
 
-        def dec_z(event):
-            """Decrement z slice"""
-            self.z = max(self.param.z.bounds[0], self.z - 1)
+        def decrement(event):
+            """Decrement slice"""
+            setattr(self, name, max(self.param[name].bounds[0], getattr(self, name) - 1))
 
-        def inc_z(event):
-            """Increment z slice"""
-            self.z = min(self.param.z.bounds[1], self.z + 1)
+        def increment(event):
+            """Increment slice"""
+            setattr(self, name, min(self.param[name].bounds[1], getattr(self, name) + 1))
 
-        btn_minus.on_click(dec_z)
-        btn_plus.on_click(inc_z)
+        btn_minus.on_click(decrement)
+        btn_plus.on_click(increment)
 
-        z_controls = pn.Row(btn_minus, self.z_slider, btn_plus, align="center")
-        return z_controls
+        return pn.Row(btn_minus, slider, btn_plus, align="center", visible=visible)
 
     def _build_max_projection_window_controls(self) -> pn.Row:
         """Create slider to select max projection half-window size. Links to the class's 'window' param.
@@ -120,76 +327,178 @@ class ZSliceH5Viewer(PyComponent):
             width=300,
             name="Percentile contrast",
         )
-        return pn.Row(self.contrast_slider, align="center")
+        self.colormap_select = pn.widgets.Select.from_param(self.param.colormap, width=120, name="Colormap")
+        return pn.Row(self.contrast_slider, self.colormap_select, align="center")
+
+    def _build_zoom_controls(self) -> pn.Column:
+        """Create zoom buttons and sliders to pan the region shown.
+        Returns:
+            pn.Column: Panel column containing the zoom and pan controls.
+        """
+        self.zoom_buttons = pn.widgets.RadioButtonGroup.from_param(self.param.zoom, name="Zoom")
+        self.pan_y_slider = pn.widgets.FloatSlider.from_param(self.param.center_y, width=300, name="Pan vertical")
+        self.pan_x_slider = pn.widgets.FloatSlider.from_param(self.param.center_x, width=300, name="Pan horizontal")
+        self.scale_text = pn.widgets.StaticText(name="Resolution", value="")
+        return pn.Column(
+            pn.Row(self.zoom_buttons, self.scale_text, align="center"),
+            pn.Row(self.pan_y_slider, self.pan_x_slider, align="center"),
+        )
+
+    def _prefetch_projections(self, event):
+        """Compute the next projections in the direction the user is stepping through the view's normal axis
+        in the background"""
+        for future in self._projection_prefetches:
+            future.cancel()
+        if event.new == event.old or event.name != AXIS_NAMES[self._axis]:
+            return
+        step = 1 if event.new > event.old else -1
+        region = self._region()
+        keys = []
+        for i in range(1, PROJECTION_PREFETCH_DEPTH + 1):
+            position = event.new + step * i
+            if 0 <= position < self.shape[self._axis]:
+                keys.append((self.view, position, self.window, region))
+        self._projection_prefetches = self._projections.prefetch(
+            keys, get_thread_pool("media-prefetch"), background=True
+        )
 
-    @pn.cache()
-    def _get_cached_slice(self, z: int, w: int):
+    def _compute_projection(
+        self,
+        view: str,
+        position: int,
+        w: int,
+        region: tuple[int, int, int, int, int, int],
+        background: bool = False,
+    ) -> ContrastHistogram:
         """
-        Load and cache max projection data over z-w:z+w.
-        Uses pn.cache() to avoid recomputing identical slices.
+        Load max projection data over position-w:position+w along the axis normal to a view, with its
+        histogram for contrast. Results are kept in the viewer's ProjectionCache. Data is read here and
+        projected and binned in the process pool.
 
         Args:
-            z (int): Center z-slice index for the max projection.
-            w (int): Half-window size; number of slices to include on each side of z.
+            view (str): "XY", "XZ" or "YZ".
+            position (int): Center index of the max projection along the axis normal to the view, at full
+                resolution.
+            w (int): Half-window size; number of full resolution slices to include on each side of position.
+            region (tuple): Level, (start, stop) of the image's vertical and horizontal axes and the stride,
+                from _region().
+            background (bool, optional): Whether this is a prefetch, which never replaces a render in the
+                session's process pool queue.
+
+        Returns:
+            ContrastHistogram: Max projection, binned in its native dtype.
+        """
+        axis = VIEW_AXES[view]
+        level, v_start, v_stop, h_start, h_stop, stride = region
+        # Slices of the level covering the full resolution window
+        start = self._to_level(max(0, position - w), level, axis)
+        end = max(start + 1, self._to_level(min(self.shape[axis], position + w + 1), level, axis, round_up=True))
+        plane = (slice(v_start, v_stop, stride), slice(h_start, h_stop, stride))
+
+        if view == "XY" and level == 0:
+            # Combines precomputed block maxima once the pyramid is built, reads the slices until then
+            return project_histogram(self._z_pyramid.project(start, end, plane), None, self._cpu_tasks, background)
+        # Only the chunks intersecting the section window are read
+        selection = list(plane)
+        selection.insert(axis, slice(start, end))
+        return project_histogram(self._read(tuple(selection), level), axis, self._cpu_tasks, background)
+
+    def _projection_key(self) -> tuple:
+        """
+        Key of the max projection for the current view, position and window, for the current region
+        downsampled to the display size, and show the downsampling.
 
         Returns:
-            np.ndarray: Raw max projection array (float32).
+            tuple: Key in the viewer's ProjectionCache.
         """
-        z_start = max(0, z - w)
-        z_end = min(self.shape[0], z + w + 1)
+        region = self._region()
+        level, stride = region[0], region[-1]
+        # Downsampling of the horizontal axis relative to full resolution
+        h_axis = 2 if self._axis != 2 else 1
+        factor = round(self.shape[h_axis] / self.volume.level_shape(level)[h_axis] * stride)
+        self.scale_text.value = "Full resolution" if factor == 1 else f"Downsampled 1:{factor}"
+        if level:
+            self.scale_text.value += f" (level {level})"
+        return (self.view, self._position, self.window, region)
+
+    def _load_histogram(self) -> ContrastHistogram:
+        """
+        Load max projection for the current view, position and window, for the current region downsampled
+        to the display size.
 
-        # Read from already-open H5 dataset
-        vol = self._h5dset[z_start:z_end]
-        # Max projection along z
-        arr = np.max(vol, axis=0).astype(np.float32)
-        return arr
+        Returns:
+            ContrastHistogram: Binned max projection.
+        """
+        return self._projections.get(self._projection_key())
 
-    def _load_slice_max(self, z: int, w: int) -> Image.Image:
+    def _render_png(self, key: tuple, contrast: tuple[float, float], colormap: str) -> bytes:
         """
-        Load max projection over z-w:z+w and return as a normalized PIL Image.
+        Render a max projection as a normalized PNG, encoded in the process pool.
 
         Args:
-            z (int): Center z-slice index for the max projection.
-            w (int): Half-window size; number of slices to include on each side of z.
+            key (tuple): Key of the projection, from _projection_key().
+            contrast (tuple): Percentiles (0-100) mapped to black and white.
+            colormap (str): Colormap applied after contrast.
 
         Returns:
-            PIL.Image.Image: Image containing the normalized max projection over the specified z window.
+            bytes: PNG image.
         """
-        # Get cached slice data
-        arr = self._get_cached_slice(z, w)
-
-        low_p, high_p = self.contrast  # in [0, 100]
-
-        if low_p <= 0 and high_p >= 100:
-            # Full dynamic range
-            low_val, high_val = arr.min(), arr.max()
-        elif low_p <= 0:
-            low_val = arr.min()
-            high_val = np.percentile(arr, high_p)
-        elif high_p >= 100:
-            low_val = np.percentile(arr, low_p)
-            high_val = arr.max()
+        histogram = self._projections.get(key)
+
+        # Percentiles come from the cumulative histogram, normalization is a single lookup table application
+        low_p, high_p = contrast
+        with SharedArray(histogram.shape, np.uint8) as image:
+            histogram.to_uint8(low_p, high_p, out=image.array)
+            palette = None if colormap == "gray" else colormap_palette(colormap)
+            return self._cpu_tasks.submit(encode_png, image, palette).result()
+
+    def image_view(self, *events):
+        """Render the current max-projected image in the background, in the browser canvas or as a Panel
+        Image pane. Only the latest render is shown, a render that a newer one replaces is cancelled."""
+        if self.render_in_browser:
+            self.canvas.param.update(contrast=self.contrast, palette=list(COLORMAPS[self.colormap]))
+            if events and all(event.name in ("contrast", "colormap") for event in events):
+                # Applied in the browser to the projection it already has
+                return
+
+        view = self.canvas if self.render_in_browser else self.image
+        view.loading = True
+        if self._render_future is not None:
+            self._render_future.cancel()
+
+        key = self._projection_key()
+        pool = get_thread_pool("media-render")
+        if self.render_in_browser:
+            future = pool.submit(self._projections.get, key)
         else:
-            # Both are percentiles
-            low_val, high_val = np.percentile(arr, [low_p, high_p])
-
-        if high_val <= low_val:
-            high_val = low_val + 1e-6
+            future = pool.submit(self._render_png, key, self.contrast, self.colormap)
+        self._render_future = future
+        doc = current_document()
+        future.add_done_callback(lambda _: call_on_document(doc, lambda: self._show_render(future, view)))
 
-        arr = np.clip(arr, low_val, high_val)
-        arr = (arr - low_val) / (high_val - low_val)
-        arr = (arr * 255).astype(np.uint8)
-
-        return Image.fromarray(arr)
+    def _show_render(self, future: Future, view):
+        """
+        Show a finished render unless a newer one was requested since.
 
-    def image_view(self, event=None):
-        """Render the current max-projected image as a Panel Image pane."""
-        self.image.loading = True
+        Args:
+            future (Future): Render submitted by image_view().
+            view: The canvas or image pane showing the render.
+        """
+        if future is not self._render_future:
+            return
         try:
-            img = self._load_slice_max(self.z, self.window)
-            self.image.object = img
-        finally:
-            self.image.loading = False
+            if self.render_in_browser:
+                self.canvas.set_image(future.result())
+            else:
+                self.image.object = future.result()
+        except CancelledError:
+            if not future.cancelled() and not self._closed:
+                # Another render took this render's slot in the session's process pool queue
+                self.image_view()
+            return
+        except Exception as e:
+            print(f"[ERROR] Failed to render {self.filename}: {e}")
+        view.loading = False
 
     def __panel__(self):
         """Create and return the panel layout"""
@@ -197,9 +506,13 @@ class ZSliceH5Viewer(PyComponent):
 
         return pn.Column(
             filename_text_wiget,
+            self.view_buttons,
             self.z_controls,
+            self.y_controls,
+            self.x_controls,
             self.window_controls,
             self.contrast_controls,
-            self.image,
+            self.zoom_controls,
+            self.canvas if self.render_in_browser else self.image,
             min_height=600,
         )
@@ -0,0 +1,343 @@
+"""On-disk cache for media downloaded from S3"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+import httpx
+
+try:
+    import fcntl
+except ImportError:  # Windows, the cache is then only safe within a single process
+    fcntl = None
+
+MEDIA_CACHE_DIR = os.getenv("QC_PORTAL_MEDIA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "aind-qc-portal-media"))
+MEDIA_CACHE_SIZE_MB = int(os.getenv("QC_PORTAL_MEDIA_CACHE_SIZE_MB", "2048"))
+# Cached objects are used without checking S3 for this long after they were last validated
+MEDIA_CACHE_REVALIDATE_AFTER = 10 * 60
+# The data directory is listed at most this often to count files added by other processes, files added by
+# this process are counted as they are added
+MEDIA_CACHE_RESCAN_INTERVAL = 60
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_s3_url(url: str) -> tuple[str, str]:
+    """Get the bucket and key of a (presigned) S3 URL
+
+    Handles both path-style (https://s3.<region>.amazonaws.com/<bucket>/<key>) and virtual-hosted-style
+    (https://<bucket>.s3.<region>.amazonaws.com/<key>) URLs.
+
+    Returns
+    -------
+    tuple[str, str]
+        Bucket and key, the bucket is the URL's host if it isn't an S3 URL
+    """
+    parsed = urlparse(url)
+    host = parsed.hostname or ""
+    path = unquote(parsed.path).lstrip("/")
+
+    if host.startswith("s3.") or host == "s3.amazonaws.com":
+        bucket, _, key = path.partition("/")
+        return bucket, key
+    if ".s3." in host:
+        return host.split(".s3.")[0], path
+    return host, path
+
+
+def _size(path: Path) -> int:
+    """Size of a file, or of all files in a directory"""
+    if path.is_dir():
+        return sum(child.stat().st_size for child in path.rglob("*") if child.is_file())
+    return path.stat().st_size
+
+
+def _hash(*parts: str) -> str:
+    """Stable file name for a set of strings"""
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+class MediaDiskCache:
+    """Content-addressed cache of S3 objects on local disk
+
+    Objects are stored under a name derived from bucket/key/ETag, so a changed object gets a new file.
+    Each bucket/key has a small JSON entry pointing at its current file. Entries are revalidated with a
+    conditional GET (If-None-Match), which transfers no data when the object hasn't changed. Downloads
+    for the same object are deduplicated within the process with a lock per key, and across worker
+    processes with a lock file per key. The least recently used files are evicted when the cache is
+    over its size budget, along with their lock files and entries.
+    """
+
+    def __init__(self, cache_dir: str = MEDIA_CACHE_DIR, max_size_mb: int = MEDIA_CACHE_SIZE_MB):
+        """Create the cache in cache_dir"""
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size_mb * 1024 * 1024
+        # Name -> lock and the number of threads using it, dropped when no thread uses it
+        self._locks: dict[str, list] = {}
+        self._locks_lock = threading.Lock()
+        # Sizes of the files and directories in the data directory, by name, and their total
+        self._sizes: dict[str, int] = {}
+        self._total_size: int | None = None
+        self._scanned_at = 0.0
+
+        for subdir in ("data", "entries", "locks"):
+            (self.cache_dir / subdir).mkdir(parents=True, exist_ok=True)
+
+    @property
+    def data_dir(self) -> Path:
+        """Directory holding the cached files, files added here by other modules are evicted in the same way"""
+        return self.cache_dir / "data"
+
+    @contextmanager
+    def lock(self, name: str):
+        """Hold the thread lock and the lock file for a name, across threads and worker processes"""
+        with self._thread_lock(name), self._lock_file(name):
+            yield
+
+    @contextmanager
+    def _thread_lock(self, name: str, blocking: bool = True):
+        """Hold the thread lock for a name, yielding whether it was acquired"""
+        with self._locks_lock:
+            entry = self._locks.setdefault(name, [threading.Lock(), 0])
+            entry[1] += 1
+        acquired = entry[0].acquire(blocking)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                entry[0].release()
+            with self._locks_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[name]
+
+    @contextmanager
+    def _lock_file(self, name: str, blocking: bool = True):
+        """Hold the lock file for a name, yielding whether it was acquired"""
+        path = self.cache_dir / "locks" / name
+        while True:
+            lock_file = open(path, "a")
+            try:
+                if fcntl:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        yield False
+                        return
+                    # Eviction deletes lock files while holding them, lock the file now at the path instead
+                    try:
+                        current = os.path.samestat(os.fstat(lock_file.fileno()), os.stat(path))
+                    except FileNotFoundError:
+                        current = False
+                    if not current:
+                        continue
+                yield True
+                return
+            finally:
+                # Closing the file releases the lock
+                lock_file.close()
+
+    def _read_entry(self, entry_path: Path) -> dict | None:
+        """Read the entry for a key, None if there isn't one or its file was evicted"""
+        try:
+            entry = json.loads(entry_path.read_text())
+        except (OSError, ValueError):
+            return None
+        if not (self.cache_dir / "data" / entry["file"]).is_file():
+            return None
+        return entry
+
+    def _write_entry(self, entry_path: Path, entry: dict):
+        """Atomically write the entry for a key"""
+        tmp_path = entry_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(entry))
+        os.replace(tmp_path, entry_path)
+
+    def get(self, url: str, ext: str) -> str | None:
+        """Get a local path to the object behind a presigned URL, downloading it if needed
+
+        Parameters
+        ----------
+        url : str
+            Presigned S3 URL
+        ext : str
+            File extension, so that the file type can be recognized from its name
+
+        Returns
+        -------
+        str | None
+            Path to the cached file, None if the download failed
+        """
+        bucket, key = parse_s3_url(url)
+        key_hash = _hash(bucket, key)
+        entry_path = self.cache_dir / "entries" / f"{key_hash}.json"
+
+        with self.lock(key_hash):
+            entry = self._read_entry(entry_path)
+            if entry and time.time() - entry["validated_at"] < MEDIA_CACHE_REVALIDATE_AFTER:
+                return self._touch(entry)
+
+            headers = {"If-None-Match": entry["etag"]} if entry and entry.get("etag") else {}
+            try:
+                with httpx.Client() as client, client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304 and entry:
+                        entry["validated_at"] = time.time()
+                        self._write_entry(entry_path, entry)
+                        return self._touch(entry)
+
+                    if response.status_code != 200:
+                        response.read()
+                        print(f"[ERROR] Failed to fetch asset {url}: {response.status_code} / {response.text}")
+                        return None
+
+                    etag = response.headers.get("ETag", "").strip('"')
+                    file_name = f"{_hash(bucket, key, etag)}{ext}"
+                    self._download(response, file_name)
+            except Exception as e:
+                print(f"[ERROR] Failed to fetch asset {url}, error: {e}")
+                return None
+
+            entry = {"bucket": bucket, "key": key, "etag": etag, "file": file_name, "validated_at": time.time()}
+            self._write_entry(entry_path, entry)
+
+        path = self.cache_dir / "data" / file_name
+        self.evict(path)
+        return str(path)
+
+    def _download(self, response: httpx.Response, file_name: str):
+        """Stream a response into the data directory, the file only appears once it is complete"""
+        data_dir = self.cache_dir / "data"
+        with tempfile.NamedTemporaryFile(dir=data_dir, suffix=".part", delete=False) as tmp_file:
+            try:
+                for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    tmp_file.write(chunk)
+            except Exception:
+                tmp_file.close()
+                os.unlink(tmp_file.name)
+                raise
+        os.replace(tmp_file.name, data_dir / file_name)
+
+    def _touch(self, entry: dict) -> str:
+        """Mark a cached file as recently used and return its path"""
+        path = self.cache_dir / "data" / entry["file"]
+        os.utime(path)
+        return str(path)
+
+    def evict(self, added: str | Path | None = None):
+        """Delete the least recently used files until the cache is within its size budget
+
+        Directories (tile pyramids) are evicted as a whole, by the modification time of the directory. A
+        running total of the cache's size is kept, the data directory is only listed when the total is over
+        the budget and every MEDIA_CACHE_RESCAN_INTERVAL.
+
+        Parameters
+        ----------
+        added : str | Path, optional
+            File or directory just added to the data directory, counted without listing the directory
+        """
+        with self.lock("evict"):
+            if self._total_size is None or time.time() - self._scanned_at > MEDIA_CACHE_RESCAN_INTERVAL:
+                self._scan()
+            elif added is not None:
+                self._count(Path(added))
+            if self._total_size <= self.max_size:
+                return
+
+            # Modification times change when files are used, they are only read when evicting
+            evicted = []
+            for path, _, size in sorted(self._scan(), key=lambda item: item[1]):
+                if self._total_size <= self.max_size:
+                    break
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink(missing_ok=True)
+                self._sizes.pop(path.name, None)
+                self._total_size -= size
+                evicted.append(path.name)
+
+        self._remove_locks_and_entries(evicted)
+
+    def _count(self, path: Path):
+        """Add a file or directory of the data directory to the running total, call with the evict lock held"""
+        try:
+            size = _size(path)
+        except FileNotFoundError:
+            return
+        self._total_size += size - self._sizes.get(path.name, 0)
+        self._sizes[path.name] = size
+
+    def _scan(self) -> list[tuple[Path, float, int]]:
+        """List the data directory and recount the total, call with the evict lock held
+
+        Directories are only measured the first time they are seen, they are moved into place complete and
+        never change afterwards.
+
+        Returns
+        -------
+        list[tuple[Path, float, int]]
+            Path, modification time and size of each file and directory
+        """
+        entries = []
+        for path in (self.cache_dir / "data").iterdir():
+            if path.suffix == ".part":
+                continue
+            try:
+                stat = path.stat()
+                if path.is_dir():
+                    size = self._sizes[path.name] if path.name in self._sizes else _size(path)
+                else:
+                    size = stat.st_size
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_mtime, size))
+        self._sizes = {path.name: size for path, _, size in entries}
+        self._total_size = sum(self._sizes.values())
+        self._scanned_at = time.time()
+        return entries
+
+    def _remove_locks_and_entries(self, evicted: list[str]):
+        """Delete the lock files of evicted files, and the entries and lock files of downloads that were evicted
+
+        Files are locked by their own name, downloads by the hash of their key. Locks that are held are kept.
+        """
+        if not evicted:
+            return
+        names = set(evicted)
+        for entry_path in (self.cache_dir / "entries").glob("*.json"):
+            try:
+                if json.loads(entry_path.read_text())["file"] in names:
+                    names.add(entry_path.stem)
+            except (OSError, ValueError, KeyError):
+                continue
+
+        for name in names:
+            with self._thread_lock(name, blocking=False) as thread_locked:
+                if not thread_locked:
+                    continue
+                with self._lock_file(name, blocking=False) as file_locked:
+                    if not file_locked:
+                        continue
+                    entry_path = self.cache_dir / "entries" / f"{name}.json"
+                    if entry_path.is_file() and self._read_entry(entry_path) is None:
+                        entry_path.unlink(missing_ok=True)
+                    (self.cache_dir / "locks" / name).unlink(missing_ok=True)
+
+
+_media_disk_cache = None
+_media_disk_cache_lock = threading.Lock()
+
+
+def get_media_disk_cache() -> MediaDiskCache:
+    """Get the process-wide media disk cache, created on first use"""
+    global _media_disk_cache
+    with _media_disk_cache_lock:
+        if _media_disk_cache is None:
+            _media_disk_cache = MediaDiskCache()
+        return _media_disk_cache
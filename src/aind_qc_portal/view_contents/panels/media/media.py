@@ -1,6 +1,8 @@
 """Media class and associated helpers for the View app"""
 
 import os
+import threading
+import time
 from pathlib import Path
 from typing import Any, Optional
 
@@ -8,9 +10,28 @@ import panel as pn
 import param
 from panel.custom import PyComponent
 
+from aind_qc_portal.view_contents.panels.media.curation_apps.volume import open_volume
 from aind_qc_portal.view_contents.panels.media.curation_apps.z_slice_h5_viewer import ZSliceH5Viewer
+from aind_qc_portal.view_contents.panels.media.pool import call_on_document, current_document, get_thread_pool
+from aind_qc_portal.view_contents.panels.media.refresh import get_refresh_scheduler
+from aind_qc_portal.view_contents.panels.media.thumbnails import preview_url, supports_preview
+from aind_qc_portal.view_contents.panels.media.tiles import (
+    is_tile_info_url,
+    needs_tiling,
+    tile_info_url,
+    url_needs_tiling,
+)
+from aind_qc_portal.view_contents.panels.media.transcode import (
+    POSTER_FILE,
+    is_transcoded_video_url,
+    start_transcode,
+    streamable_name,
+    transcoded_video_url,
+)
 from aind_qc_portal.view_contents.panels.media.utils import (
+    PRESIGNED_URL_MARGIN,
     Fullscreen,
+    TileViewer,
     _get_s3_file,
     _parse_rrd,
     _parse_sortingview,
@@ -18,11 +39,25 @@ from aind_qc_portal.view_contents.panels.media.utils import (
     clean_reference_url,
     get_s3_url,
     is_presigned_url_valid,
+    media_proxy_url,
     reference_is_image,
     reference_is_pdf,
     reference_is_video,
+    reference_is_volume,
 )
 
+# Resolved media data (presigned URLs) older than this is resolved again before being displayed, shorter
+# than the margin for which shared presigned URLs are guaranteed to stay valid
+RESOLVED_DATA_TTL = PRESIGNED_URL_MARGIN // 2
+
+
+def _video_html(src: Optional[str], poster: Optional[str] = None) -> str:
+    """HTML video element for a URL served by the portal, without a src only the poster is shown"""
+    attributes = f'src="{src}" preload="metadata"' if src else 'preload="none"'
+    if poster:
+        attributes += f' poster="{poster}"'
+    return f'<video {attributes} controls style="width: 100%;"></video>'
+
 
 class Media(PyComponent):
     """A Media object that can display images, videos, and other media types."""
@@ -40,6 +75,7 @@ class Media(PyComponent):
         lazy_load: bool = True,
         value_callback=None,
         parent=None,
+        asset_name: Optional[str] = None,
     ):
         """Build a media object
 
@@ -55,6 +91,12 @@ class Media(PyComponent):
             Callback function to handle value updates from interactive media (e.g., sortingview, ephys GUI)
         parent : object, optional
             Parent object that has a set_submit_dirty method for marking changes
+        asset_name : str, optional
+            Name of the asset in DocDB. When set, images are shown as downscaled previews served by the
+            /media-preview route, which only serves references of records in DocDB. Very large images are
+            shown in a pan/zoom viewer backed by the /media-tiles route instead, and videos and PDFs are
+            streamed through the /media route. Videos that browsers can't stream are transcoded in the
+            background and served by the /media-video route.
         """
         super().__init__()
 
@@ -65,8 +107,11 @@ class Media(PyComponent):
         self.lazy_load = lazy_load
         self.value_callback = value_callback
         self.parent = parent
-        self._refresh_callback = None
+        self.asset_name = asset_name
         self._current_reference_data = None
+        self._resolve_lock = threading.Lock()
+        self._resolved = None
+        self._resolved_at = 0.0
 
         self._init_panel_objects()
 
@@ -90,24 +135,18 @@ class Media(PyComponent):
             self.media_type = "Unknown"
             return
 
-        if reference_is_image(reference):
-            self.media_type = "Image"
-        elif reference_is_pdf(reference):
-            self.media_type = "PDF"
-        elif reference_is_video(reference):
-            self.media_type = "Video"
-        elif "rrd" in reference:
-            self.media_type = "Rerun"
-        elif "sortingview" in reference:
-            self.media_type = "Sortingview"
-        elif "neuroglancer" in reference:
-            self.media_type = "Neuroglancer"
-        elif "ephys.allenneuraldynamics.org" in reference:
-            self.media_type = "Ephys GUI"
-        elif "http" in reference:
-            self.media_type = "Link"
-        else:
-            self.media_type = "Text"
+        media_types = [
+            (reference_is_image(reference), "Image"),
+            (reference_is_pdf(reference), "PDF"),
+            (reference_is_video(reference), "Video"),
+            (reference_is_volume(reference), "Volume"),
+            ("rrd" in reference, "Rerun"),
+            ("sortingview" in reference, "Sortingview"),
+            ("neuroglancer" in reference, "Neuroglancer"),
+            ("ephys.allenneuraldynamics.org" in reference, "Ephys GUI"),
+            ("http" in reference, "Link"),
+        ]
+        self.media_type = next((media_type for condition, media_type in media_types if condition), "Text")
 
     def load(self):
         """Public method to trigger media loading"""
@@ -121,12 +160,80 @@ class Media(PyComponent):
         self.content.loading = True
         try:
             self.parse_reference(self.reference)
-            self._start_refresh_callback()
+            self._schedule_refresh()
         except Exception as e:
             self._show_error(e)
         finally:
             self.content.loading = False
 
+    @property
+    def resolved(self) -> bool:
+        """Whether the media data has been resolved and is still fresh"""
+        return self._resolved is not None and time.time() - self._resolved_at < RESOLVED_DATA_TTL
+
+    def resolve(self) -> dict:
+        """Resolve the data for each part of the reference without building any panel objects
+
+        This does all of the network work (presigning, validity checks, downloads) and is safe to call
+        from a background thread. Concurrent calls wait for the first one to finish.
+
+        Returns
+        -------
+        dict
+            Mapping from each part of the reference to its resolved data
+        """
+        with self._resolve_lock:
+            if not self.resolved:
+                parts = self._split_reference(self.reference)
+                if len(parts) > 1:
+                    # Swipe references, both halves are fetched at the same time
+                    resolved_parts = get_thread_pool("media-io").map(self._resolve_reference_data, parts)
+                else:
+                    resolved_parts = [self._resolve_reference_data(part) for part in parts]
+                self._resolved = dict(zip(parts, resolved_parts))
+                self._resolved_at = time.time()
+            return self._resolved
+
+    @staticmethod
+    def _split_reference(reference: Optional[str]) -> list[str]:
+        """Split a reference into the references that need to be resolved, swipe references have two parts"""
+        if not reference or not isinstance(reference, str):
+            return []
+        if ";" in reference:
+            return reference.split(";")[:2]
+        return [reference.lstrip("/")]
+
+    def _resolve_reference_data(self, reference: str) -> Any:
+        """Convert a single reference into the data that is displayed, downloading and re-signing as needed"""
+        if self._uses_preview(reference):
+            if self._needs_tiles(reference):
+                return tile_info_url(self.asset_name, reference)
+            return preview_url(self.asset_name, reference)
+        if self._uses_proxy(reference):
+            if reference_is_video(reference) and streamable_name(self._get_media_data(reference), reference):
+                return transcoded_video_url(self.asset_name, reference)
+            return media_proxy_url(self.asset_name, reference)
+
+        reference_data = self._get_media_data(reference)
+
+        if reference_data and "https://s3" in reference_data:
+            reference_data = _get_s3_file(reference_data, os.path.splitext(reference)[1])
+
+        # Downloaded files are always valid, URLs are checked locally from their signing parameters
+        is_url_media = reference_is_image(reference) or reference_is_pdf(reference) or reference_is_video(reference)
+        is_local_file = isinstance(reference_data, str) and os.path.isfile(reference_data)
+        if is_url_media and not is_local_file and not is_presigned_url_valid(reference_data):
+            reference_data = get_s3_url(self.s3_bucket, str(Path(self.s3_prefix) / clean_reference_prefix(reference)))
+
+        return reference_data
+
+    def _get_resolved_data(self, reference: str) -> Any:
+        """Get the resolved data for one part of the reference"""
+        resolved = self.resolve() if reference in self._split_reference(self.reference) else {}
+        if reference in resolved:
+            return resolved[reference]
+        return self._resolve_reference_data(reference)
+
     def _get_media_data(self, reference: str, force_refresh: bool = False):
         """Parse a reference string and convert to a data object"""
         if "http" in reference:
@@ -139,8 +246,8 @@ class Media(PyComponent):
             reference_data = get_s3_url(bucket, key)
         elif "sha" in reference:
             raise ValueError("Kachery cloud references are no longer supported")
-        elif reference.endswith(".h5") or reference.endswith(".hdf5"):
-            # Handle H5 files - we'll construct the S3 path and open with fsspec later
+        elif reference_is_volume(reference):
+            # Handle H5 files and Zarr/N5 stores - we'll construct the S3 path and open with fsspec later
             if "results/" in reference:
                 reference = reference.split("results/")[1]
             reference_data = f"s3://{self.s3_bucket}/{str(Path(self.s3_prefix) / reference)}"
@@ -160,16 +267,13 @@ class Media(PyComponent):
         ----------
         reference : str
         reference_data: Any
+            Resolved data for the reference, see _resolve_reference_data
         """
-
-        if reference_data and "https://s3" in reference_data:
-            reference_data = _get_s3_file(reference_data, os.path.splitext(reference)[1])
-
         handlers = [
             (reference_is_image(reference), self._handle_image),
             (reference_is_pdf(reference), self._handle_pdf),
             (reference_is_video(reference), self._handle_video),
-            (reference.endswith((".h5", ".hdf5")), self._handle_h5),
+            (reference_is_volume(reference), self._handle_volume),
             ("rrd" in reference, self._handle_rerun),
             ("sortingview" in reference, self._handle_sortingview),
             ("neuroglancer" in reference, self._handle_neuroglancer),
@@ -182,11 +286,48 @@ class Media(PyComponent):
 
         return self._handle_text(reference, reference_data)
 
+    def _is_served_by_portal(self, reference: str) -> bool:
+        """Check if a reference can be served by the portal's media routes
+
+        The routes validate the whole metric reference against DocDB, so swipe halves and references with
+        a leading slash are signed and loaded directly.
+        """
+        return bool(self.asset_name) and reference == self.reference and "http" not in reference
+
+    def _uses_preview(self, reference: str) -> bool:
+        """Check if an image in S3 is shown as a preview"""
+        return self._is_served_by_portal(reference) and supports_preview(reference)
+
+    def _uses_proxy(self, reference: str) -> bool:
+        """Check if a video or PDF in S3 is streamed through the /media proxy route"""
+        return self._is_served_by_portal(reference) and (reference_is_video(reference) or reference_is_pdf(reference))
+
+    def _needs_tiles(self, reference: str) -> bool:
+        """Check if a preview image is large enough to be shown in the tile viewer
+
+        Only the first bytes of the source are fetched to read its size. When the size isn't in them the source
+        is downloaded into the media disk cache, the preview and tile routes then use the same cached copy.
+        """
+        url = self._get_media_data(reference)
+        if not url:
+            return False
+        tiled = url_needs_tiling(url)
+        if tiled is None:
+            source_path = _get_s3_file(url, os.path.splitext(reference)[1])
+            tiled = bool(source_path) and needs_tiling(source_path)
+        return tiled
+
     def _handle_image(self, reference: str, reference_data: Any):
         """Handle image media type"""
         self.media_type = "Image"
-        if not is_presigned_url_valid(reference_data):
-            reference_data = get_s3_url(self.s3_bucket, str(Path(self.s3_prefix) / clean_reference_prefix(reference)))
+        if is_tile_info_url(reference_data):
+            return TileViewer(info_url=reference_data, sizing_mode="stretch_width", height=800)
+        if self._uses_preview(reference):
+            # The preview route signs URLs itself, so there is nothing to refresh
+            full_url = preview_url(self.asset_name, reference, "full")
+            html = f'<img src="{reference_data}" data-full-src="{full_url}" style="width: 100%; height: auto;">'
+            return pn.pane.HTML(html, sizing_mode="stretch_width")
+
         self._current_reference_data = reference_data
         self.image_pane.object = reference_data
         return self.image_pane
@@ -194,8 +335,11 @@ class Media(PyComponent):
     def _handle_pdf(self, reference: str, reference_data: Any):
         """Handle PDF media type"""
         self.media_type = "PDF"
-        if not is_presigned_url_valid(reference_data):
-            reference_data = get_s3_url(self.s3_bucket, str(Path(self.s3_prefix) / clean_reference_prefix(reference)))
+        if self._uses_proxy(reference):
+            # Proxied URLs never expire, the browser's PDF viewer fetches pages with range requests
+            html = f'<iframe src="{reference_data}" style="width: 100%; height: 1000px; border: none;"></iframe>'
+            return pn.pane.HTML(html, sizing_mode="stretch_width")
+
         self._current_reference_data = reference_data
         self.pdf_pane.object = reference_data
         return self.pdf_pane
@@ -203,21 +347,51 @@ class Media(PyComponent):
     def _handle_video(self, reference: str, reference_data: Any):
         """Handle video media type"""
         self.media_type = "Video"
-        if not is_presigned_url_valid(reference_data):
-            reference_data = get_s3_url(self.s3_bucket, str(Path(self.s3_prefix) / clean_reference_prefix(reference)))
+        if is_transcoded_video_url(reference_data):
+            return self._handle_transcoded_video(reference, reference_data)
+        if self._uses_proxy(reference):
+            # Proxied URLs never expire, seeking uses range requests instead of downloading the whole video
+            return pn.pane.HTML(_video_html(reference_data), sizing_mode="stretch_width")
+
         self._current_reference_data = reference_data
         self.video_pane.object = reference_data
         return self.video_pane
 
-    def _handle_h5(self, reference: str, reference_data: Any):
-        """Handle H5/HDF5 files"""
-        import fsspec
-
-        print(f"Opening H5 file from S3: {reference_data}")
-        fs = fsspec.filesystem("s3", anon=False)
-        file_obj = fs.open(reference_data, "rb")
-        filename = reference_data.split("/")[-1]
-        return ZSliceH5Viewer(file_obj, filename=filename)
+    def _handle_transcoded_video(self, reference: str, video_url: str):
+        """Show the poster frame of a video that is being made streamable, then swap in the streamable copy"""
+        poster_url = transcoded_video_url(self.asset_name, reference, POSTER_FILE)
+        pane = pn.pane.HTML(
+            _video_html(None, poster_url) + "<p><i>Preparing video for streaming...</i></p>",
+            sizing_mode="stretch_width",
+        )
+
+        url = self._get_media_data(reference)
+        name = streamable_name(url, reference)
+        if not name:
+            pane.object = _video_html(media_proxy_url(self.asset_name, reference), poster_url)
+            return pane
+
+        doc = current_document()
+
+        def show(future):
+            """Point the player at the streamable copy, or at the original if transcoding failed"""
+            try:
+                transcoded = future.result()
+            except Exception as e:
+                print(f"[ERROR] Failed to transcode {reference}: {e}")
+                transcoded = None
+            src = video_url if transcoded else media_proxy_url(self.asset_name, reference)
+            call_on_document(doc, lambda: setattr(pane, "object", _video_html(src, poster_url)))
+
+        start_transcode(url, name, reference).add_done_callback(show)
+        return pane
+
+    def _handle_volume(self, reference: str, reference_data: Any):
+        """Handle volumes, H5/HDF5 files and OME-Zarr/N5 stores"""
+        print(f"Opening volume from S3: {reference_data}")
+        self.media_type = "Volume"
+        volume = open_volume(reference_data)
+        return ZSliceH5Viewer(volume, filename=volume.name)
 
     def _handle_rerun(self, reference: str, reference_data: Any):
         """Handle Rerun media type"""
@@ -273,14 +447,14 @@ class Media(PyComponent):
             reference_left = reference.split(";")[0]
             reference_right = reference.split(";")[1]
             obj = pn.layout.Swipe(
-                self._get_media_object(reference_left, self._get_media_data(reference_left)),
-                self._get_media_object(reference_right, self._get_media_data(reference_right)),
+                self._get_media_object(reference_left, self._get_resolved_data(reference_left)),
+                self._get_media_object(reference_right, self._get_resolved_data(reference_right)),
             )
         else:
             # Single-media references
             reference = reference.lstrip("/")
 
-            reference_data = self._get_media_data(reference)
+            reference_data = self._get_resolved_data(reference)
             if not reference_data:
                 self.content.append(pn.pane.Alert(f"Failed to load asset: {reference}", alert_type="danger"))
                 return
@@ -292,25 +466,29 @@ class Media(PyComponent):
 
         self.content.append(obj)
 
-    def _start_refresh_callback(self):
-        """Start periodic callback to refresh URLs before they expire"""
-        if self.media_type not in ["Image", "PDF", "Video"]:
+    def _schedule_refresh(self):
+        """Register the presigned URL being shown with the process-wide refresh scheduler
+
+        Downloaded files, proxied media and previews don't expire and aren't scheduled. Swipe references
+        show two URLs and aren't refreshed either.
+        """
+        if self.media_type not in ["Image", "PDF", "Video"] or not self._current_reference_data:
+            return
+        if ";" in self.reference:
             return
 
-        if self._refresh_callback:
-            self._refresh_callback.stop()
+        get_refresh_scheduler().schedule(self, self._current_reference_data)
 
-        refresh_interval = 50 * 60 * 1000
-        self._refresh_callback = pn.state.add_periodic_callback(self._refresh_url, period=refresh_interval)
+    def resign_url(self) -> str:
+        """Get a new presigned URL for the reference, called by the refresh scheduler"""
+        return self._get_media_data(self.reference, force_refresh=True)
 
-    def _refresh_url(self):
-        """Refresh the presigned URL for the current media"""
-        if not self.reference or not self._current_reference_data:
+    def set_url(self, reference_data: str):
+        """Show a refreshed presigned URL, panes are only updated when the URL changed"""
+        if not self._current_reference_data or reference_data == self._current_reference_data:
             return
 
         print(f"Refreshing URL for {self.reference}")
-
-        reference_data = self._get_media_data(self.reference, force_refresh=True)
         self._current_reference_data = reference_data
 
         if self.media_type == "Image":
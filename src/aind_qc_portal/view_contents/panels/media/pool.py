@@ -0,0 +1,63 @@
+"""Bounded thread pools for media IO, shared by all sessions in the server process"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import panel as pn
+from panel.io.state import set_curdoc
+
+MEDIA_IO_WORKERS = int(os.getenv("QC_PORTAL_MEDIA_IO_WORKERS", "8"))
+
+_pools: dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def get_thread_pool(name: str, max_workers: int = MEDIA_IO_WORKERS) -> ThreadPoolExecutor:
+    """Get the process-wide thread pool with the given name, creating it on first use
+
+    Work submitted to a pool must not wait on other work in the same pool, use separate pools for each
+    level of nesting so that a full pool can't deadlock.
+
+    Parameters
+    ----------
+    name : str
+        Name of the pool, also used as the thread name prefix
+    max_workers : int, optional
+        Number of threads, only used when the pool is created
+    """
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        return _pools[name]
+
+
+def current_document():
+    """Document of the session being served, None outside of a server session"""
+    return pn.state.curdoc if pn.state.curdoc and pn.state.curdoc.session_context else None
+
+
+def call_on_document(doc, callback: Callable[[], None]):
+    """Run a callback from a worker thread with a session's document locked
+
+    Parameters
+    ----------
+    doc : Document or None
+        Document from current_document(), the callback is run directly when None
+    callback : Callable[[], None]
+    """
+    if doc is None:
+        callback()
+        return
+
+    def run():
+        """Run the callback as the document's callback"""
+        with set_curdoc(doc):
+            callback()
+
+    try:
+        doc.add_next_tick_callback(run)
+    except Exception as e:
+        # The session went away while the work was running
+        print(f"[ERROR] Failed to schedule callback on session: {e}")
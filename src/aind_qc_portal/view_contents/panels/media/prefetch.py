@@ -0,0 +1,100 @@
+"""Background resolution of media, for the tabs being opened and the tabs and tree nodes next to them"""
+
+import os
+import weakref
+from concurrent.futures import Future
+
+from aind_qc_portal.view_contents.panels.media.pool import get_thread_pool
+
+PREFETCH_WORKERS = int(os.getenv("QC_PORTAL_PREFETCH_WORKERS", "4"))
+
+
+def resolve_in_background(media_panels: list) -> list[Future]:
+    """Start resolving Media objects concurrently, at most PREFETCH_WORKERS at a time, without waiting for them
+
+    Loading one of them afterwards waits for its resolution to finish instead of starting a new one, so
+    opening several of them costs about one fetch instead of one fetch each.
+
+    Parameters
+    ----------
+    media_panels : list of Media
+
+    Returns
+    -------
+    list[Future]
+    """
+    executor = get_thread_pool("media-prefetch", PREFETCH_WORKERS)
+    return [
+        executor.submit(_resolve_quietly, media) for media in media_panels if not media.loaded and not media.resolved
+    ]
+
+
+def _resolve_quietly(media):
+    """Resolve a Media object, printing errors instead of raising them"""
+    try:
+        media.resolve()
+    except Exception as e:
+        # The error will be shown to the user if they open this media
+        print(f"[MediaPrefetcher] Failed to resolve {media.reference}: {e}")
+
+
+class MediaPrefetcher:
+    """Resolve Media objects in the background before the user opens them
+
+    Each call to prefetch() cancels the work queued by the previous call, so when the user jumps elsewhere
+    in the tree only the media next to the new selection is warmed. Hits and misses are counted when media
+    is loaded, hit_rate reports how often the prefetch was useful.
+    """
+
+    def __init__(self):
+        """Initialize an idle prefetcher"""
+        self._futures: list[Future] = []
+        self._generation = 0
+        # Weak, so that media dropped from the media cache doesn't stay alive here
+        self._prefetched: weakref.WeakSet = weakref.WeakSet()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of loaded media that had already been resolved by the prefetcher"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def prefetch(self, media_panels: list):
+        """Cancel any queued work and queue the given Media objects to be resolved
+
+        Parameters
+        ----------
+        media_panels : list of Media
+        """
+        self.cancel()
+        generation = self._generation
+        executor = get_thread_pool("media-prefetch", PREFETCH_WORKERS)
+        for media in media_panels:
+            if media.loaded or media.resolved:
+                continue
+            self._prefetched.add(media)
+            self._futures.append(executor.submit(self._resolve, media, generation))
+
+    def _resolve(self, media, generation: int):
+        """Resolve a single Media object, skipping it if the prefetch has been cancelled since it was queued"""
+        if generation != self._generation:
+            return
+        _resolve_quietly(media)
+
+    def cancel(self):
+        """Cancel all queued prefetches, work that has already started is allowed to finish"""
+        self._generation += 1
+        for future in self._futures:
+            future.cancel()
+        self._futures = []
+
+    def record_load(self, media):
+        """Record whether a Media object that is about to be loaded was warmed by the prefetcher"""
+        if media.loaded:
+            return
+        if media in self._prefetched and media.resolved:
+            self.hits += 1
+        else:
+            self.misses += 1
@@ -0,0 +1,238 @@
+"""Process pool for CPU-bound media work, so that projections and image encoding don't hold the GIL of the
+server process, with arrays handed to the workers through shared memory
+
+Worker processes are spawned and import this module to unpickle SharedArrays, keep it free of Panel imports.
+"""
+
+import io
+import math
+import multiprocessing
+import os
+import sys
+import threading
+import weakref
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable
+
+import numpy as np
+from PIL import Image
+
+# Worker processes shared by all sessions, 0 runs the work on threads of the server process instead
+MEDIA_CPU_WORKERS = int(os.getenv("QC_PORTAL_MEDIA_CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Tasks one session can have queued or running in the process pool, older ones that haven't started are
+# cancelled when a newer task would go over it
+MEDIA_CPU_SESSION_TASKS = int(os.getenv("QC_PORTAL_MEDIA_CPU_SESSION_TASKS", "4"))
+
+_pool: Executor | None = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> Executor:
+    """Get the process-wide pool for CPU-bound media work, creating it on first use
+
+    Workers are spawned rather than forked, forking a server process that runs threads can deadlock the
+    children on locks held by those threads.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if MEDIA_CPU_WORKERS > 0:
+                _pool = ProcessPoolExecutor(MEDIA_CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="media-cpu")
+        return _pool
+
+
+def _attach(name: str) -> SharedMemory:
+    """Map shared memory created by another process, without taking ownership of it"""
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, track=False)
+    # Before 3.13 attaching registers the memory again, spawned workers share the resource tracker of the
+    # server process, which already has it
+    return SharedMemory(name=name)
+
+
+class SharedArray:
+    """Numpy array in shared memory, pickled as the name of the memory so that a worker process maps the same
+    pages instead of receiving a copy
+
+    The process that creates the array owns it and frees it with close(), workers call detach() once done.
+    """
+
+    def __init__(self, shape: tuple[int, ...], dtype: Any, name: str | None = None):
+        """Create an array, or map one created by another process
+
+        Parameters
+        ----------
+        shape : tuple[int, ...]
+        dtype : Any
+            Anything np.dtype() accepts
+        name : str, optional
+            Name of existing shared memory to map, new memory is created when None
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        if self.owner:
+            size = max(1, math.prod(self.shape) * self.dtype.itemsize)
+            self._shm = SharedMemory(create=True, size=size)
+        else:
+            self._shm = _attach(name)
+        self.array = np.ndarray(self.shape, self.dtype, buffer=self._shm.buf)
+
+    @classmethod
+    def copy_of(cls, arr: np.ndarray) -> "SharedArray":
+        """Create a shared array with the contents of an array"""
+        shared = cls(arr.shape, arr.dtype)
+        np.copyto(shared.array, arr)
+        return shared
+
+    def __reduce__(self):
+        """Pickle as the name of the shared memory"""
+        return (SharedArray, (self.shape, self.dtype.str, self._shm.name))
+
+    def __enter__(self) -> "SharedArray":
+        """Use the array, closing it on exit"""
+        return self
+
+    def __exit__(self, *exc):
+        """Close the array"""
+        self.close()
+
+    def detach(self):
+        """Unmap memory created by another process, a no-op in the owning process so that work can also run on
+        threads of the owner"""
+        if not self.owner:
+            self.close()
+
+    def close(self):
+        """Unmap the memory, and free it in the owning process. Views of the array must be gone by then."""
+        if self._shm is None:
+            return
+        self.array = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+        self._shm = None
+
+
+def encode_png(image: SharedArray, palette: list[int] | None = None) -> bytes:
+    """Encode a uint8 image as PNG
+
+    Parameters
+    ----------
+    image : SharedArray
+        (height, width) or (height, width, 3) uint8 image
+    palette : list[int], optional
+        Flat RGB palette of a single channel image, grayscale when None
+    """
+    try:
+        buffer = io.BytesIO()
+        pil_image = Image.fromarray(image.array)
+        if palette is not None:
+            pil_image.putpalette(palette)
+        # compress_level 1 is several times faster than the default for a slightly larger file
+        pil_image.save(buffer, "PNG", compress_level=1)
+        return buffer.getvalue()
+    finally:
+        image.detach()
+
+
+class SessionTasks:
+    """Tasks of one session in the process pool
+
+    At most max_tasks are queued or running at a time. When a new task would go over it, the oldest tasks that
+    haven't started are cancelled, their results were for views the user has already moved past. Background
+    tasks (prefetches) only replace other background tasks, so that they never cancel what the user is waiting
+    for. When nothing can be replaced, submit() waits for a task to finish, so one user scrubbing a volume can't
+    fill the pool.
+    """
+
+    def __init__(self, max_tasks: int = MEDIA_CPU_SESSION_TASKS, executor: Callable[[], Executor] = get_process_pool):
+        """Create an empty queue
+
+        Parameters
+        ----------
+        max_tasks : int, optional
+            Tasks queued or running at a time
+        executor : Callable[[], Executor], optional
+            Returns the pool to submit to
+        """
+        self.max_tasks = max(1, max_tasks)
+        self.executor = executor
+        # Futures and whether they are background tasks, oldest first
+        self._tasks: dict[Future, bool] = {}
+        self._changed = threading.Condition()
+
+    def __len__(self) -> int:
+        """Number of tasks queued or running"""
+        with self._changed:
+            return len(self._tasks)
+
+    def _done(self, future: Future):
+        """Free the slot of a finished or cancelled task"""
+        with self._changed:
+            self._tasks.pop(future, None)
+            self._changed.notify_all()
+
+    def _replace_stale(self, background: bool) -> bool:
+        """Cancel the oldest task that hasn't started and that a new task may replace, background tasks first"""
+        for replaceable in (True, False) if not background else (True,):
+            for future, is_background in list(self._tasks.items()):
+                if is_background == replaceable and future.cancel():
+                    self._tasks.pop(future, None)
+                    return True
+        return False
+
+    def submit(self, fn: Callable, *args, background: bool = False) -> Future:
+        """Submit a task, replacing stale ones that haven't started when the session is at its limit
+
+        Parameters
+        ----------
+        fn : Callable
+            Picklable function, run in a worker process
+        *args
+            Picklable arguments, pass arrays as SharedArrays
+        background : bool, optional
+            Whether the task is a prefetch, which newer tasks replace first
+
+        Returns
+        -------
+        Future
+            Raises CancelledError from result() if a newer task replaced it
+        """
+        with self._changed:
+            while len(self._tasks) >= self.max_tasks and not self._replace_stale(background):
+                self._changed.wait()
+            future = self.executor().submit(fn, *args)
+            self._tasks[future] = background
+        future.add_done_callback(self._done)
+        return future
+
+    def cancel(self):
+        """Cancel the tasks that haven't started"""
+        with self._changed:
+            for future in list(self._tasks):
+                future.cancel()
+
+
+_sessions: "weakref.WeakKeyDictionary[Any, SessionTasks]" = weakref.WeakKeyDictionary()
+_local_tasks = SessionTasks()
+_sessions_lock = threading.Lock()
+
+
+def get_session_tasks(doc) -> SessionTasks:
+    """Get the process pool queue of a session
+
+    Parameters
+    ----------
+    doc : Document or None
+        Document of the session from pool.current_document(), work outside of a server session shares one queue
+    """
+    if doc is None:
+        return _local_tasks
+    with _sessions_lock:
+        if doc not in _sessions:
+            _sessions[doc] = SessionTasks()
+        return _sessions[doc]
@@ -0,0 +1,214 @@
+"""Process-wide scheduler that re-signs the presigned URLs of displayed media before they expire"""
+
+import heapq
+import itertools
+import threading
+import time
+import weakref
+from collections import defaultdict
+
+from aind_qc_portal.view_contents.panels.media.pool import call_on_document, current_document
+from aind_qc_portal.view_contents.panels.media.utils import PRESIGNED_URL_MARGIN, get_presigned_url_expiry
+
+# Entries that become due within this many seconds of the first due entry are refreshed in the same batch,
+# failed re-signs are retried after the same delay
+REFRESH_BATCH_WINDOW = 60
+# The scheduler thread wakes up at least this often, so that it notices released entries
+MAX_SLEEP = 60 * 10
+
+
+class URLRefreshScheduler:
+    """Refresh the presigned URLs of displayed media from a single thread
+
+    Media are kept in a priority queue ordered by when their URL has to be replaced, which is
+    PRESIGNED_URL_MARGIN before it expires. Due entries are re-signed together, and the new URLs are
+    applied on each session's document with one callback per session. Entries are released when their
+    session is destroyed or their Media is garbage collected.
+
+    Scheduled objects must implement `resign_url() -> str`, called on the scheduler thread, and
+    `set_url(url)`, called with the session's document locked.
+    """
+
+    def __init__(self):
+        """Create an empty scheduler, call start() to run it"""
+        self._heap: list[tuple[float, int]] = []
+        # Sequence number -> (weak reference to the media, document)
+        self._entries: dict[int, tuple[weakref.ref, object]] = {}
+        # Media -> sequence number of its current entry, dropped when the media is garbage collected
+        self._current: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._documents: set = set()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def __len__(self) -> int:
+        """Number of scheduled media"""
+        with self._condition:
+            return len(self._entries)
+
+    def start(self):
+        """Start the scheduler thread, if it isn't running yet"""
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="url-refresh", daemon=True)
+                self._thread.start()
+
+    def schedule(self, media, url: str) -> bool:
+        """Schedule a refresh of a media's URL, replacing any previous schedule for the same media
+
+        Parameters
+        ----------
+        media : Media
+        url : str
+            URL currently shown by the media
+
+        Returns
+        -------
+        bool
+            False if the URL doesn't expire, nothing is scheduled then
+        """
+        expiry = get_presigned_url_expiry(url)
+        if expiry is None:
+            self.release(media)
+            return False
+
+        self._push(media, current_document(), expiry - PRESIGNED_URL_MARGIN)
+        return True
+
+    def _push(self, media, doc, due: float):
+        """Add the entry for a media, replacing its previous one"""
+        with self._condition:
+            self._remove(media)
+            sequence = next(self._sequence)
+            self._entries[sequence] = (weakref.ref(media), doc)
+            self._current[media] = sequence
+            heapq.heappush(self._heap, (due, sequence))
+            if doc is not None and doc not in self._documents:
+                self._documents.add(doc)
+                doc.on_session_destroyed(self._release_callback(doc))
+            self._condition.notify()
+
+    def release(self, media):
+        """Stop refreshing a media's URL"""
+        with self._condition:
+            self._remove(media)
+
+    def release_document(self, doc):
+        """Stop refreshing the URLs of every media shown in a document"""
+        with self._condition:
+            self._documents.discard(doc)
+            for sequence, (ref, entry_doc) in list(self._entries.items()):
+                if entry_doc is doc:
+                    del self._entries[sequence]
+                    media = ref()
+                    if media is not None:
+                        self._current.pop(media, None)
+
+    def _release_callback(self, doc):
+        """Build a session destroyed callback that releases a document"""
+
+        def release(session_context):
+            """Release the document of a destroyed session"""
+            self.release_document(doc)
+
+        return release
+
+    def _remove(self, media):
+        """Remove the entry of a media, its heap item is skipped when popped. Call with the lock held."""
+        sequence = self._current.pop(media, None)
+        if sequence is not None:
+            self._entries.pop(sequence, None)
+
+    def _pop_due(self, now: float) -> dict:
+        """Pop the due entries, and those due soon after them, grouped by document. Call with the lock held.
+
+        Entries popped before they are due may still get their current URL back when re-signed, they are
+        then rescheduled for their original due time by set_url() -> schedule().
+        """
+        batch = defaultdict(list)
+        if not self._heap or self._heap[0][0] > now:
+            return batch
+        while self._heap and self._heap[0][0] <= now + REFRESH_BATCH_WINDOW:
+            _, sequence = heapq.heappop(self._heap)
+            entry = self._entries.pop(sequence, None)
+            if entry is None:
+                continue
+            ref, doc = entry
+            media = ref()
+            if media is None:
+                continue
+            self._current.pop(media, None)
+            batch[doc].append(media)
+        return batch
+
+    def refresh_due(self, now: float | None = None) -> int:
+        """Re-sign and apply the URLs of all due entries
+
+        Returns
+        -------
+        int
+            Number of media refreshed
+        """
+        now = time.time() if now is None else now
+        with self._condition:
+            batch = self._pop_due(now)
+
+        count = 0
+        for doc, media_list in batch.items():
+            updates = []
+            for media in media_list:
+                try:
+                    url = media.resign_url()
+                except Exception as e:
+                    print(f"[URLRefreshScheduler] Failed to re-sign URL for {getattr(media, 'reference', media)}: {e}")
+                    url = None
+                if url:
+                    updates.append((media, url))
+                else:
+                    self._push(media, doc, now + REFRESH_BATCH_WINDOW)
+            count += len(updates)
+            self._apply(doc, updates)
+        return count
+
+    def _apply(self, doc, updates: list):
+        """Apply new URLs on a document, then schedule their next refresh"""
+
+        def apply():
+            """Set the URLs with the document locked"""
+            for media, url in updates:
+                try:
+                    media.set_url(url)
+                except Exception as e:
+                    print(f"[URLRefreshScheduler] Failed to set URL for {getattr(media, 'reference', media)}: {e}")
+                self.schedule(media, url)
+
+        def apply_if_alive():
+            """Run apply(), unless the session was destroyed in the meantime"""
+            if doc is None or doc in self._documents:
+                apply()
+
+        call_on_document(doc, apply_if_alive)
+
+    def _run(self):
+        """Sleep until the next entry is due, then refresh the batch"""
+        while True:
+            with self._condition:
+                delay = self._heap[0][0] - time.time() if self._heap else MAX_SLEEP
+                if delay > 0:
+                    self._condition.wait(timeout=min(delay, MAX_SLEEP))
+                    continue
+            self.refresh_due()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_refresh_scheduler() -> URLRefreshScheduler:
+    """Get the process-wide URL refresh scheduler, started on first use"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = URLRefreshScheduler()
+            _scheduler.start()
+        return _scheduler
@@ -0,0 +1,131 @@
+"""Downscaled previews of image references, generated on the server and cached on disk"""
+
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+from PIL import Image
+
+from aind_qc_portal.view_contents.panels.media.disk_cache import get_media_disk_cache
+from aind_qc_portal.view_contents.panels.media.process_pool import get_process_pool
+
+# Width of the previews shown in the metric panels, full resolution is only loaded in fullscreen
+PREVIEW_WIDTH = 1200
+PREVIEW_WIDTHS = (400, PREVIEW_WIDTH)
+PREVIEW_QUALITY = 80
+# Largest dimension WebP can encode
+WEBP_MAX_SIZE = 16383
+
+# Raster formats that previews are generated for, other images (svg, gif) are served as they are
+PREVIEW_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".tif", ".tiff")
+# Formats that browsers can't display, these are also converted when shown at full resolution
+CONVERTED_EXTENSIONS = (".tif", ".tiff")
+# Stitched overviews are far larger than PIL's default decompression bomb limit. The limit is only raised while
+# opening references in the worker process functions, everywhere else PIL's default guard stays in place.
+MAX_IMAGE_PIXELS = 2_000_000_000
+
+
+def supports_preview(reference: str) -> bool:
+    """Check if previews can be generated for a reference"""
+    return reference.lower().endswith(PREVIEW_EXTENSIONS)
+
+
+def needs_conversion(reference: str) -> bool:
+    """Check if a reference has to be converted before a browser can display it"""
+    return reference.lower().endswith(CONVERTED_EXTENSIONS)
+
+
+def preview_url(asset_name: str, reference: str, width: int | str = PREVIEW_WIDTH) -> str:
+    """URL of the preview route for a reference, width="full" gets the full resolution image"""
+    return f"/media-preview/{quote(asset_name, safe='')}?reference={quote(reference, safe='')}&width={width}"
+
+
+@contextmanager
+def open_large_image(path: str):
+    """Open an image with PIL's decompression bomb limit raised to MAX_IMAGE_PIXELS
+
+    The limit is a module global in PIL, this is only used in worker processes, which run one task at a time.
+    """
+    default_limit = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    try:
+        img = Image.open(path)
+    finally:
+        Image.MAX_IMAGE_PIXELS = default_limit
+    with img:
+        yield img
+
+
+def _to_displayable(img: Image.Image) -> Image.Image:
+    """Convert an image to 8-bit RGB or RGBA, scaling high bit-depth images to their full range"""
+    if img.mode in ("I", "I;16", "I;16B", "I;16L", "F"):
+        arr = np.asarray(img, dtype=np.float32)
+        low, high = float(arr.min()), float(arr.max())
+        arr = (arr - low) / (high - low) * 255 if high > low else np.zeros_like(arr)
+        img = Image.fromarray(arr.astype(np.uint8))
+
+    has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+    return img.convert("RGBA" if has_alpha else "RGB")
+
+
+def make_preview(source_path: str, dest_path: str, width: int | None = PREVIEW_WIDTH):
+    """Write a WebP preview of an image
+
+    Parameters
+    ----------
+    source_path : str
+    dest_path : str
+    width : int | None, optional
+        Maximum width, images are never upscaled. None keeps the full resolution (as far as WebP allows).
+    """
+    with open_large_image(source_path) as img:
+        # Multi-page TIFFs, only the first page is shown
+        img.seek(0)
+        img = _to_displayable(img)
+
+    max_width = min(width or WEBP_MAX_SIZE, WEBP_MAX_SIZE)
+    img.thumbnail((max_width, WEBP_MAX_SIZE), Image.Resampling.LANCZOS)
+
+    tmp_path = f"{dest_path}.part"
+    img.save(tmp_path, "WEBP", quality=PREVIEW_QUALITY)
+    os.replace(tmp_path, dest_path)
+
+
+def get_preview(url: str, ext: str, width: int | None = PREVIEW_WIDTH) -> str | None:
+    """Get a local path to a WebP preview of the image behind a presigned URL
+
+    The source image and its previews are stored in the media disk cache. Preview names are derived from
+    the source's cache name, which includes its ETag, so previews are regenerated when the source changes.
+
+    Parameters
+    ----------
+    url : str
+        Presigned S3 URL of the source image
+    ext : str
+        Extension of the source image
+    width : int | None, optional
+        Maximum width, None for full resolution
+
+    Returns
+    -------
+    str | None
+        Path to the preview, None if the source couldn't be downloaded
+    """
+    cache = get_media_disk_cache()
+    source_path = cache.get(url, ext)
+    if not source_path:
+        return None
+
+    name = f"{Path(source_path).stem}_{width or 'full'}.webp"
+    path = cache.data_dir / name
+    with cache.lock(name):
+        if path.is_file():
+            os.utime(path)
+            return str(path)
+        # Decoding and encoding hold the GIL, they run in a worker process
+        get_process_pool().submit(make_preview, source_path, str(path), width).result()
+
+    cache.evict(path)
+    return str(path)
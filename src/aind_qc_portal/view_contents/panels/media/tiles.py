@@ -0,0 +1,157 @@
+"""Multi-resolution tile pyramids of very large image references, for pan/zoom viewing"""
+
+import io
+import json
+import math
+import os
+import shutil
+from pathlib import Path
+from urllib.parse import quote
+
+import httpx
+from PIL import Image
+
+from aind_qc_portal.view_contents.panels.media.disk_cache import get_media_disk_cache
+from aind_qc_portal.view_contents.panels.media.process_pool import get_process_pool
+from aind_qc_portal.view_contents.panels.media.thumbnails import PREVIEW_QUALITY, _to_displayable, open_large_image
+
+TILES_ROUTE = "/media-tiles"
+TILE_SIZE = 256
+# Images with at least this many pixels are shown in the tile viewer instead of as a single preview
+TILING_MIN_PIXELS = 16_000_000
+# Bytes fetched from the start of an image to read its size, enough for PNG, WebP and JPEG headers with EXIF data
+IMAGE_HEADER_BYTES = 64 * 1024
+IMAGE_HEADER_TIMEOUT = 10
+
+
+def tile_info_url(asset_name: str, reference: str) -> str:
+    """URL of the pyramid description of a reference, tiles are at <level>/<col>_<row>.webp next to it"""
+    return f"{TILES_ROUTE}/{quote(asset_name, safe='')}/info.json?reference={quote(reference, safe='')}"
+
+
+def is_tile_info_url(url) -> bool:
+    """Check if resolved media data is a tile pyramid URL"""
+    return isinstance(url, str) and url.startswith(f"{TILES_ROUTE}/")
+
+
+def _header_needs_tiling(source) -> bool:
+    """Read the size from an image's header and check it against the tiling threshold, raises if it can't be read"""
+    try:
+        with Image.open(source) as img:
+            width, height = img.size
+    except Image.DecompressionBombError:
+        # Larger than PIL's default limit, which is far above the tiling threshold
+        return True
+    return width * height >= TILING_MIN_PIXELS
+
+
+def needs_tiling(path: str) -> bool:
+    """Check if an image is large enough to be tiled, only the header is read"""
+    try:
+        return _header_needs_tiling(path)
+    except Exception as e:
+        print(f"[ERROR] Failed to read image size of {path}: {e}")
+        return False
+
+
+def url_needs_tiling(url: str) -> bool | None:
+    """Check if the image behind a presigned URL is large enough to be tiled, fetching only its first bytes
+
+    Returns
+    -------
+    bool | None
+        None if the request failed or the size isn't in the first IMAGE_HEADER_BYTES, e.g. for TIFFs that
+        store their image directory at the end of the file
+    """
+    headers = {"Range": f"bytes=0-{IMAGE_HEADER_BYTES - 1}"}
+    try:
+        response = httpx.get(url, headers=headers, timeout=IMAGE_HEADER_TIMEOUT)
+        response.raise_for_status()
+        return _header_needs_tiling(io.BytesIO(response.content))
+    except Exception:
+        return None
+
+
+def pyramid_levels(width: int, height: int, tile_size: int = TILE_SIZE) -> list[tuple[int, int]]:
+    """Sizes of the pyramid levels, from full resolution halving until the image fits in one tile"""
+    levels = [(width, height)]
+    while max(levels[-1]) > tile_size:
+        w, h = levels[-1]
+        levels.append((math.ceil(w / 2), math.ceil(h / 2)))
+    return levels
+
+
+def build_pyramid(source_path: str, dest_dir: str, tile_size: int = TILE_SIZE) -> dict:
+    """Write the tile pyramid of an image to dest_dir
+
+    Tiles are stored as <level>/<col>_<row>.webp, with level 0 at full resolution, next to an info.json
+    describing the levels. The pyramid is built in a temporary directory and moved into place once complete.
+
+    Returns
+    -------
+    dict
+        Contents of info.json
+    """
+    with open_large_image(source_path) as img:
+        img.seek(0)
+        img = _to_displayable(img)
+
+    levels = pyramid_levels(*img.size, tile_size)
+    info = {"width": img.width, "height": img.height, "tile_size": tile_size, "levels": [list(size) for size in levels]}
+
+    tmp_dir = Path(f"{dest_dir}.part")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    try:
+        for level in range(len(levels)):
+            if level:
+                img = img.reduce(2)
+            level_dir = tmp_dir / str(level)
+            level_dir.mkdir(parents=True)
+            for row in range(math.ceil(img.height / tile_size)):
+                for col in range(math.ceil(img.width / tile_size)):
+                    box = (col * tile_size, row * tile_size)
+                    box += (min(box[0] + tile_size, img.width), min(box[1] + tile_size, img.height))
+                    # Fastest WebP method, a pyramid has thousands of tiles and is built while the user waits
+                    tile = img.crop(box)
+                    tile.save(level_dir / f"{col}_{row}.webp", "WEBP", quality=PREVIEW_QUALITY, method=0)
+
+        (tmp_dir / "info.json").write_text(json.dumps(info))
+        os.replace(tmp_dir, dest_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    return info
+
+
+def get_pyramid(url: str, ext: str) -> str | None:
+    """Get a local directory with the tile pyramid of the image behind a presigned URL
+
+    The pyramid is built on first access and stored in the media disk cache next to its source, named
+    after the source's cache name so that it is rebuilt when the source changes.
+
+    Returns
+    -------
+    str | None
+        Path to the pyramid directory, None if the source couldn't be downloaded
+    """
+    cache = get_media_disk_cache()
+    source_path = cache.get(url, ext)
+    if not source_path:
+        return None
+
+    name = f"{Path(source_path).stem}_tiles"
+    path = cache.data_dir / name
+    # Pyramids are moved into place once complete, so tile requests don't need the lock
+    if (path / "info.json").is_file():
+        os.utime(path)
+        return str(path)
+
+    with cache.lock(name):
+        if (path / "info.json").is_file():
+            return str(path)
+        # Decoding and encoding hold the GIL, they run in a worker process
+        get_process_pool().submit(build_pyramid, source_path, str(path)).result()
+
+    cache.evict(path)
+    return str(path)
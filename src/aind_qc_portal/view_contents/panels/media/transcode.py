@@ -0,0 +1,261 @@
+"""Background transcoding of video references that browsers can't stream, and their poster frames"""
+
+import os
+import shutil
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import quote
+
+import httpx
+
+from aind_qc_portal.view_contents.panels.media.disk_cache import _hash, get_media_disk_cache, parse_s3_url
+from aind_qc_portal.view_contents.panels.media.pool import get_thread_pool
+
+# Transcoding is disabled when ffmpeg isn't installed, videos are then streamed as they are
+FFMPEG_PATH = os.getenv("QC_PORTAL_FFMPEG", shutil.which("ffmpeg") or "")
+TRANSCODE_WORKERS = int(os.getenv("QC_PORTAL_TRANSCODE_WORKERS", "2"))
+TRANSCODE_TIMEOUT = 60 * 60
+POSTER_TIMEOUT = 60
+POSTER_WIDTH = 1200
+# Formats browsers can't play, these are re-encoded to H.264/AAC. Other mp4s are only remuxed when the moov
+# box (the index) is after the media data, which means the whole file has to download before playback.
+TRANSCODED_EXTENSIONS = (".avi",)
+# The moov box of a faststart mp4 is right after ftyp (and maybe a free box)
+MAX_PROBED_BOXES = 8
+# Successful probes kept, they are repeated after PROBE_CACHE_TTL so that a replaced video is picked up
+PROBE_CACHE_SIZE = 1024
+PROBE_CACHE_TTL = 60 * 60
+
+VIDEO_FILE = "video.mp4"
+POSTER_FILE = "poster.jpg"
+
+# Video name -> futures of its poster frame and streamable copy
+_jobs: dict[str, tuple[Future, Future]] = {}
+_jobs_lock = threading.Lock()
+# (bucket, key, find_moov) -> (expiry time, probe result)
+_probes: OrderedDict[tuple[str, str, bool], tuple[float, tuple[str, bool | None]]] = OrderedDict()
+_probes_lock = threading.Lock()
+
+
+def transcoded_video_url(asset_name: str, reference: str, file_name: str = VIDEO_FILE) -> str:
+    """URL of the streamable copy (video.mp4) or poster frame (poster.jpg) of a video reference"""
+    return f"/media-video/{quote(asset_name, safe='')}/{quote(reference, safe='')}/{file_name}"
+
+
+def is_transcoded_video_url(url) -> bool:
+    """Check if resolved media data is the URL of a streamable copy"""
+    return isinstance(url, str) and url.startswith("/media-video/") and url.endswith(f"/{VIDEO_FILE}")
+
+
+def _read_range(client: httpx.Client, url: str, start: int, length: int) -> httpx.Response:
+    """GET a byte range of an object, without reading the body if the range was ignored"""
+    with client.stream("GET", url, headers={"Range": f"bytes={start}-{start + length - 1}"}) as response:
+        response.raise_for_status()
+        if response.status_code == 206:
+            response.read()
+    return response
+
+
+def probe_video(url: str, find_moov: bool = True) -> tuple[str | None, bool | None]:
+    """Get the ETag of a video, and whether its moov box comes before its media data
+
+    Only the headers of the top-level mp4 boxes are read, with ranged GETs. Successful probes are cached
+    per bucket and key for PROBE_CACHE_TTL, failed ones are retried on the next call.
+
+    Returns
+    -------
+    tuple[str | None, bool | None]
+        ETag (None if the probe failed) and faststart (None if it couldn't be determined)
+    """
+    cache_key = (*parse_s3_url(url), find_moov)
+    now = time.time()
+    with _probes_lock:
+        cached = _probes.get(cache_key)
+        if cached is not None and now < cached[0]:
+            _probes.move_to_end(cache_key)
+            return cached[1]
+
+    result = _probe_video(url, find_moov)
+    if result[0] is not None:
+        with _probes_lock:
+            _probes[cache_key] = (now + PROBE_CACHE_TTL, result)
+            _probes.move_to_end(cache_key)
+            while len(_probes) > PROBE_CACHE_SIZE:
+                _probes.popitem(last=False)
+    return result
+
+
+def _probe_video(url: str, find_moov: bool) -> tuple[str | None, bool | None]:
+    """Probe a video without caching, see probe_video()"""
+    try:
+        with httpx.Client() as client:
+            response = _read_range(client, url, 0, 16)
+            if response.status_code != 206:
+                return None, None
+            etag = response.headers.get("ETag", "").strip('"') or None
+            total = int(response.headers.get("Content-Range", "/0").split("/")[-1] or 0)
+            if not find_moov:
+                return etag, None
+
+            offset, header = 0, response.content
+            for _ in range(MAX_PROBED_BOXES):
+                if len(header) < 8:
+                    break
+                size = int.from_bytes(header[:4], "big")
+                box_type = header[4:8]
+                if box_type == b"moov":
+                    return etag, True
+                if box_type == b"mdat":
+                    return etag, False
+                if size == 1 and len(header) >= 16:
+                    size = int.from_bytes(header[8:16], "big")
+                if size < 8 or offset + size >= total:
+                    break
+                offset += size
+                header = _read_range(client, url, offset, 16).content
+            return etag, None
+    except Exception as e:
+        print(f"[ERROR] Failed to probe video {url}: {e}")
+        return None, None
+
+
+def streamable_name(url: str, reference: str) -> str | None:
+    """Name of the streamable copy of a video in the media disk cache
+
+    Returns
+    -------
+    str | None
+        Name derived from the source's bucket, key and ETag, None if the video can be streamed as it is,
+        if it can't be probed or if ffmpeg isn't available
+    """
+    ext = os.path.splitext(reference)[1].lower()
+    if not FFMPEG_PATH or not url or ext not in TRANSCODED_EXTENSIONS + (".mp4",):
+        return None
+
+    etag, faststart = probe_video(url, find_moov=ext == ".mp4")
+    if not etag or (ext == ".mp4" and faststart is not False):
+        return None
+    return _hash(*parse_s3_url(url), etag)
+
+
+def video_path(name: str, file_name: str = VIDEO_FILE) -> str:
+    """Path of the streamable copy or poster frame of a video in the media disk cache"""
+    return str(get_media_disk_cache().data_dir / f"{name}_{file_name}")
+
+
+def _run_ffmpeg(args: list[str], dest_path: str, timeout: int) -> str | None:
+    """Run ffmpeg writing to a temporary file, then move the output into place"""
+    tmp_path = f"{dest_path}.part"
+    try:
+        subprocess.run(
+            [FFMPEG_PATH, "-y", "-loglevel", "error", *args, tmp_path],
+            check=True,
+            capture_output=True,
+            timeout=timeout,
+        )
+        os.replace(tmp_path, dest_path)
+    except Exception as e:
+        stderr = getattr(e, "stderr", b"") or b""
+        print(f"[ERROR] ffmpeg failed for {dest_path}: {e} {stderr.decode(errors='replace')[-500:]}")
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        return None
+    get_media_disk_cache().evict(dest_path)
+    return dest_path
+
+
+def make_poster(url: str, name: str) -> str | None:
+    """Extract the first frame of a video as a JPEG, reading only the start of the video from S3"""
+    path = video_path(name, POSTER_FILE)
+    cache = get_media_disk_cache()
+    with cache.lock(f"{name}_{POSTER_FILE}"):
+        if os.path.isfile(path):
+            os.utime(path)
+            return path
+        args = ["-i", url, "-frames:v", "1", "-vf", f"scale='min({POSTER_WIDTH},iw)':-2", "-f", "image2"]
+        return _run_ffmpeg(args, path, POSTER_TIMEOUT)
+
+
+def transcode(url: str, name: str, reference: str) -> str | None:
+    """Write a streamable mp4 of a video, remuxing mp4s and re-encoding other formats
+
+    Returns
+    -------
+    str | None
+        Path to the streamable copy, None if ffmpeg failed
+    """
+    path = video_path(name)
+    cache = get_media_disk_cache()
+    with cache.lock(f"{name}_{VIDEO_FILE}"):
+        if os.path.isfile(path):
+            os.utime(path)
+            return path
+        if reference.lower().endswith(".mp4"):
+            codec_args = ["-c", "copy"]
+        else:
+            codec_args = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-pix_fmt", "yuv420p", "-c:a", "aac"]
+        print(f"Transcoding {reference} for streaming")
+        return _run_ffmpeg(["-i", url, *codec_args, "-movflags", "+faststart", "-f", "mp4"], path, TRANSCODE_TIMEOUT)
+
+
+def _prepare(url: str, name: str, reference: str, poster: Future) -> str | None:
+    """Extract the poster frame of a video, which the player shows in the meantime, then write its
+    streamable copy"""
+    try:
+        poster.set_result(make_poster(url, name))
+    except Exception as e:
+        poster.set_exception(e)
+    return transcode(url, name, reference)
+
+
+def _start_job(url: str, name: str, reference: str) -> tuple[Future, Future]:
+    """Start the background job of a video, concurrent calls for the same video share a job"""
+    with _jobs_lock:
+        if name in _jobs:
+            return _jobs[name]
+        poster = Future()
+        video = get_thread_pool("media-transcode", TRANSCODE_WORKERS).submit(_prepare, url, name, reference, poster)
+        _jobs[name] = (poster, video)
+
+    def forget(_):
+        """Drop the finished job, the output is found on disk from now on"""
+        with _jobs_lock:
+            _jobs.pop(name, None)
+        if not poster.done():
+            # The job never ran
+            poster.set_result(None)
+
+    video.add_done_callback(forget)
+    return poster, video
+
+
+def start_transcode(url: str, name: str, reference: str) -> Future:
+    """Transcode a video in the background, after extracting its poster frame
+
+    Returns
+    -------
+    Future
+        Resolves to the path of the streamable copy, or None if transcoding failed
+    """
+    return _start_job(url, name, reference)[1]
+
+
+def start_poster(url: str, name: str, reference: str) -> Future:
+    """Get the poster frame of a video, extracting it in the video's background job if it isn't cached
+
+    Returns
+    -------
+    Future
+        Resolves to the path of the poster frame, or None if it couldn't be extracted
+    """
+    path = video_path(name, POSTER_FILE)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return _start_job(url, name, reference)[0]
+    future = Future()
+    future.set_result(path)
+    return future
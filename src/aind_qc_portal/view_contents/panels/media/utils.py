@@ -1,20 +1,148 @@
 """Util functions"""
 
 import os
-import tempfile
-from urllib.parse import quote, unquote
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, quote, unquote, urlparse
 
 import boto3
-import httpx
 import panel as pn
 import param
 import requests
 from panel.custom import JSComponent
 from panel.reactive import ReactiveHTML
 
+from aind_qc_portal.view_contents.panels.media.disk_cache import get_media_disk_cache
+
+S3_REGION = "us-west-2"
+CODEOCEAN_ROLE_ARN = "arn:aws:iam::467914378000:role/AindCodeOceanBucketCrossAccountAccess"
+# Assumed-role clients are replaced this long before their credentials expire. URLs they sign stop working
+# when the credentials expire, so this is kept above PRESIGNED_URL_MARGIN for their URLs to be usable.
+CREDENTIAL_REFRESH_MARGIN = 15 * 60
+# After a failed role assumption the default credentials are used for this long before trying again
+ASSUME_ROLE_RETRY_INTERVAL = 5 * 60
+
+
+class S3ClientPool:
+    """Thread-safe pool of S3 clients keyed by (region, role)
+
+    boto3 clients are thread-safe once created but expensive to build, so one client is shared per key.
+    Clients using an assumed role are rebuilt shortly before their credentials expire. If the role can't
+    be assumed the default credentials are used and the role is retried later.
+    """
+
+    def __init__(self):
+        """Initialize an empty pool"""
+        self._clients = {}  # (region, role_arn) -> (client, refresh_at or None, expires_at or None)
+        self._key_locks = {}  # (region, role_arn) -> lock held while creating its client
+        self._lock = threading.Lock()
+
+    def get(self, region: str = S3_REGION, role_arn: str | None = None):
+        """Get the pooled client for a region and role, creating or refreshing it if needed
+
+        Parameters
+        ----------
+        region : str
+        role_arn : str, optional
+            Role to assume, the default credential chain is used when None
+
+        Returns
+        -------
+        boto3.client
+        """
+        return self.get_with_expiry(region, role_arn)[0]
+
+    def get_with_expiry(self, region: str = S3_REGION, role_arn: str | None = None):
+        """Get the pooled client for a region and role, and the time at which its credentials expire
+
+        Parameters
+        ----------
+        region : str
+        role_arn : str, optional
+            Role to assume, the default credential chain is used when None
+
+        Returns
+        -------
+        tuple[boto3.client, float | None]
+            Client and Unix timestamp of its credentials' expiration, None for the default credentials
+        """
+        key = (region, role_arn)
+        with self._lock:
+            entry = self._fresh_entry(key)
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        if entry is not None:
+            return entry[0], entry[2]
+
+        # Creating a client can call STS, only callers of the same key wait for it
+        with key_lock:
+            with self._lock:
+                entry = self._fresh_entry(key)
+            if entry is None:
+                entry = self._create_client(region, role_arn)
+                with self._lock:
+                    self._clients[key] = entry
+        return entry[0], entry[2]
+
+    def _fresh_entry(self, key):
+        """Get the pooled entry of a key if it doesn't need replacing yet, call with the pool lock held"""
+        entry = self._clients.get(key)
+        if entry is not None and (entry[1] is None or time.time() < entry[1]):
+            return entry
+        return None
+
+    def clear(self):
+        """Drop all pooled clients"""
+        with self._lock:
+            self._clients = {}
+
+    @staticmethod
+    def _create_client(region: str, role_arn: str | None):
+        """Create a client, the time at which it should be replaced and the time at which its credentials
+        expire (None to keep it forever / for credentials managed by boto3)"""
+        config = boto3.session.Config(signature_version="s3v4")
+
+        if role_arn:
+            try:
+                sts_client = boto3.session.Session().client("sts")
+                response = sts_client.assume_role(
+                    RoleArn=role_arn,
+                    RoleSessionName="qc-portal-session",
+                )
+                creds = response["Credentials"]
+                role_session = boto3.session.Session(
+                    aws_access_key_id=creds["AccessKeyId"],
+                    aws_secret_access_key=creds["SecretAccessKey"],
+                    aws_session_token=creds["SessionToken"],
+                )
+                expires_at = creds["Expiration"].timestamp()
+                client = role_session.client("s3", region_name=region, config=config)
+                return client, expires_at - CREDENTIAL_REFRESH_MARGIN, expires_at
+            except Exception as e:
+                print(f"[S3ClientPool] Failed to assume role {role_arn}, using default credentials: {e}")
+                client = boto3.session.Session().client("s3", region_name=region, config=config)
+                return client, time.time() + ASSUME_ROLE_RETRY_INTERVAL, None
+
+        return boto3.session.Session().client("s3", region_name=region, config=config), None, None
+
+
+_S3_CLIENT_POOL = S3ClientPool()
+
+
+def get_s3_role(reference=None):
+    """Get the role to assume for a reference, None to use the default credentials
+
+    Code Ocean buckets are read through a cross-account role, unless BYPASS_CODEOCEAN_S3=1 (local dev).
+    """
+    if not reference or "codeocean" not in reference:
+        return None
+    if os.getenv("BYPASS_CODEOCEAN_S3", "0") == "1":
+        return None
+    return CODEOCEAN_ROLE_ARN
+
 
 def get_s3_client(reference=None):
-    """Get a fresh boto3 S3 client with current credentials
+    """Get a pooled boto3 S3 client with current credentials
 
     Parameters
     ----------
@@ -26,44 +154,29 @@ def get_s3_client(reference=None):
     Returns
     -------
     boto3.client
-        Fresh S3 client with current credentials
+        Shared S3 client, safe to use from multiple threads
     """
-    use_codeocean = reference and "codeocean" in reference
+    return _S3_CLIENT_POOL.get(S3_REGION, get_s3_role(reference))
 
-    # if os.getenv("BYPASS_CODEOCEAN_S3", "0") == "1":
-    return boto3.client(
-        "s3",
-        region_name="us-west-2",
-        config=boto3.session.Config(signature_version="s3v4"),
-    )
 
-    if use_codeocean:
-        sts_client = boto3.client("sts")
-        response = sts_client.assume_role(
-            RoleArn="arn:aws:iam::467914378000:role/AindCodeOceanBucketCrossAccountAccess",
-            RoleSessionName="qc-portal-session",
-        )
-        creds = response["Credentials"]
-
-        role_session = boto3.Session(
-            aws_access_key_id=creds["AccessKeyId"],
-            aws_secret_access_key=creds["SecretAccessKey"],
-            aws_session_token=creds["SessionToken"],
-        )
-        return role_session.client(
-            "s3",
-            region_name="us-west-2",
-            config=boto3.session.Config(signature_version="s3v4"),
-        )
-    else:
-        return boto3.client(
-            "s3",
-            region_name="us-west-2",
-            config=boto3.session.Config(signature_version="s3v4"),
-        )
+def get_s3_client_with_expiry(reference=None):
+    """Get a pooled boto3 S3 client like get_s3_client(), and the time at which its credentials expire
+
+    Returns
+    -------
+    tuple[boto3.client, float | None]
+        Client and Unix timestamp of its credentials' expiration, None for the default credentials
+    """
+    return _S3_CLIENT_POOL.get_with_expiry(S3_REGION, get_s3_role(reference))
 
 
 MEDIA_TTL = 60 * 60  # 1 hour
+# Presigned URLs are shared by all sessions and reused within fixed time windows, so an asset gets a
+# byte-identical URL (which browsers can cache) for the whole window. URLs are signed for MEDIA_TTL, so
+# they stay valid for at least PRESIGNED_URL_MARGIN after their window ends. URLs signed with assumed-role
+# credentials are signed only until the credentials expire, and are replaced PRESIGNED_URL_MARGIN before.
+PRESIGNED_URL_MARGIN = 10 * 60
+PRESIGNED_URL_WINDOW = MEDIA_TTL - PRESIGNED_URL_MARGIN
 KACHERY_ZONE = os.getenv("KACHERY_ZONE", "aind")
 FULLSCREEN_CSS = """
 :not(:root):fullscreen::backdrop {
@@ -184,17 +297,29 @@ function requestFullScreen(element) {
     }
 }
 
-function findIframesDeep(root) {
+function findDeep(root, selector) {
     const results = [];
-    root.querySelectorAll('iframe').forEach(function(el) { results.push(el); });
+    root.querySelectorAll(selector).forEach(function(el) { results.push(el); });
     root.querySelectorAll('*').forEach(function(el) {
         if (el.shadowRoot) {
-            findIframesDeep(el.shadowRoot).forEach(function(f) { results.push(f); });
+            findDeep(el.shadowRoot, selector).forEach(function(f) { results.push(f); });
         }
     });
     return results;
 }
 
+function findIframesDeep(root) {
+    return findDeep(root, 'iframe');
+}
+
+// Previews are swapped for the full resolution image the first time they are shown fullscreen
+function loadFullResolution(root) {
+    findDeep(root, 'img[data-full-src]').forEach(function(img) {
+        img.src = img.dataset.fullSrc;
+        img.removeAttribute('data-full-src');
+    });
+}
+
 function applyToAllDeep(root, w, h) {
     root.querySelectorAll('*').forEach(function(el) {
         if (el.tagName === 'IMG' || el.tagName === 'VIDEO' || el.tagName === 'SVG') return;
@@ -232,6 +357,7 @@ function applyFullscreenSizes(container) {
     objectContainer.style.setProperty('width',  w + 'px', 'important');
     objectContainer.style.setProperty('height', h + 'px', 'important');
     applyToAllDeep(objectContainer, w, h);
+    loadFullResolution(objectContainer);
     findIframesDeep(objectContainer).forEach(function(iframe) {
         iframe.style.setProperty('width',      w + 'px', 'important');
         iframe.style.setProperty('height',     h + 'px', 'important');
@@ -313,6 +439,11 @@ def reference_is_pdf(reference):
     return reference.endswith(".pdf")
 
 
+def reference_is_volume(reference):
+    """Check if the reference is a volume, an H5 file or a Zarr/N5 store"""
+    return reference.rstrip("/").endswith((".h5", ".hdf5", ".zarr", ".n5"))
+
+
 def clean_reference_prefix(reference: str):
     """Remove results/ prefix from reference"""
     if "results/" in reference:
@@ -328,8 +459,34 @@ def clean_reference_url(reference: str):
     return reference
 
 
-def is_presigned_url_valid(url: str) -> bool:
-    """Check if a presigned S3 URL is valid"""
+def get_presigned_url_expiry(url: str) -> float | None:
+    """Get the expiry time of a presigned S3 URL from its query parameters
+
+    Parameters
+    ----------
+    url : str
+
+    Returns
+    -------
+    float | None
+        Unix timestamp at which the URL expires, None if the URL isn't presigned
+    """
+    query = parse_qs(urlparse(url).query)
+    try:
+        if "X-Amz-Date" in query and "X-Amz-Expires" in query:
+            # SigV4: signing time plus lifetime in seconds
+            signed_at = datetime.strptime(query["X-Amz-Date"][0], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+            return signed_at.timestamp() + int(query["X-Amz-Expires"][0])
+        if "Expires" in query and ("Signature" in query or "AWSAccessKeyId" in query):
+            # SigV2: absolute expiry time
+            return float(query["Expires"][0])
+    except ValueError:
+        return None
+    return None
+
+
+def _probe_url(url: str) -> bool:
+    """Check that a URL can be fetched by requesting its first byte"""
     try:
         # Use GET with Range header to fetch only 1 byte instead of HEAD
         # S3 presigned URLs with SignedHeaders=host fail with HEAD due to extra headers
@@ -337,20 +494,49 @@ def is_presigned_url_valid(url: str) -> bool:
         response = requests.get(url, headers=headers, allow_redirects=True, timeout=5)
 
         # Valid URLs return 200 OK, 206 Partial Content, or 416 Range Not Satisfiable
-        if response.status_code in (200, 206, 416):
-            return True
-
-        # Expired or invalid URLs from S3 return 403 Forbidden
-        # with specific S3 error codes in headers or body
-        if response.status_code == 403:
-            return False
+        # Expired or invalid URLs from S3 return 403 Forbidden, other codes may indicate other problems
+        return response.status_code in (200, 206, 416)
 
-        # Other codes may indicate permissions or other problems
+    except requests.RequestException:
         return False
 
-    except requests.RequestException:
+
+def is_presigned_url_valid(url: str, margin: float = 0, probe: bool = False) -> bool:
+    """Check if a presigned S3 URL is valid
+
+    The expiry is read from the URL's signing parameters, no request is made for presigned URLs.
+
+    Parameters
+    ----------
+    url : str
+    margin : float, optional
+        Seconds the URL must still be valid for, by default 0
+    probe : bool, optional
+        Fetch the first byte of URLs that aren't presigned to check that they are reachable, by default
+        False, in which case they are assumed to be valid
+
+    Returns
+    -------
+    bool
+    """
+    if not isinstance(url, str) or not url.startswith(("http://", "https://")):
         return False
 
+    expiry = get_presigned_url_expiry(url)
+    if expiry is not None:
+        return time.time() + margin < expiry
+
+    return _probe_url(url) if probe else True
+
+
+_presigned_url_cache = {"window": None, "urls": {}}
+_presigned_url_lock = threading.Lock()
+
+
+def media_proxy_url(asset_name: str, reference: str) -> str:
+    """Stable URL of a metric reference on the /media streaming proxy route"""
+    return f"/media/{quote(asset_name, safe='')}/{quote(reference, safe='')}"
+
 
 def get_s3_url(bucket, key):
     """Get a presigned URL to an S3 asset
@@ -365,31 +551,37 @@ def get_s3_url(bucket, key):
     if not bucket or not key:
         return None
 
-    client = get_s3_client(bucket)
+    now = time.time()
+    window = int(now // PRESIGNED_URL_WINDOW)
+    with _presigned_url_lock:
+        if _presigned_url_cache["window"] == window and (bucket, key) in _presigned_url_cache["urls"]:
+            url, expires_at = _presigned_url_cache["urls"][(bucket, key)]
+            if now + PRESIGNED_URL_MARGIN < expires_at:
+                return url
+
+    client, credentials_expire_at = get_s3_client_with_expiry(bucket)
+    expires_in = MEDIA_TTL
+    if credentials_expire_at is not None:
+        # A URL stops working when the credentials that signed it expire, sign it for no longer than that
+        expires_in = max(1, min(MEDIA_TTL, int(credentials_expire_at - now)))
     url = client.generate_presigned_url(
         "get_object",
         Params={"Bucket": bucket, "Key": key},
-        ExpiresIn=MEDIA_TTL,
+        ExpiresIn=expires_in,
     )
+
+    with _presigned_url_lock:
+        # Only the current window is kept, which also bounds the size of the cache
+        if _presigned_url_cache["window"] != window:
+            _presigned_url_cache["window"] = window
+            _presigned_url_cache["urls"] = {}
+        _presigned_url_cache["urls"][(bucket, key)] = (url, now + expires_in)
     return url
 
 
 def _get_s3_file(url, ext):
-    """Get an S3 file from the given URL synchronously"""
-    try:
-        with httpx.Client() as client:
-            response = client.get(url)
-
-        if response.status_code == 200:
-            with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as temp_file:
-                temp_file.write(response.content)
-            return temp_file.name
-        else:
-            print(f"[ERROR] Failed to fetch asset {url}: {response.status_code} / {response.text}")
-            return None
-    except Exception as e:
-        print(f"[ERROR] Failed to fetch asset {url}, error: {e}")
-        return None
+    """Get an S3 file from the given URL synchronously, through the shared on-disk media cache"""
+    return get_media_disk_cache().get(url, ext)
 
 
 def encode_url(url):
@@ -440,6 +632,182 @@ def _parse_sortingview(reference, data, media_obj):
     )
 
 
+class TileViewer(JSComponent):
+    """Pan/zoom viewer for tile pyramids (see tiles.py), only the visible tiles are fetched
+
+    Scroll to zoom, drag to pan and double-click to fit the image. The single-tile top level of the pyramid
+    is drawn under the current level, so there is always something to see while tiles load.
+    """
+
+    info_url = param.String(default="", doc="URL of the pyramid's info.json, tiles are fetched next to it")
+
+    _esm = r"""
+    const MAX_TILES = 512;
+
+    export function render({ model }) {
+      const canvas = document.createElement("canvas");
+      canvas.style.cssText = "width: 100%; height: 100%; display: block; cursor: grab; touch-action: none;";
+      const ctx = canvas.getContext("2d");
+      const tiles = new Map();
+      let info = null;
+      let message = "Loading...";
+      // Image pixel at the top-left of the canvas and canvas (CSS) pixels per image pixel
+      let view = { x: 0, y: 0, scale: 1 };
+      let drawRequested = false;
+
+      function tileUrl(level, col, row) {
+        const [path, query] = model.info_url.split("?");
+        return `${path.replace(/info\.json$/, `${level}/${col}_${row}.webp`)}?${query}`;
+      }
+
+      function getTile(level, col, row) {
+        const key = `${level}/${col}_${row}`;
+        let tile = tiles.get(key);
+        if (tile) {
+          // Re-insert so the Map stays in least recently used order
+          tiles.delete(key);
+        } else {
+          tile = new Image();
+          tile.onload = requestDraw;
+          tile.src = tileUrl(level, col, row);
+        }
+        tiles.set(key, tile);
+        if (tiles.size > MAX_TILES) {
+          tiles.delete(tiles.keys().next().value);
+        }
+        return tile;
+      }
+
+      function drawLevel(level) {
+        const [width, height] = info.levels[level];
+        const factor = 2 ** level;
+        const size = info.tile_size;
+        const x0 = Math.max(0, view.x / factor);
+        const y0 = Math.max(0, view.y / factor);
+        const x1 = Math.min(width, (view.x + canvas.clientWidth / view.scale) / factor);
+        const y1 = Math.min(height, (view.y + canvas.clientHeight / view.scale) / factor);
+        for (let row = Math.floor(y0 / size); row * size < y1; row++) {
+          for (let col = Math.floor(x0 / size); col * size < x1; col++) {
+            const tile = getTile(level, col, row);
+            if (!tile.complete || !tile.naturalWidth) continue;
+            ctx.drawImage(
+              tile,
+              (col * size * factor - view.x) * view.scale,
+              (row * size * factor - view.y) * view.scale,
+              tile.naturalWidth * factor * view.scale,
+              tile.naturalHeight * factor * view.scale,
+            );
+          }
+        }
+      }
+
+      function draw() {
+        drawRequested = false;
+        const dpr = window.devicePixelRatio || 1;
+        ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+        ctx.clearRect(0, 0, canvas.clientWidth, canvas.clientHeight);
+        if (!info) {
+          ctx.fillText(message, 10, 20);
+          return;
+        }
+        const top = info.levels.length - 1;
+        const level = Math.min(top, Math.max(0, Math.floor(Math.log2(1 / (view.scale * dpr)))));
+        drawLevel(top);
+        if (level !== top) drawLevel(level);
+      }
+
+      function requestDraw() {
+        if (drawRequested) return;
+        drawRequested = true;
+        requestAnimationFrame(draw);
+      }
+
+      function fitScale() {
+        return Math.min(canvas.clientWidth / info.width, canvas.clientHeight / info.height);
+      }
+
+      function fit() {
+        if (!info) return;
+        view.scale = fitScale();
+        view.x = (info.width - canvas.clientWidth / view.scale) / 2;
+        view.y = (info.height - canvas.clientHeight / view.scale) / 2;
+        requestDraw();
+      }
+
+      function resize() {
+        const dpr = window.devicePixelRatio || 1;
+        canvas.width = Math.max(1, Math.round(canvas.clientWidth * dpr));
+        canvas.height = Math.max(1, Math.round(canvas.clientHeight * dpr));
+        requestDraw();
+      }
+
+      canvas.addEventListener("wheel", (event) => {
+        if (!info) return;
+        event.preventDefault();
+        const rect = canvas.getBoundingClientRect();
+        const mx = event.clientX - rect.left;
+        const my = event.clientY - rect.top;
+        // Keep the image pixel under the cursor in place
+        const px = view.x + mx / view.scale;
+        const py = view.y + my / view.scale;
+        const scale = view.scale * Math.exp(-event.deltaY * 0.002);
+        view.scale = Math.min(8, Math.max(fitScale() / 2, scale));
+        view.x = px - mx / view.scale;
+        view.y = py - my / view.scale;
+        requestDraw();
+      }, { passive: false });
+
+      let drag = null;
+      canvas.addEventListener("pointerdown", (event) => {
+        drag = { x: event.clientX, y: event.clientY };
+        canvas.setPointerCapture(event.pointerId);
+        canvas.style.cursor = "grabbing";
+      });
+      canvas.addEventListener("pointermove", (event) => {
+        if (!drag) return;
+        view.x -= (event.clientX - drag.x) / view.scale;
+        view.y -= (event.clientY - drag.y) / view.scale;
+        drag = { x: event.clientX, y: event.clientY };
+        requestDraw();
+      });
+      const endDrag = () => {
+        drag = null;
+        canvas.style.cursor = "grab";
+      };
+      canvas.addEventListener("pointerup", endDrag);
+      canvas.addEventListener("pointercancel", endDrag);
+      canvas.addEventListener("dblclick", fit);
+
+      new ResizeObserver(() => {
+        resize();
+        if (info && view.scale < fitScale()) fit();
+      }).observe(canvas);
+
+      function load() {
+        info = null;
+        message = "Loading...";
+        tiles.clear();
+        requestDraw();
+        if (!model.info_url) return;
+        fetch(model.info_url)
+          .then((response) => (response.ok ? response.json() : Promise.reject(response.status)))
+          .then((data) => {
+            info = data;
+            fit();
+          })
+          .catch((error) => {
+            message = `Failed to load image tiles (${error})`;
+            requestDraw();
+          });
+      }
+
+      model.on("info_url", load);
+      load();
+      return canvas;
+    }
+"""
+
+
 class CurationData(JSComponent):
     """A CurationData component that allows the user to toggle curation data."""
 
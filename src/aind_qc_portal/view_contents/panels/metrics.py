@@ -14,8 +14,20 @@ from aind_qc_portal.utils import df_scalar_to_list, replace_markdown_with_html
 from aind_qc_portal.view_contents.data import ViewData, decode_dict_value
 from aind_qc_portal.view_contents.panels.media.curation_apps.curation import EphysCuration, GenericCuration
 from aind_qc_portal.view_contents.panels.media.media import Media
+from aind_qc_portal.view_contents.panels.media.prefetch import MediaPrefetcher, resolve_in_background
 from aind_qc_portal.view_contents.panels.metric.metric import CustomMetricValue
 
+# Number of tabs built per page when a tree node is selected, further tabs are built on "Load more"
+METRIC_TAB_PAGE_SIZE = 20
+# Number of references prefetched for each neighbouring tree node when prefetching is enabled
+PREFETCH_REFERENCES_PER_NODE = 4
+# Number of tabs on each side of an opened tab whose media is prefetched when prefetching is enabled
+PREFETCH_TABS_AROUND_OPEN = 2
+# Number of tabs at the start of a selection whose media is resolved concurrently when it is shown
+RESOLVE_TABS_ON_SHOW = 4
+# Number of metric names listed under the search box while typing
+SEARCH_PREVIEW_SIZE = 10
+
 
 class MetricValue(PyComponent):
     """Panel for displaying a single metric value with status"""
@@ -242,6 +254,13 @@ class MetricTab(PyComponent):
         # The actual submission is handled by the MetricValue's callback mechanism
         print("MetricTab: Changes detected from interactive media")
 
+    def load(self):
+        """Load the media when the tab is opened"""
+        self.tab_media.load()
+
+    def unload(self):
+        """Media stays loaded when the tab is closed, so that re-opening it is instant"""
+
     def __panel__(self):
         """Create and return the MetricTab panel"""
         value_col = pn.Column(*self.tab_values, width=METRIC_VALUE_WIDTH + MARGIN)
@@ -262,6 +281,20 @@ class CurationTab(PyComponent):
         self.tab_name = name
         self.curation_panel = curation_panel
 
+    def load(self):
+        """Mount the ephys GUI iframe when the tab is opened"""
+        if isinstance(self.curation_panel, EphysCuration):
+            self.curation_panel.load_iframe()
+
+    def unload(self):
+        """Remove the ephys GUI iframe when the tab is closed
+
+        Each iframe boots a full ephys GUI app, keeping them all mounted can OOM the browser
+        when an asset has many probes.
+        """
+        if isinstance(self.curation_panel, EphysCuration):
+            self.curation_panel.unload_iframe()
+
     def __panel__(self):
         """Create and return the CurationTab panel"""
         return pn.Column(
@@ -313,6 +346,25 @@ def get_tag_keys_from_level(level):
         return level
 
 
+def get_status_palette_color(status: str):
+    """Get the theme palette color of a tree item for a given status, see TREE_STATUS_SX"""
+    if status == "Fail":
+        return "error"
+    elif status == "Pending":
+        return "info"
+    else:  # Pass
+        return "success"
+
+
+# Tree items carry their status as a palette color (rendered as data-color), icons are colored from it
+TREE_STATUS_SX = {
+    f"& [data-color='{get_status_palette_color(status)}'] .labelIcon": {
+        "color": f"{get_status_color(status)} !important"
+    }
+    for status in ("Pass", "Fail", "Pending")
+}
+
+
 def get_status_icon(status: str):
     """Get the icon name for a given status"""
     if status == "Fail":
@@ -323,6 +375,21 @@ def get_status_icon(status: str):
         return "check_circle"
 
 
+def group_metrics_by_reference(metrics):
+    """Group metric rows by their reference, preserving the order in which references first appear
+
+    Args:
+        metrics: List of metric row dictionaries
+
+    Returns:
+        Dictionary mapping reference to lists of metric rows
+    """
+    reference_to_rows = {}
+    for row in metrics:
+        reference_to_rows.setdefault(row.get("reference"), []).append(row)
+    return reference_to_rows
+
+
 def group_metrics_by_tags(metrics, tag_keys):
     """Group metrics by tag keys, returning a dict mapping (tag_key, tag_value) to metric rows
 
@@ -387,6 +454,7 @@ def build_tree_level(grouping_levels, metrics, level_idx, path_prefix="", status
             "id": node_id,
             "label": f"{tag_key}: {tag_value} ({len(node_metrics)})",
             "icon": get_status_icon(aggregated_status),
+            "color": get_status_palette_color(aggregated_status),
             "metric_rows": node_metrics,
             "status": aggregated_status,
         }
@@ -399,6 +467,29 @@ def build_tree_level(grouping_levels, metrics, level_idx, path_prefix="", status
     return nodes if nodes else None
 
 
+def update_tree_statuses(nodes, status_df):
+    """Recursively update the aggregated status and icon of tree nodes in place"""
+    if not nodes:
+        return
+
+    for node in nodes:
+        metric_rows = node.get("metric_rows", [])
+
+        if metric_rows:
+            aggregated_status = aggregate_status(metric_rows, status_df)
+            node["status"] = aggregated_status
+            node["icon"] = get_status_icon(aggregated_status)
+            node["color"] = get_status_palette_color(aggregated_status)
+
+        if "items" in node:
+            update_tree_statuses(node["items"], status_df)
+
+
+def get_grouping_key(grouping_levels):
+    """Get a hashable key for a grouping, treating a single tag key and a one-element tuple as equal"""
+    return tuple(tuple(get_tag_keys_from_level(level)) for level in grouping_levels)
+
+
 def collect_all_paths(nodes, current_path=()):
     """Helper function to collect all expandable paths"""
     paths = []
@@ -432,13 +523,25 @@ class Metrics(PyComponent):
         self.settings = settings
         self.media_cache = {}
         self._syncing = False
+        self._pending_tabs = []
+        self._rendered_tabs = []
+        self.accordion = None
+        self.prefetcher = MediaPrefetcher()
+        self._open_tab = None
+        self._all_metrics = None
+        self._tree_cache = {}
+        self._stale_tree_keys = set()
 
         self._init_panel_objects()
         self._build_tree()
 
+        # Prebuild the record's own grouping so switching back to it is instant
+        self._get_tree_nodes(self.data.default_grouping)
+
         pn.state.location.sync(self, {"active_path": "active_path"})
 
         self.settings.param.watch(self._on_grouping_change, "default_grouping")
+        self.settings.param.watch(self._on_prefetch_media_change, "prefetch_media")
 
     def _handle_change(self, metric_name: str, column_name: str, value: str):
         """Wrapper for change callback that updates tree icons after submitting changes"""
@@ -456,6 +559,7 @@ class Metrics(PyComponent):
             styles=OUTER_STYLE,
             active=[],
             max_width=300,
+            sx=TREE_STATUS_SX,
             # sizing_mode="stretch_height",
         )
 
@@ -465,6 +569,18 @@ class Metrics(PyComponent):
             sizing_mode="stretch_width",
         )
 
+        self.load_more_button = pn.widgets.Button(name="Load more", button_type="primary", visible=False)
+        self.load_more_button.on_click(self._on_load_more)
+
+        self.search_input = pn.widgets.TextInput(
+            name="Search",
+            placeholder="e.g. drift status:Pending",
+            max_width=300,
+        )
+        self.search_results = pn.pane.Markdown("", max_width=300)
+        self.search_input.param.watch(self._on_search_input, "value_input")
+        self.search_input.param.watch(self._on_search_submit, "value")
+
         self.tree.param.watch(self._on_tree_selection, "active")
         self.param.watch(self._restore_active_from_url, "active_path")
 
@@ -472,6 +588,36 @@ class Metrics(PyComponent):
         """Rebuild tree when default_grouping changes"""
         self._build_tree()
 
+    def _on_prefetch_media_change(self, event):
+        """Start or stop prefetching media for the nodes next to the current selection"""
+        if event.new and self.tree.active:
+            self._prefetch_neighbours(self.tree.active[0])
+        else:
+            self.prefetcher.cancel()
+
+    def _on_search_input(self, event):
+        """Preview the best matches while the user types"""
+        if not event.new:
+            self.search_results.object = ""
+            return
+
+        matches, total = self.data.search_metrics(event.new, limit=SEARCH_PREVIEW_SIZE)
+        preview = [f"- {row.get('name')}" for row in matches]
+        if total > SEARCH_PREVIEW_SIZE:
+            preview.append(f"- *... {total - SEARCH_PREVIEW_SIZE} more*")
+        self.search_results.object = "\n".join([f"**{total} matches** (press Enter to show)"] + preview)
+
+    def _on_search_submit(self, event):
+        """Show all metrics matching the search query"""
+        if not event.new:
+            return
+
+        matches, _ = self.data.search_metrics(event.new)
+        if matches:
+            self._show_metric_rows(matches)
+        else:
+            self.content_panel.objects = [pn.pane.Markdown(f"*No metrics match '{event.new}'*")]
+
     def _restore_active_from_url(self, event=None):
         """Restore tree selection from URL parameter after tree is built"""
         if self._syncing or not self.active_path or not self.tree.items:
@@ -500,12 +646,29 @@ class Metrics(PyComponent):
         finally:
             self._syncing = False
 
+    def _get_tree_nodes(self, grouping_levels):
+        """Get the tree nodes for a grouping, building them only the first time a grouping is used
+
+        Status edits don't change the tree structure, cached trees that were marked stale by an edit only
+        have their statuses and icons refreshed.
+        """
+        key = get_grouping_key(grouping_levels)
+
+        if key not in self._tree_cache:
+            if self._all_metrics is None:
+                self._all_metrics = [row for _, row in self.data.dataframe.iterrows()]
+            self._tree_cache[key] = build_tree_level(
+                grouping_levels, self._all_metrics, 0, status_df=self.data.metric_status
+            )
+        elif key in self._stale_tree_keys:
+            update_tree_statuses(self._tree_cache[key], self.data.metric_status)
+
+        self._stale_tree_keys.discard(key)
+        return self._tree_cache[key]
+
     def _build_tree(self):
         """Build tree structure based on default_grouping tags"""
-        grouping_levels = self.settings.default_grouping
-
-        all_metrics = [row for _, row in self.data.dataframe.iterrows()]
-        tree_nodes = build_tree_level(grouping_levels, all_metrics, 0, status_df=self.data.metric_status)
+        tree_nodes = self._get_tree_nodes(self.settings.default_grouping)
 
         self.tree.items = tree_nodes if tree_nodes else []
 
@@ -523,35 +686,9 @@ class Metrics(PyComponent):
 
     def _update_tree_icons(self):
         """Update tree icons based on current metric_status without rebuilding the entire tree"""
-
-        def update_node_recursive(nodes):
-            """Recursively update node icons and statuses"""
-            if not nodes:
-                return
-
-            for node in nodes:
-                # Get metrics for this node
-                metric_rows = node.get("metric_rows", [])
-
-                if metric_rows:
-                    # Recalculate aggregated status
-                    aggregated_status = aggregate_status(metric_rows, self.data.metric_status)
-
-                    # Update icon based on status
-                    if aggregated_status == "Fail":
-                        icon = "cancel"
-                    elif aggregated_status == "Pending":
-                        icon = "help"
-                    else:  # Pass
-                        icon = "check_circle"
-
-                    # Update node
-                    node["status"] = aggregated_status
-                    node["icon"] = icon
-
-                # Recurse into children
-                if "items" in node:
-                    update_node_recursive(node["items"])
+        # Other cached trees are refreshed when they are next shown
+        current_key = get_grouping_key(self.settings.default_grouping)
+        self._stale_tree_keys.update(key for key in self._tree_cache if key != current_key)
 
         # Update all nodes in the tree
         if self.tree.items:
@@ -560,7 +697,7 @@ class Metrics(PyComponent):
             current_active = self.tree.active
 
             current_items = self.tree.items
-            update_node_recursive(current_items)
+            update_tree_statuses(current_items, self.data.metric_status)
             # Force refresh by reassigning
             self.tree.items = []
             self.tree.items = current_items
@@ -569,52 +706,48 @@ class Metrics(PyComponent):
             self.tree.expanded = current_expanded
             self.tree.active = current_active
 
-    def _build_qc_metric_tabs(self, qc_metrics):
-        """Build tabs for QC metrics
+    def _get_media_panel(self, reference):
+        """Get the Media object for a reference, creating it without loading if it isn't cached yet"""
+        if reference not in self.media_cache:
+            self.media_cache[reference] = Media(
+                reference,
+                s3_bucket=self.data.s3_bucket,
+                s3_prefix=self.data.s3_prefix,
+                raw_s3_loc=self.data.raw_s3_location,
+                lazy_load=True,
+                # Previews are served by validating the reference against DocDB, so not for temporary records
+                asset_name=self.data.asset_name if self.data.from_docdb else None,
+            )
+        return self.media_cache[reference]
+
+    def _build_qc_metric_tabs(self, reference_groups):
+        """Build tabs for QC metrics, media is not loaded until the tab is opened
 
         Args:
-            qc_metrics: List of QC metric row dictionaries
+            reference_groups: List of (reference, metric rows) tuples, one tab is built per reference
 
         Returns:
             List of (tab_name, tab) tuples
         """
         tabs = []
-        reference_to_values = {}
-
-        for row in qc_metrics:
-            reference = row.get("reference")
-
-            value_panel = MetricValue(
-                name=row["name"],
-                description=row["description"],
-                value=decode_dict_value(row["value"]),
-                tags=decode_dict_value(row["tags"]),
-                stage=row["stage"],
-                modality=row["modality"]["abbreviation"],
-                status=row["status_history"][-1]["status"],
-                callback=self.callback,
-                settings=self.settings,
-            )
-
-            if reference not in reference_to_values:
-                reference_to_values[reference] = []
-            reference_to_values[reference].append(value_panel)
 
-        for reference, value_panels in reference_to_values.items():
-            if reference not in self.media_cache:
-                media_panel = Media(
-                    reference,
-                    s3_bucket=self.data.s3_bucket,
-                    s3_prefix=self.data.s3_prefix,
-                    raw_s3_loc=self.data.raw_s3_location,
-                    lazy_load=True,
+        for reference, rows in reference_groups:
+            value_panels = [
+                MetricValue(
+                    name=row["name"],
+                    description=row["description"],
+                    value=decode_dict_value(row["value"]),
+                    tags=decode_dict_value(row["tags"]),
+                    stage=row["stage"],
+                    modality=row["modality"]["abbreviation"],
+                    status=row["status_history"][-1]["status"],
+                    callback=self.callback,
+                    settings=self.settings,
                 )
-                self.media_cache[reference] = media_panel
-            else:
-                media_panel = self.media_cache[reference]
+                for row in rows
+            ]
 
-            if not media_panel.loaded:
-                media_panel.load()
+            media_panel = self._get_media_panel(reference)
 
             tab_name = f"({media_panel.media_type}: {reference})" if reference else "Metrics"
             tab = MetricTab(name=tab_name, metric_media=media_panel, metric_values=value_panels)
@@ -721,182 +854,126 @@ class Metrics(PyComponent):
         if not metric_rows:
             return
 
+        self._show_metric_rows(metric_rows)
+
+        if self.settings.prefetch_media:
+            self._prefetch_neighbours(event.new[0])
+
+    def _prefetch_neighbours(self, path_tuple):
+        """Prefetch media for the tabs on either side of the opened tab and the first references of the sibling nodes"""
+        media_panels = []
+        if self._open_tab in self._rendered_tabs:
+            idx = self._rendered_tabs.index(self._open_tab)
+            before = self._rendered_tabs[max(0, idx - PREFETCH_TABS_AROUND_OPEN) : idx]
+            after = self._rendered_tabs[idx + 1 : idx + 1 + PREFETCH_TABS_AROUND_OPEN]
+            media_panels.extend(tab.tab_media for tab in before + after if isinstance(tab, MetricTab))
+
+        for offset in (1, -1):
+            sibling_path = path_tuple[:-1] + (path_tuple[-1] + offset,)
+            sibling = self._get_node_by_path(sibling_path) if sibling_path[-1] >= 0 else None
+            if not sibling:
+                continue
+
+            qc_metrics = [row for row in sibling.get("metric_rows", []) if row.get("object_type") == "QC metric"]
+            references = list(group_metrics_by_reference(qc_metrics))[:PREFETCH_REFERENCES_PER_NODE]
+            media_panels.extend(self._get_media_panel(reference) for reference in references)
+
+        self.prefetcher.prefetch(media_panels)
+
+    def _resolve_tabs(self, tabs):
+        """Start resolving the media of several tabs concurrently, so that loading them costs about one fetch"""
+        resolve_in_background([tab.tab_media for tab in tabs if isinstance(tab, MetricTab)])
+
+    def _load_tab(self, tab):
+        """Load a tab, recording whether its media was warmed by the prefetcher"""
+        if self.settings.prefetch_media and isinstance(tab, MetricTab):
+            self.prefetcher.record_load(tab.tab_media)
+        self._open_tab = tab
+        tab.load()
+
+    def _show_metric_rows(self, metric_rows):
+        """Show the first page of tabs for a set of metric rows, the rest are available through "Load more"
+
+        Only the tabs on the first page are built, and only media in open tabs is loaded, so the time
+        to first content does not depend on the number of metrics in the selection.
+        """
         self.content_panel.loading = True
 
-        # Separate curation metrics from QC metrics
+        # Separate curation metrics from QC metrics, QC metrics are grouped into one tab per reference
         curation_metrics = [row for row in metric_rows if row.get("object_type") == "Curation metric"]
         qc_metrics = [row for row in metric_rows if row.get("object_type") == "QC metric"]
 
-        # Build tabs for each metric type
-        tabs = []
-        if qc_metrics:
-            tabs.extend(self._build_qc_metric_tabs(qc_metrics))
-        if curation_metrics:
-            tabs.extend(self._build_curation_metric_tabs(curation_metrics))
+        self._pending_tabs = [("qc", group) for group in group_metrics_by_reference(qc_metrics).items()]
+        self._pending_tabs.extend(("curation", row) for row in curation_metrics)
+        self._rendered_tabs = []
+        self._open_tab = None
 
-        if tabs:
-            if len(tabs) == 1:
-                header = pn.pane.Markdown(f"## {tabs[0][0]}")
-                self.content_panel.objects = [header, tabs[0][1]]
-                panel = getattr(tabs[0][1], "curation_panel", None)
-                if isinstance(panel, EphysCuration):
-                    panel.load_iframe()
-            else:
-                accordion = pn.Accordion(*tabs, active=[0], width_policy="max", height_policy="auto")
-                EphysCuration.bind_lazy_to_accordion(accordion, tabs)
-                self.content_panel.objects = [accordion]
-        else:
+        tabs = self._build_next_tab_page()
+        self._resolve_tabs([tab for _, tab in tabs[:RESOLVE_TABS_ON_SHOW]])
+
+        if not tabs:
             self.content_panel.objects = [pn.pane.Markdown("*No metrics found*")]
+        elif len(tabs) == 1:
+            header = pn.pane.Markdown(f"## {tabs[0][0]}")
+            self.content_panel.objects = [header, tabs[0][1]]
+            self._load_tab(tabs[0][1])
+        else:
+            self.accordion = pn.Accordion(*tabs, active=[0], width_policy="max", height_policy="auto")
+            self.accordion.param.watch(self._on_accordion_active, "active")
+            self._load_tab(tabs[0][1])
+            self.content_panel.objects = [self.accordion, self.load_more_button]
 
+        self._update_load_more_button()
         self.content_panel.loading = False
 
-    def __panel__(self):
-        """Create and return the metrics panel"""
+    def _build_next_tab_page(self):
+        """Build the next METRIC_TAB_PAGE_SIZE tabs from the pending tabs
 
-        custom_js = f"""
-        <script>
-        console.log('[TreeColors] Script loaded');
-
-        function getAllElementsIncludingShadow(root = document.body) {{
-            const elements = [];
-
-            function traverse(node) {{
-                elements.push(node);
-
-                if (node.shadowRoot) {{
-                    traverse(node.shadowRoot);
-                }}
-
-                for (const child of node.children || []) {{
-                    traverse(child);
-                }}
-            }}
-
-            traverse(root);
-            return elements;
-        }}
-
-        function applyTreeColors(source) {{
-            console.log('[TreeColors] Applying icon colors, triggered by:', source);
-
-            const allElements = getAllElementsIncludingShadow();
-
-            const icons = allElements.filter(el =>
-                el.tagName === 'SPAN' &&
-                el.classList &&
-                el.classList.contains('material-icons')
-            );
-            console.log('[TreeColors] Found icons:', icons.length);
-
-            let coloredCount = 0;
-
-            icons.forEach((icon) => {{
-                const iconText = icon.textContent.trim();
-
-                let iconColor;
-
-                if (iconText === 'check_circle') {{
-                    iconColor = '{AIND_COLORS["green"]}';
-                }} else if (iconText === 'cancel') {{
-                    iconColor = '{AIND_COLORS["red"]}';
-                }} else if (iconText === 'help') {{
-                    iconColor = '{AIND_COLORS["light_blue"]}';
-                }}
-
-                if (iconColor) {{
-                    icon.style.setProperty('color', iconColor, 'important');
-                    coloredCount++;
-                }}
-            }});
-
-            console.log('[TreeColors] Colored', coloredCount, 'icons');
-        }}
-
-        // Initial application
-        applyTreeColors('initial-load');
-
-        // Set up debounced reapplication
-        let reapplyTimeout;
-        function scheduleReapply(reason) {{
-            console.log('[TreeColors] scheduleReapply called, reason:', reason);
-            clearTimeout(reapplyTimeout);
-            reapplyTimeout = setTimeout(() => applyTreeColors('debounced-' + reason), 20);
-        }}
-
-        // Set up observer with debouncing
-        const observer = new MutationObserver(function(mutations) {{
-            // Only reapply on meaningful changes
-            let shouldReapply = false;
-            let reasons = new Set();
-
-            mutations.forEach(m => {{
-                if (m.type === 'childList') {{
-                    shouldReapply = true;
-                    reasons.add('childList:' + (m.addedNodes.length > 0 ? 'added' : 'removed'));
-                }} else if (m.type === 'characterData') {{
-                    shouldReapply = true;
-                    reasons.add('characterData');
-                }} else if (m.type === 'attributes' && m.attributeName === 'data-expanded') {{
-                    shouldReapply = true;
-                    reasons.add('attr:data-expanded');
-                }}
-            }});
-
-            if (shouldReapply) {{
-                console.log('[TreeColors] MutationObserver triggered:', Array.from(reasons).join(', '));
-                scheduleReapply('mutation:' + Array.from(reasons).join(','));
-            }}
-        }});
-
-        // Observe body and all shadow roots
-        function setupObservers() {{
-            console.log('[TreeColors] setupObservers called');
-            observer.observe(document.body, {{
-                childList: true,
-                subtree: true,
-                characterData: true,
-                attributes: true,
-                attributeFilter: ['data-selected', 'data-expanded']
-            }});
-
-            // Find and observe all shadow roots
-            const allElements = getAllElementsIncludingShadow();
-            let newShadowRoots = 0;
-            allElements.forEach(el => {{
-                if (el.shadowRoot && !el.hasAttribute('data-shadow-observed')) {{
-                    el.setAttribute('data-shadow-observed', 'true');
-                    observer.observe(el.shadowRoot, {{
-                        childList: true,
-                        subtree: true,
-                        characterData: true,
-                        attributes: true
-                    }});
-                    newShadowRoots++;
-                }}
-            }});
-            if (newShadowRoots > 0) {{
-                console.log('[TreeColors] Found and observing', newShadowRoots, 'new shadow roots');
-            }}
-        }}
-
-        setupObservers();
-
-        // Re-setup observers periodically to catch new shadow roots
-        // setInterval(() => {{
-        //     console.log('[TreeColors] Periodic setupObservers check');
-        //     setupObservers();
-        // }}, 500);
-
-        console.log('[TreeColors] Observers set up');
-        </script>
+        Returns:
+            List of (tab_name, tab) tuples
         """
+        page = self._pending_tabs[:METRIC_TAB_PAGE_SIZE]
+        self._pending_tabs = self._pending_tabs[METRIC_TAB_PAGE_SIZE:]
 
-        script_pane = pn.pane.HTML(custom_js, width=0, height=0, sizing_mode="fixed")
+        # QC tabs always come before curation tabs, so building each kind separately preserves the order
+        tabs = self._build_qc_metric_tabs([spec for kind, spec in page if kind == "qc"])
+        tabs.extend(self._build_curation_metric_tabs([spec for kind, spec in page if kind == "curation"]))
 
+        self._rendered_tabs.extend(tab for _, tab in tabs)
+        return tabs
+
+    def _on_load_more(self, event):
+        """Append the next page of tabs to the accordion"""
+        tabs = self._build_next_tab_page()
+        if tabs:
+            self.accordion.extend(tabs)
+        self._update_load_more_button()
+
+    def _update_load_more_button(self):
+        """Show the number of remaining tabs on the load more button, hide it when all tabs are shown"""
+        remaining = len(self._pending_tabs)
+        self.load_more_button.name = f"Load {min(remaining, METRIC_TAB_PAGE_SIZE)} more ({remaining} remaining)"
+        self.load_more_button.visible = remaining > 0
+
+    def _on_accordion_active(self, event):
+        """Load tabs when they are opened and unload them when they are closed"""
+        new_active = set(event.new or [])
+        old_active = set(event.old or [])
+        opened = [self._rendered_tabs[idx] for idx in sorted(new_active - old_active)]
+        self._resolve_tabs(opened)
+        for tab in opened:
+            self._load_tab(tab)
+        for idx in old_active - new_active:
+            self._rendered_tabs[idx].unload()
+
+        if opened and self.settings.prefetch_media and self.tree.active:
+            self._prefetch_neighbours(self.tree.active[0])
+
+    def __panel__(self):
+        """Create and return the metrics panel"""
         return pn.Column(
             pn.Row(
-                self.tree,
+                pn.Column(self.search_input, self.search_results, self.tree),
                 self.content_panel,
             ),
-            script_pane,
         )
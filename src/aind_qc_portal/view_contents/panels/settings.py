@@ -10,6 +10,7 @@ class Settings(PyComponent):
     """Settings for the QC view application"""
 
     allow_value_edits = param.Boolean(default=False)
+    prefetch_media = param.Boolean(default=False, doc="Load media for neighbouring tree nodes in the background")
     default_grouping = param.List(default=[])
 
     def __init__(self, modalities: list, default_grouping: list, grouping_options: list):
@@ -42,9 +43,15 @@ class Settings(PyComponent):
             name="Allow Editing Metric Values",
         )
 
+        switch_prefetch_media = pmui.Switch.from_param(
+            self.param.prefetch_media,
+            name="Prefetch Media for Neighbouring Metrics",
+        )
+
         modal_content = pn.Column(
             pn.pane.Markdown("## Settings"),
             switch_value_edits,
+            switch_prefetch_media,
             pn.pane.Markdown("## Metric Grouping Levels"),
             pn.pane.Markdown("Configure the hierarchical levels for organizing metrics in the tree."),
             sizing_mode="stretch_width",
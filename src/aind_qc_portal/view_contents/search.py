@@ -0,0 +1,185 @@
+"""Inverted index for searching metrics in a QC record"""
+
+import re
+from bisect import bisect_left
+
+import pandas as pd
+
+from aind_qc_portal.view_contents.data_utils import decode_dict_value
+
+# Score given to a term found in each field, name matches rank above tag matches above description matches
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "tags": 2.0,
+    "description": 1.0,
+}
+# Fraction of the field weight given to a term that only matches the start of a token
+PREFIX_WEIGHT = 0.5
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# key:"quoted value", key:value or a bare term
+QUERY_PATTERN = re.compile(r'(\w+):"([^"]*)"?|(\w+):(\S+)|(\S+)')
+
+
+def tokenize(text) -> list[str]:
+    """Split text into lowercase alphanumeric tokens"""
+    if not isinstance(text, str):
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def parse_query(query: str) -> tuple[list[str], list[tuple[str, str]]]:
+    """Split a search query into free-text terms and key:value filters
+
+    Parameters
+    ----------
+    query : str
+        For example 'psd probe status:Pending stage:"Raw data"'
+
+    Returns
+    -------
+    tuple[list[str], list[tuple[str, str]]]
+        Lowercase terms and (key, value) filters
+    """
+    terms = []
+    filters = []
+    for match in QUERY_PATTERN.finditer(query or ""):
+        quoted_key, quoted_value, key, value, term = match.groups()
+        if quoted_key:
+            filters.append((quoted_key.lower(), quoted_value.strip().lower()))
+        elif key:
+            filters.append((key.lower(), value.lower()))
+        else:
+            terms.extend(tokenize(term))
+    return terms, filters
+
+
+class MetricSearchIndex:
+    """Inverted index over metric name, description, tag values and current status
+
+    Each metric is identified by its index label in the ViewData dataframe. Free-text terms match
+    whole tokens or token prefixes and all terms must match, results are ranked by the summed field
+    weights. Filters (status, modality, stage or any tag key) must match the whole value.
+    """
+
+    def __init__(self, dataframe: pd.DataFrame, metric_status: pd.DataFrame):
+        """Build the index from the ViewData dataframe and metric statuses"""
+        self._postings: dict[str, dict] = {}
+        self._filters: dict[tuple[str, str], set] = {}
+        self._status: dict = {}
+        self._name_to_ids: dict[str, list] = {}
+        self._order: dict = {}
+
+        statuses = {}
+        if not metric_status.empty:
+            statuses = dict(zip(metric_status["name"], metric_status["evaluated_status"]))
+
+        # to_dict is much faster than iterrows for large records
+        for position, (doc_id, row) in enumerate(zip(dataframe.index, dataframe.to_dict("records"))):
+            self._order[doc_id] = position
+            name = row.get("name")
+            self._name_to_ids.setdefault(name, []).append(doc_id)
+
+            self._add_text(doc_id, "name", name)
+            self._add_text(doc_id, "description", row.get("description"))
+
+            tags = decode_dict_value(row.get("tags"))
+            if isinstance(tags, dict):
+                for key, value in tags.items():
+                    self._add_text(doc_id, "tags", str(value))
+                    self._add_filter(doc_id, key, value)
+
+            modality = row.get("modality")
+            if isinstance(modality, dict):
+                self._add_filter(doc_id, "modality", modality.get("abbreviation"))
+            self._add_filter(doc_id, "stage", row.get("stage"))
+
+            self._set_status(doc_id, statuses.get(name, "Pending"))
+
+        self._vocabulary = sorted(self._postings)
+
+    def __len__(self) -> int:
+        """Number of indexed metrics"""
+        return len(self._order)
+
+    def _add_text(self, doc_id, field: str, text):
+        """Add the tokens of a text field to the postings, keeping the best field weight per token"""
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(text):
+            postings = self._postings.setdefault(token, {})
+            postings[doc_id] = max(postings.get(doc_id, 0.0), weight)
+
+    def _add_filter(self, doc_id, key: str, value):
+        """Register a key:value filter for a metric"""
+        if value is None:
+            return
+        self._filters.setdefault((str(key).lower(), str(value).lower()), set()).add(doc_id)
+
+    def _set_status(self, doc_id, status: str):
+        """Move a metric to the filter set of a new status"""
+        old_status = self._status.get(doc_id)
+        if old_status is not None:
+            self._filters.get(("status", old_status.lower()), set()).discard(doc_id)
+        self._status[doc_id] = status
+        self._add_filter(doc_id, "status", status)
+
+    def update_status(self, metric_name: str, status: str):
+        """Update the indexed status of a metric after a status change"""
+        for doc_id in self._name_to_ids.get(metric_name, []):
+            self._set_status(doc_id, status)
+
+    def _match_term(self, term: str) -> dict:
+        """Score the metrics that contain a token equal to, or starting with, the term"""
+        scores = {}
+        start = bisect_left(self._vocabulary, term)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            factor = 1.0 if token == term else PREFIX_WEIGHT
+            for doc_id, weight in self._postings[token].items():
+                scores[doc_id] = max(scores.get(doc_id, 0.0), weight * factor)
+        return scores
+
+    def search(self, query: str, limit: int | None = None) -> list:
+        """Find the metrics that match a query
+
+        Parameters
+        ----------
+        query : str
+            Free-text terms and key:value filters, e.g. "psd status:Pending"
+        limit : int, optional
+            Maximum number of results to return
+
+        Returns
+        -------
+        list
+            Dataframe index labels, best match first. Filter-only queries keep the record order.
+        """
+        terms, filters = parse_query(query)
+        if not terms and not filters:
+            return []
+
+        candidates = None
+        for key_value in filters:
+            matches = self._filters.get(key_value, set())
+            candidates = set(matches) if candidates is None else candidates & matches
+
+        scores = None
+        for term in terms:
+            term_scores = self._match_term(term)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    doc_id: score + term_scores[doc_id] for doc_id, score in scores.items() if doc_id in term_scores
+                }
+            if not scores:
+                return []
+
+        if scores is None:
+            scores = dict.fromkeys(candidates, 0.0)
+        elif candidates is not None:
+            scores = {doc_id: score for doc_id, score in scores.items() if doc_id in candidates}
+
+        results = sorted(scores, key=lambda doc_id: (-scores[doc_id], self._order[doc_id]))
+        return results[:limit] if limit is not None else results
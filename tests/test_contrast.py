@@ -0,0 +1,83 @@
+"""Unit tests for view_contents/panels/media/curation_apps/contrast.py"""
+
+import unittest
+
+import numpy as np
+
+from aind_qc_portal.view_contents.panels.media.curation_apps.contrast import ContrastHistogram, project_histogram
+from aind_qc_portal.view_contents.panels.media.process_pool import SessionTasks
+
+
+def reference_contrast(arr: np.ndarray, low_p: float, high_p: float) -> np.ndarray:
+    """Percentile contrast computed on the whole array"""
+    low, high = np.percentile(arr, [low_p, high_p], method="lower")
+    if high <= low:
+        high = low + 1e-6
+    return (np.clip((arr.astype(np.float64) - low) / (high - low), 0, 1) * 255).astype(np.uint8)
+
+
+class TestContrastHistogram(unittest.TestCase):
+    """Test percentiles and rendering against numpy"""
+
+    def setUp(self):
+        """Random images"""
+        self.rng = np.random.default_rng(0)
+
+    def test_integer_images_are_exact(self):
+        """Test that integer percentiles and rendering match numpy exactly"""
+        for dtype, low, high in ((np.uint8, 0, 256), (np.uint16, 100, 60000), (np.int16, -500, 500)):
+            arr = self.rng.integers(low, high, size=(60, 70)).astype(dtype)
+            histogram = ContrastHistogram(arr)
+            self.assertEqual(histogram.indices.dtype, np.uint16)
+            for p in (0, 0.5, 37, 99, 100):
+                self.assertEqual(histogram.percentile(p), np.percentile(arr, p, method="lower"))
+            for low_p, high_p in ((0, 100), (1, 99), (50, 50)):
+                np.testing.assert_array_equal(histogram.to_uint8(low_p, high_p), reference_contrast(arr, low_p, high_p))
+
+    def test_float_images_are_binned(self):
+        """Test that float percentiles are within one bin of numpy"""
+        arr = self.rng.normal(size=(100, 100)).astype(np.float32)
+        histogram = ContrastHistogram(arr, bins=4096)
+        bin_width = (arr.max() - arr.min()) / 4095
+        for p in (0, 5, 50, 99.5, 100):
+            self.assertAlmostEqual(histogram.percentile(p), np.percentile(arr, p, method="lower"), delta=bin_width)
+        difference = np.abs(histogram.to_uint8(1, 99).astype(int) - reference_contrast(arr, 1, 99).astype(int))
+        self.assertLessEqual(difference.max(), 1)
+
+    def test_wide_integer_range_is_binned(self):
+        """Test that integer images spanning more than MAX_EXACT_BINS values fall back to bins"""
+        arr = self.rng.integers(0, 2**30, size=(50, 50), dtype=np.uint32)
+        histogram = ContrastHistogram(arr, bins=1024)
+        self.assertEqual(len(histogram.values), 1024)
+        self.assertEqual(histogram.to_uint8(0, 100).max(), 255)
+
+    def test_constant_image(self):
+        """Test that a constant image renders without dividing by zero"""
+        for arr in (np.full((4, 4), 7, dtype=np.uint16), np.full((4, 4), 0.5, dtype=np.float32)):
+            np.testing.assert_array_equal(ContrastHistogram(arr).to_uint8(1, 99), 0)
+
+    def test_out(self):
+        """Test rendering into an existing buffer"""
+        arr = self.rng.integers(0, 1000, size=(8, 9), dtype=np.uint16)
+        out = np.empty(arr.shape, dtype=np.uint8)
+        result = ContrastHistogram(arr).to_uint8(0, 100, out=out)
+        self.assertIs(result, out)
+
+
+class TestProjectHistogram(unittest.TestCase):
+    """Test projecting and binning in the process pool"""
+
+    def test_matches_in_process(self):
+        """Test that the histogram matches one computed here"""
+        stack = np.random.default_rng(0).integers(0, 5000, size=(5, 40, 30), dtype=np.uint16)
+        tasks = SessionTasks()
+        for axis, expected in ((0, stack.max(axis=0)), (2, stack.max(axis=2)), (None, stack[0])):
+            histogram = project_histogram(stack if axis is not None else stack[0], axis, tasks)
+            reference = ContrastHistogram(expected)
+            np.testing.assert_array_equal(histogram.indices, reference.indices)
+            np.testing.assert_array_equal(histogram.cdf, reference.cdf)
+            self.assertEqual(histogram.percentile(50), reference.percentile(50))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+"""Unit tests for view_contents/panels/media/disk_cache.py"""
+
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+
+from aind_qc_portal.view_contents.panels.media import disk_cache
+from aind_qc_portal.view_contents.panels.media.disk_cache import MediaDiskCache, parse_s3_url
+
+HTTPX_CLIENT = httpx.Client
+URL = "https://bucket.s3.amazonaws.com/prefix/image.png?X-Amz-Signature=abc"
+
+
+class FakeS3:
+    """Serve objects with ETags and count the requests that transfer data"""
+
+    def __init__(self):
+        """Start with one object"""
+        self.objects = {"/prefix/image.png": (b"png-data" * 100, "etag-1")}
+        self.downloads = 0
+        self.requests = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        """Handle a GET, honoring If-None-Match"""
+        self.requests += 1
+        if request.url.path not in self.objects:
+            return httpx.Response(404, text="NoSuchKey")
+        content, etag = self.objects[request.url.path]
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304)
+        self.downloads += 1
+        return httpx.Response(200, content=content, headers={"ETag": f'"{etag}"'})
+
+    def client(self, *args, **kwargs):
+        """Build an httpx client that uses this fake"""
+        return HTTPX_CLIENT(transport=httpx.MockTransport(self.handler))
+
+
+class TestParseS3Url(unittest.TestCase):
+    """Test getting the bucket and key from S3 URLs"""
+
+    def test_virtual_hosted_style(self):
+        """Test https://<bucket>.s3.amazonaws.com/<key>"""
+        self.assertEqual(parse_s3_url(URL), ("bucket", "prefix/image.png"))
+
+    def test_path_style(self):
+        """Test https://s3.<region>.amazonaws.com/<bucket>/<key>"""
+        url = "https://s3.us-west-2.amazonaws.com/my.bucket/prefix/a%20b.png?X-Amz-Signature=abc"
+        self.assertEqual(parse_s3_url(url), ("my.bucket", "prefix/a b.png"))
+
+
+class TestMediaDiskCache(unittest.TestCase):
+    """Test caching, revalidation and eviction"""
+
+    def setUp(self):
+        """Create a cache in a temporary directory backed by a fake S3"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.cache = MediaDiskCache(self.tmp_dir.name, max_size_mb=1)
+        self.s3 = FakeS3()
+        patcher = patch.object(disk_cache.httpx, "Client", side_effect=self.s3.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_download_is_cached(self):
+        """Test that a second get uses the cached file without a request"""
+        path = self.cache.get(URL, ".png")
+        self.assertTrue(path.endswith(".png"))
+        self.assertEqual(Path(path).read_bytes(), b"png-data" * 100)
+        self.assertEqual(self.cache.get(URL, ".png"), path)
+        self.assertEqual(self.s3.requests, 1)
+
+    def test_revalidation(self):
+        """Test that stale entries are revalidated, and only downloaded again when the ETag changed"""
+        path = self.cache.get(URL, ".png")
+
+        with patch.object(disk_cache, "MEDIA_CACHE_REVALIDATE_AFTER", 0):
+            self.assertEqual(self.cache.get(URL, ".png"), path)
+            self.assertEqual(self.s3.downloads, 1)
+
+            self.s3.objects["/prefix/image.png"] = (b"new-data", "etag-2")
+            new_path = self.cache.get(URL, ".png")
+
+        self.assertNotEqual(new_path, path)
+        self.assertEqual(Path(new_path).read_bytes(), b"new-data")
+        self.assertEqual(self.s3.downloads, 2)
+
+    def test_concurrent_gets_download_once(self):
+        """Test that concurrent requests for the same object are deduplicated"""
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            paths = set(executor.map(lambda _: self.cache.get(URL, ".png"), range(8)))
+        self.assertEqual(len(paths), 1)
+        self.assertEqual(self.s3.downloads, 1)
+
+    def test_failed_download(self):
+        """Test that None is returned when the object can't be fetched"""
+        url = "https://bucket.s3.amazonaws.com/prefix/missing.png?X-Amz-Signature=abc"
+        self.assertIsNone(self.cache.get(url, ".png"))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used files are evicted when over budget"""
+        for i in range(4):
+            self.s3.objects[f"/prefix/{i}.png"] = (bytes(300 * 1024), f"etag-{i}")
+
+        paths = [self.cache.get(f"https://bucket.s3.amazonaws.com/prefix/{i}.png", ".png") for i in range(3)]
+        # Make the first file the least recently used, then go over budget
+        os.utime(paths[0], (0, 0))
+        paths.append(self.cache.get("https://bucket.s3.amazonaws.com/prefix/3.png", ".png"))
+
+        self.assertFalse(os.path.exists(paths[0]))
+        for path in paths[1:]:
+            self.assertTrue(os.path.exists(path))
+
+    def test_directories_are_evicted_whole(self):
+        """Test that directories in the data directory count with their contents and are evicted as a whole"""
+        pyramid = self.cache.data_dir / "image_tiles"
+        (pyramid / "0").mkdir(parents=True)
+        (pyramid / "0" / "0_0.webp").write_bytes(bytes(600 * 1024))
+        self.cache.evict()
+        self.assertTrue(pyramid.exists())
+
+        (pyramid / "0" / "1_0.webp").write_bytes(bytes(600 * 1024))
+        self.cache.evict(pyramid)
+        self.assertFalse(pyramid.exists())
+
+    def test_size_is_counted_without_listing(self):
+        """Test that added files are counted into the running total instead of listing the data directory"""
+        self.cache.evict()
+        for i in range(3):
+            self.s3.objects[f"/prefix/{i}.png"] = (bytes(100 * 1024), f"etag-{i}")
+        with patch.object(disk_cache.Path, "iterdir", side_effect=AssertionError("listed")):
+            for i in range(3):
+                self.cache.get(f"https://bucket.s3.amazonaws.com/prefix/{i}.png", ".png")
+        self.assertEqual(self.cache._total_size, 300 * 1024)
+
+    def test_locks_are_dropped_when_unused(self):
+        """Test that the thread lock of a name is only kept while it is used"""
+        with self.cache.lock("name"):
+            self.assertIn("name", self.cache._locks)
+        self.assertNotIn("name", self.cache._locks)
+        self.cache.get(URL, ".png")
+        self.assertEqual(self.cache._locks, {})
+
+    def test_eviction_removes_locks_and_entries(self):
+        """Test that the lock files and entries of evicted files are deleted, held locks are kept"""
+        for i in range(4):
+            self.s3.objects[f"/prefix/{i}.png"] = (bytes((300 if i < 2 else 400) * 1024), f"etag-{i}")
+        paths = [self.cache.get(f"https://bucket.s3.amazonaws.com/prefix/{i}.png", ".png") for i in range(2)]
+        preview = self.cache.data_dir / "preview.webp"
+        with self.cache.lock(preview.name):
+            preview.write_bytes(bytes(300 * 1024))
+        self.cache.evict(preview)
+        for path in [*paths, preview]:
+            os.utime(path, (0, 0))
+
+        with self.cache.lock(preview.name):
+            self.cache.get("https://bucket.s3.amazonaws.com/prefix/2.png", ".png")
+            self.cache.get("https://bucket.s3.amazonaws.com/prefix/3.png", ".png")
+
+        self.assertFalse(any(os.path.exists(path) for path in [*paths, preview]))
+        entries = sorted(path.name for path in (self.cache.cache_dir / "entries").iterdir())
+        locks = sorted(path.name for path in (self.cache.cache_dir / "locks").iterdir())
+        self.assertEqual(len(entries), 2)
+        # The lock of the preview was held while it was evicted
+        self.assertEqual(locks, sorted([*(Path(name).stem for name in entries), "evict", preview.name]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+"""Unit tests for view_contents/panels/media/curation_apps/h5_reader.py"""
+
+import io
+import threading
+import unittest
+
+import h5py
+import numpy as np
+
+from aind_qc_portal.view_contents.panels.media.curation_apps.h5_reader import (
+    RangeCacheFile,
+    _runs,
+    chunk_byte_ranges,
+)
+
+BLOCK_SIZE = 4096
+
+
+class FakeFileSystem:
+    """Serve one file from memory, recording the ranges requested"""
+
+    def __init__(self, content: bytes):
+        """Serve content"""
+        self.content = content
+        self.ranges = []
+        self.lock = threading.Lock()
+
+    def size(self, path: str) -> int:
+        """Size of the file"""
+        return len(self.content)
+
+    def cat_file(self, path: str, start: int, end: int) -> bytes:
+        """Read bytes [start, end)"""
+        with self.lock:
+            self.ranges.append((start, end))
+        return self.content[start:end]
+
+
+def make_h5(chunks=(4, 32, 32)) -> tuple[bytes, np.ndarray]:
+    """H5 file with a gzip compressed uint16 volume that is only written in its first half"""
+    volume = np.random.default_rng(0).integers(0, 1000, size=(40, 64, 64), dtype=np.uint16)
+    buffer = io.BytesIO()
+    with h5py.File(buffer, "w") as f:
+        dset = f.create_dataset("data", shape=volume.shape, dtype=volume.dtype, chunks=chunks, compression="gzip")
+        dset[:20] = volume[:20]
+        f.create_dataset("contiguous", data=volume[:, :8, :8])
+    volume[20:] = 0
+    return buffer.getvalue(), volume
+
+
+class TestRangeCacheFile(unittest.TestCase):
+    """Test reading H5 files through the block cache"""
+
+    def setUp(self):
+        """Open an H5 file served from memory"""
+        content, self.volume = make_h5()
+        self.fs = FakeFileSystem(content)
+        self.file = RangeCacheFile(self.fs, "volume.h5", block_size=BLOCK_SIZE)
+        self.h5 = h5py.File(self.file, "r")
+        self.addCleanup(self.h5.close)
+
+    def test_reads_match(self):
+        """Test that reads through the cache return the same data"""
+        np.testing.assert_array_equal(self.h5["data"][3:9], self.volume[3:9])
+        np.testing.assert_array_equal(self.h5["data"][35], self.volume[35])
+        np.testing.assert_array_equal(self.h5["contiguous"][:20], self.volume[:20, :8, :8])
+
+    def test_blocks_are_cached(self):
+        """Test that reading the same slices again doesn't fetch anything"""
+        self.h5["data"][5]
+        requests = len(self.fs.ranges)
+        self.h5.close()
+        with h5py.File(self.file, "r") as h5:
+            h5["data"][5]
+        self.assertEqual(len(self.fs.ranges), requests)
+
+    def test_ranges_are_block_aligned(self):
+        """Test that every request starts on a block boundary"""
+        self.h5["data"][0:20]
+        self.assertTrue(all(start % BLOCK_SIZE == 0 for start, _ in self.fs.ranges))
+
+    def test_cache_is_bounded(self):
+        """Test that least recently used blocks are dropped"""
+        small = RangeCacheFile(self.fs, "volume.h5", block_size=BLOCK_SIZE, max_bytes=4 * BLOCK_SIZE)
+        small.read_range(0, len(self.fs.content))
+        self.assertEqual(len(small._blocks), 4)
+        self.assertEqual(max(small._blocks), (len(self.fs.content) - 1) // BLOCK_SIZE)
+
+    def test_prefetched_chunks_are_not_fetched_again(self):
+        """Test that prefetching the chunks of a slice makes reading it free"""
+        dset = self.h5["data"]
+        ranges = chunk_byte_ranges(dset, 8, 9)
+        # One z chunk spanning 2x2 chunks in y/x
+        self.assertEqual(len(ranges), 4)
+        self.file.prefetch(ranges)
+        requests = len(self.fs.ranges)
+        np.testing.assert_array_equal(dset[8], self.volume[8])
+        self.assertEqual(len(self.fs.ranges), requests)
+
+    def test_chunk_byte_ranges(self):
+        """Test chunk layouts, unwritten chunks and contiguous datasets"""
+        self.assertEqual(len(chunk_byte_ranges(self.h5["data"], 0, 40)), 20)
+        self.assertEqual(chunk_byte_ranges(self.h5["data"], 20, 40), [])
+        self.assertEqual(chunk_byte_ranges(self.h5["data"], 50, 60), [])
+        # A region inside one chunk in y and overlapping two in x
+        self.assertEqual(len(chunk_byte_ranges(self.h5["data"], 0, 4, (slice(0, 10), slice(20, 40)))), 2)
+        [(start, end)] = chunk_byte_ranges(self.h5["contiguous"], 2, 4)
+        self.assertEqual(end - start, 2 * 8 * 8 * 2)
+
+    def test_runs(self):
+        """Test grouping blocks into runs of bounded length"""
+        self.assertEqual(_runs([0, 1, 2, 5, 6, 9], max_length=2), [(0, 2), (2, 3), (5, 7), (9, 10)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,259 @@
+"""Unit tests for view_contents/panels/media/utils.py"""
+
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+from aind_qc_portal.view_contents.panels.media import utils
+from aind_qc_portal.view_contents.panels.media.utils import (
+    CODEOCEAN_ROLE_ARN,
+    MEDIA_TTL,
+    PRESIGNED_URL_MARGIN,
+    PRESIGNED_URL_WINDOW,
+    S3ClientPool,
+    get_presigned_url_expiry,
+    get_s3_role,
+    get_s3_url,
+    is_presigned_url_valid,
+)
+
+SIGNED_URL = (
+    "https://bucket.s3.amazonaws.com/key.png?X-Amz-Algorithm=AWS4-HMAC-SHA256"
+    "&X-Amz-Credential=KEY%2F20260101%2Fus-west-2%2Fs3%2Faws4_request"
+    "&X-Amz-Date=20260101T120000Z&X-Amz-Expires=3600&X-Amz-SignedHeaders=host&X-Amz-Signature=abc"
+)
+SIGNED_AT = datetime(2026, 1, 1, 12, 0, 0, tzinfo=timezone.utc).timestamp()
+
+
+def make_session_mock(expiration=None, assume_role_error=None):
+    """Mock boto3.session.Session, each client() call returns a new MagicMock"""
+    session = MagicMock()
+
+    def make_client(service, **kwargs):
+        """Return a new client, with assume_role configured for sts"""
+        client = MagicMock(name=service)
+        if service == "sts":
+            if assume_role_error:
+                client.assume_role.side_effect = assume_role_error
+            else:
+                client.assume_role.return_value = {
+                    "Credentials": {
+                        "AccessKeyId": "key",
+                        "SecretAccessKey": "secret",
+                        "SessionToken": "token",
+                        "Expiration": expiration,
+                    }
+                }
+        return client
+
+    session.return_value.client.side_effect = make_client
+    return session
+
+
+class TestGetS3Role(unittest.TestCase):
+    """Test choosing the role for a reference"""
+
+    def test_default_buckets_use_default_credentials(self):
+        """Test that non Code Ocean references don't assume a role"""
+        self.assertIsNone(get_s3_role("aind-open-data"))
+        self.assertIsNone(get_s3_role(None))
+
+    @patch.dict(os.environ, {"BYPASS_CODEOCEAN_S3": "0"})
+    def test_codeocean_bucket_assumes_role(self):
+        """Test that Code Ocean buckets use the cross-account role"""
+        self.assertEqual(get_s3_role("codeocean-s3datasetsbucket-1u41qdg42ur9"), CODEOCEAN_ROLE_ARN)
+
+    def test_role_assumed_by_default(self):
+        """Test that Code Ocean buckets use the cross-account role when BYPASS_CODEOCEAN_S3 isn't set"""
+        with patch.dict(os.environ):
+            os.environ.pop("BYPASS_CODEOCEAN_S3", None)
+            self.assertEqual(get_s3_role("codeocean-s3datasetsbucket-1u41qdg42ur9"), CODEOCEAN_ROLE_ARN)
+
+    @patch.dict(os.environ, {"BYPASS_CODEOCEAN_S3": "1"})
+    def test_bypass(self):
+        """Test that BYPASS_CODEOCEAN_S3=1 skips the role"""
+        self.assertIsNone(get_s3_role("codeocean-s3datasetsbucket-1u41qdg42ur9"))
+
+
+class TestS3ClientPool(unittest.TestCase):
+    """Test reusing and refreshing pooled clients"""
+
+    def test_default_client_is_reused(self):
+        """Test that the same client is returned for the same key"""
+        with patch("boto3.session.Session", make_session_mock()):
+            pool = S3ClientPool()
+            client = pool.get("us-west-2")
+            self.assertIs(pool.get("us-west-2"), client)
+            self.assertIsNot(pool.get("us-east-1"), client)
+
+    def test_role_client_refreshed_before_expiry(self):
+        """Test that assumed-role clients are rebuilt when their credentials are about to expire"""
+        expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+        with patch("boto3.session.Session", make_session_mock(expiration=expiration)):
+            pool = S3ClientPool()
+            client = pool.get("us-west-2", CODEOCEAN_ROLE_ARN)
+            self.assertIs(pool.get("us-west-2", CODEOCEAN_ROLE_ARN), client)
+
+            with patch("time.time", return_value=time.time() + 60 * 60):
+                self.assertIsNot(pool.get("us-west-2", CODEOCEAN_ROLE_ARN), client)
+
+    def test_role_client_reports_credential_expiry(self):
+        """Test that the expiration of assumed-role credentials is returned with the client"""
+        expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+        with patch("boto3.session.Session", make_session_mock(expiration=expiration)):
+            pool = S3ClientPool()
+            client, expires_at = pool.get_with_expiry("us-west-2", CODEOCEAN_ROLE_ARN)
+            self.assertIs(pool.get("us-west-2", CODEOCEAN_ROLE_ARN), client)
+            self.assertEqual(expires_at, expiration.timestamp())
+            self.assertIsNone(pool.get_with_expiry("us-west-2")[1])
+
+    def test_assume_role_does_not_block_other_keys(self):
+        """Test that a slow STS call only holds up callers of the same key"""
+        expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+        session = make_session_mock(expiration=expiration)
+        sts_started = threading.Event()
+        release_sts = threading.Event()
+        make_client = session.return_value.client.side_effect
+
+        def slow_client(service, **kwargs):
+            """Block STS clients until released"""
+            if service == "sts":
+                sts_started.set()
+                release_sts.wait(5)
+            return make_client(service, **kwargs)
+
+        session.return_value.client.side_effect = slow_client
+        with patch("boto3.session.Session", session):
+            pool = S3ClientPool()
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                role_clients = [executor.submit(pool.get, "us-west-2", CODEOCEAN_ROLE_ARN) for _ in range(2)]
+                self.assertTrue(sts_started.wait(5))
+                # The default client is created while the role client is still waiting on STS
+                self.assertIsNotNone(pool.get("us-west-2"))
+                self.assertFalse(any(future.done() for future in role_clients))
+                release_sts.set()
+                first, second = (future.result(5) for future in role_clients)
+
+        # The second caller waited for the first one's client instead of assuming the role again
+        self.assertIs(first, second)
+        sts_calls = [call for call in session.return_value.client.call_args_list if call.args[0] == "sts"]
+        self.assertEqual(len(sts_calls), 1)
+
+    def test_failed_assume_role_falls_back(self):
+        """Test that a failed role assumption returns a default client and retries later"""
+        session = make_session_mock(assume_role_error=Exception("AccessDenied"))
+        with patch("boto3.session.Session", session):
+            pool = S3ClientPool()
+            client = pool.get("us-west-2", CODEOCEAN_ROLE_ARN)
+            self.assertIsNotNone(client)
+            self.assertIs(pool.get("us-west-2", CODEOCEAN_ROLE_ARN), client)
+
+            with patch("time.time", return_value=time.time() + 60 * 60):
+                self.assertIsNot(pool.get("us-west-2", CODEOCEAN_ROLE_ARN), client)
+
+
+class TestGetS3Url(unittest.TestCase):
+    """Test sharing presigned URLs"""
+
+    def setUp(self):
+        """Clear the presigned URL cache and mock the S3 client"""
+        utils._presigned_url_cache["window"] = None
+        utils._presigned_url_cache["urls"] = {}
+        self.client = MagicMock()
+        self.client.generate_presigned_url.side_effect = lambda *args, **kwargs: f"url-{time.time()}"
+        self.credentials_expire_at = None
+        patcher = patch.object(
+            utils, "get_s3_client_with_expiry", side_effect=lambda bucket: (self.client, self.credentials_expire_at)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_url_reused_within_window(self):
+        """Test that the same URL is returned for the same key within a window"""
+        now = PRESIGNED_URL_WINDOW * 1000
+        with patch("time.time", return_value=now):
+            url = get_s3_url("bucket", "key.png")
+        with patch("time.time", return_value=now + PRESIGNED_URL_WINDOW - 1):
+            self.assertEqual(get_s3_url("bucket", "key.png"), url)
+            self.assertNotEqual(get_s3_url("bucket", "other.png"), url)
+        self.assertEqual(self.client.generate_presigned_url.call_count, 2)
+
+    def test_url_resigned_in_next_window(self):
+        """Test that a new URL is signed when the window changes"""
+        now = PRESIGNED_URL_WINDOW * 1000
+        with patch("time.time", return_value=now):
+            url = get_s3_url("bucket", "key.png")
+        with patch("time.time", return_value=now + PRESIGNED_URL_WINDOW):
+            self.assertNotEqual(get_s3_url("bucket", "key.png"), url)
+        self.assertEqual(len(utils._presigned_url_cache["urls"]), 1)
+
+    def test_url_signed_for_media_ttl(self):
+        """Test that URLs signed with the default credentials are valid for MEDIA_TTL"""
+        get_s3_url("bucket", "key.png")
+        self.assertEqual(self.client.generate_presigned_url.call_args.kwargs["ExpiresIn"], MEDIA_TTL)
+
+    def test_url_capped_at_credential_expiry(self):
+        """Test that role-signed URLs expire with their credentials and are replaced before then"""
+        now = PRESIGNED_URL_WINDOW * 1000
+        self.credentials_expire_at = now + 20 * 60
+        with patch("time.time", return_value=now):
+            url = get_s3_url("bucket", "key.png")
+        self.assertEqual(self.client.generate_presigned_url.call_args.kwargs["ExpiresIn"], 20 * 60)
+
+        with patch("time.time", return_value=now + 20 * 60 - PRESIGNED_URL_MARGIN - 1):
+            self.assertEqual(get_s3_url("bucket", "key.png"), url)
+
+        self.credentials_expire_at = now + 80 * 60
+        with patch("time.time", return_value=now + 20 * 60 - PRESIGNED_URL_MARGIN):
+            self.assertNotEqual(get_s3_url("bucket", "key.png"), url)
+        self.assertEqual(self.client.generate_presigned_url.call_args.kwargs["ExpiresIn"], MEDIA_TTL)
+
+    def test_missing_bucket_or_key(self):
+        """Test that None is returned without a bucket or key"""
+        self.assertIsNone(get_s3_url("", "key.png"))
+        self.assertIsNone(get_s3_url("bucket", None))
+
+
+class TestIsPresignedUrlValid(unittest.TestCase):
+    """Test checking presigned URLs without network requests"""
+
+    def test_expiry_from_sigv4_parameters(self):
+        """Test that the expiry is the signing time plus X-Amz-Expires"""
+        self.assertEqual(get_presigned_url_expiry(SIGNED_URL), SIGNED_AT + 3600)
+
+    def test_expiry_from_sigv2_parameters(self):
+        """Test that the expiry is read from the Expires parameter"""
+        url = "https://bucket.s3.amazonaws.com/key.png?AWSAccessKeyId=KEY&Signature=abc&Expires=1767272400"
+        self.assertEqual(get_presigned_url_expiry(url), 1767272400)
+
+    def test_unsigned_url_has_no_expiry(self):
+        """Test that URLs without signing parameters have no expiry"""
+        self.assertIsNone(get_presigned_url_expiry("https://example.com/image.png"))
+
+    @patch("aind_qc_portal.view_contents.panels.media.utils.requests.get")
+    def test_valid_and_expired(self, mock_get):
+        """Test validity against the current time and margin, without making requests"""
+        with patch("time.time", return_value=SIGNED_AT + 60):
+            self.assertTrue(is_presigned_url_valid(SIGNED_URL))
+            self.assertFalse(is_presigned_url_valid(SIGNED_URL, margin=3600))
+        with patch("time.time", return_value=SIGNED_AT + 3600):
+            self.assertFalse(is_presigned_url_valid(SIGNED_URL))
+        mock_get.assert_not_called()
+
+    @patch("aind_qc_portal.view_contents.panels.media.utils.requests.get")
+    def test_unsigned_url_probe(self, mock_get):
+        """Test that unsigned URLs are only probed when requested"""
+        mock_get.return_value.status_code = 403
+        self.assertTrue(is_presigned_url_valid("https://example.com/image.png"))
+        self.assertFalse(is_presigned_url_valid("https://example.com/image.png", probe=True))
+        self.assertFalse(is_presigned_url_valid("/tmp/image.png"))
+        self.assertFalse(is_presigned_url_valid(None))
+        mock_get.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,407 @@
+"""Unit tests for view_contents/panels/metrics.py"""
+
+import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import MagicMock, PropertyMock, patch
+
+import pandas as pd
+import panel as pn
+import param
+from bokeh.core.json_encoder import serialize_json
+from bokeh.document import Document
+from panel.io.location import Location
+
+from aind_qc_portal.view_contents.panels.media.prefetch import MediaPrefetcher
+from aind_qc_portal.view_contents.panels.metrics import (
+    METRIC_TAB_PAGE_SIZE,
+    PREFETCH_TABS_AROUND_OPEN,
+    RESOLVE_TABS_ON_SHOW,
+    TREE_STATUS_SX,
+    CurationTab,
+    Metrics,
+    MetricTab,
+    get_grouping_key,
+    get_status_icon,
+    get_status_palette_color,
+    update_tree_statuses,
+)
+
+
+class FakeMedia:
+    """Media stand-in that records resolutions and loads"""
+
+    def __init__(self, reference):
+        """Create unloaded media for a reference"""
+        self.reference = reference
+        self.loaded = False
+        self.resolved = False
+
+    def resolve(self):
+        """Mark the media as resolved"""
+        self.resolved = True
+
+    def load(self):
+        """Mark the media as loaded"""
+        self.loaded = True
+
+
+def qc_row(reference, name=None):
+    """Build a QC metric row"""
+    return {"object_type": "QC metric", "reference": reference, "name": name or reference}
+
+
+def curation_row(name):
+    """Build a curation metric row"""
+    return {"object_type": "Curation metric", "reference": None, "name": name}
+
+
+class HeldExecutor:
+    """Executor that queues work without running it"""
+
+    def __init__(self):
+        """Create an empty queue"""
+        self.futures = []
+        self.calls = []
+
+    def submit(self, fn, *args):
+        """Queue a call, returning its pending future"""
+        future = Future()
+        self.futures.append(future)
+        self.calls.append(args)
+        return future
+
+
+def make_metrics(prefetch_media=True):
+    """Build a Metrics panel around the paging and prefetching state only, skipping the data and the tree"""
+    metrics = Metrics.__new__(Metrics)
+    # URL syncing needs a server session, keep it switched off
+    metrics._syncing = True
+    metrics.settings = SimpleNamespace(prefetch_media=prefetch_media)
+    metrics.prefetcher = MagicMock()
+    metrics.tree = SimpleNamespace(active=[(0,)])
+    metrics._get_node_by_path = lambda path: None
+    metrics._open_tab = None
+    metrics._pending_tabs = []
+    metrics._rendered_tabs = []
+    metrics.accordion = None
+    metrics.content_panel = pn.Column()
+    metrics.load_more_button = pn.widgets.Button(name="Load more", visible=False)
+    metrics._build_qc_metric_tabs = lambda specs: [
+        (reference, MetricTab(reference, FakeMedia(reference), [])) for reference, _ in specs
+    ]
+    metrics._build_curation_metric_tabs = lambda rows: [
+        (row["name"], CurationTab(row["name"], MagicMock())) for row in rows
+    ]
+    return metrics
+
+
+def prefetched_references(prefetcher):
+    """References passed to the last prefetch() call of a mocked prefetcher"""
+    return [media.reference for media in prefetcher.prefetch.call_args[0][0]]
+
+
+class TestOpenTabResolution(unittest.TestCase):
+    """Tests for resolving the media of opened tabs concurrently"""
+
+    def setUp(self):
+        """Queue resolutions on a held executor"""
+        self.executor = HeldExecutor()
+        patcher = patch(
+            "aind_qc_portal.view_contents.panels.media.prefetch.get_thread_pool", return_value=self.executor
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def resolved_references(self):
+        """References whose resolution has been queued"""
+        return [media.reference for (media,) in self.executor.calls]
+
+    def test_showing_rows_resolves_first_tabs_concurrently(self):
+        """The first tabs of a selection are resolved together, even when prefetching is off"""
+        metrics = make_metrics(prefetch_media=False)
+        metrics._show_metric_rows([qc_row(f"ref{i}") for i in range(10)])
+
+        self.assertEqual(self.resolved_references(), [f"ref{i}" for i in range(RESOLVE_TABS_ON_SHOW)])
+        self.assertTrue(metrics._rendered_tabs[0].tab_media.loaded)
+        self.assertFalse(any(tab.tab_media.loaded for tab in metrics._rendered_tabs[1:]))
+
+    def test_opening_tabs_resolves_them_concurrently(self):
+        """Tabs opened together are all queued for resolution before any of them is loaded"""
+        metrics = make_metrics(prefetch_media=False)
+        metrics._show_metric_rows([qc_row(f"ref{i}") for i in range(10)])
+        self.executor.calls.clear()
+        loaded_when_queued = []
+        submit = self.executor.submit
+
+        def record_submit(fn, *args):
+            """Record whether any opened tab was loaded before this resolution was queued"""
+            loaded_when_queued.append(any(tab.tab_media.loaded for tab in metrics._rendered_tabs[5:]))
+            return submit(fn, *args)
+
+        self.executor.submit = record_submit
+        metrics.accordion.active = [0, 5, 6, 7]
+
+        self.assertEqual(self.resolved_references(), ["ref5", "ref6", "ref7"])
+        self.assertEqual(loaded_when_queued, [False, False, False])
+        self.assertTrue(all(tab.tab_media.loaded for tab in metrics._rendered_tabs[5:8]))
+
+
+class TestTabPrefetch(unittest.TestCase):
+    """Tests for prefetching the media of tabs next to an opened tab"""
+
+    def setUp(self):
+        """Skip the concurrent resolution of opened tabs, it is tested separately"""
+        patcher = patch("aind_qc_portal.view_contents.panels.metrics.resolve_in_background")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_showing_rows_prefetches_tabs_next_to_the_open_one(self):
+        """Showing a selection prefetches the tabs after the first one with the sibling nodes"""
+        metrics = make_metrics()
+        metrics._show_metric_rows([qc_row(f"ref{i}") for i in range(10)])
+        metrics._prefetch_neighbours((0,))
+
+        self.assertEqual(
+            prefetched_references(metrics.prefetcher),
+            [f"ref{i}" for i in range(1, 1 + PREFETCH_TABS_AROUND_OPEN)],
+        )
+
+    def test_opening_a_tab_prefetches_both_sides(self):
+        """Tabs before and after the opened one are prefetched"""
+        metrics = make_metrics()
+        metrics._show_metric_rows([qc_row(f"ref{i}") for i in range(10)])
+
+        metrics.accordion.active = [0, 5]
+
+        self.assertTrue(metrics._rendered_tabs[5].tab_media.loaded)
+        expected = [f"ref{i}" for i in range(5 - PREFETCH_TABS_AROUND_OPEN, 5)]
+        expected += [f"ref{i}" for i in range(6, 6 + PREFETCH_TABS_AROUND_OPEN)]
+        self.assertEqual(prefetched_references(metrics.prefetcher), expected)
+
+    def test_no_tab_prefetch_when_disabled(self):
+        """Nothing is prefetched when the setting is off"""
+        metrics = make_metrics(prefetch_media=False)
+        metrics._show_metric_rows([qc_row(f"ref{i}") for i in range(4)])
+        metrics.accordion.active = [0, 2]
+
+        metrics.prefetcher.prefetch.assert_not_called()
+
+    def test_prefetched_tabs_are_counted_as_hits(self):
+        """Opening a tab that was prefetched next to the previous one is recorded as a hit"""
+        metrics = make_metrics()
+        metrics.prefetcher = MediaPrefetcher()
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+
+        with patch("aind_qc_portal.view_contents.panels.media.prefetch.get_thread_pool", return_value=executor):
+            metrics._show_metric_rows([qc_row(f"ref{i}") for i in range(10)])
+            metrics._prefetch_neighbours((0,))
+            executor.submit(lambda: None).result()
+            metrics.accordion.active = [0, 2]
+
+        self.assertEqual((metrics.prefetcher.hits, metrics.prefetcher.misses), (1, 1))
+
+
+class TestNeighbourPrefetch(unittest.TestCase):
+    """Tests for prefetching the media of tree nodes next to a selected one"""
+
+    def test_reselect_cancels_neighbour_prefetch(self):
+        """Selecting another tree node cancels the prefetch queued for the previous one's neighbours"""
+        metrics = make_metrics()
+        metrics.prefetcher = MediaPrefetcher()
+        metrics._get_media_panel = FakeMedia
+        nodes = [{"metric_rows": [qc_row(f"node{n}-ref{i}") for i in range(6)]} for n in range(3)]
+        metrics._get_node_by_path = lambda path: nodes[path[0]] if path[0] < len(nodes) else None
+        executor = HeldExecutor()
+
+        with (
+            patch("aind_qc_portal.view_contents.panels.media.prefetch.get_thread_pool", return_value=executor),
+            patch("aind_qc_portal.view_contents.panels.metrics.resolve_in_background"),
+        ):
+            metrics._on_tree_selection(SimpleNamespace(new=[(0,)]))
+            first = list(executor.futures)
+            metrics._on_tree_selection(SimpleNamespace(new=[(1,)]))
+
+        # The tabs after the opened one, then the first node only has a next sibling and the second has both
+        self.assertEqual(len(first), PREFETCH_TABS_AROUND_OPEN + 4)
+        self.assertTrue(all(future.cancelled() for future in first))
+        self.assertEqual(len(executor.futures), len(first) + PREFETCH_TABS_AROUND_OPEN + 8)
+        self.assertFalse(any(future.cancelled() for future in executor.futures[len(first) :]))
+
+
+class TestTabPaging(unittest.TestCase):
+    """Tests for building tabs a page at a time and loading them when opened"""
+
+    def test_pages_keep_qc_tabs_before_curation_tabs(self):
+        """Tabs are built a page at a time, in selection order with QC tabs first"""
+        metrics = make_metrics(prefetch_media=False)
+        rows = [curation_row("curation0")] + [qc_row(f"ref{i}") for i in range(METRIC_TAB_PAGE_SIZE + 3)]
+        metrics._show_metric_rows(rows)
+
+        self.assertEqual([tab.tab_name for tab in metrics._rendered_tabs], [f"ref{i}" for i in range(20)])
+        self.assertEqual(len(metrics.accordion), METRIC_TAB_PAGE_SIZE)
+        self.assertTrue(metrics.load_more_button.visible)
+        self.assertEqual(metrics.load_more_button.name, "Load 4 more (4 remaining)")
+
+        metrics._on_load_more(None)
+
+        names = [tab.tab_name for tab in metrics._rendered_tabs]
+        self.assertEqual(names[METRIC_TAB_PAGE_SIZE:], ["ref20", "ref21", "ref22", "curation0"])
+        self.assertEqual(len(metrics.accordion), METRIC_TAB_PAGE_SIZE + 4)
+        self.assertFalse(metrics.load_more_button.visible)
+
+    def test_only_open_tabs_are_loaded(self):
+        """The first tab is loaded, others load when opened and are unloaded when closed"""
+        metrics = make_metrics(prefetch_media=False)
+        metrics._show_metric_rows([qc_row(f"ref{i}") for i in range(3)])
+        metrics._rendered_tabs[0].unload = MagicMock()
+
+        self.assertEqual([tab.tab_media.loaded for tab in metrics._rendered_tabs], [True, False, False])
+
+        metrics.accordion.active = [2]
+
+        self.assertTrue(metrics._rendered_tabs[2].tab_media.loaded)
+        self.assertFalse(metrics._rendered_tabs[1].tab_media.loaded)
+        metrics._rendered_tabs[0].unload.assert_called_once()
+
+    def test_single_tab_is_shown_without_accordion(self):
+        """A selection with one tab shows it directly"""
+        metrics = make_metrics(prefetch_media=False)
+        metrics._show_metric_rows([qc_row("ref0"), qc_row("ref0", name="other metric")])
+
+        self.assertIsNone(metrics.accordion)
+        self.assertTrue(metrics._rendered_tabs[0].tab_media.loaded)
+        self.assertFalse(metrics.load_more_button.visible)
+
+
+def make_tree_metrics(statuses):
+    """Build a Metrics panel around the tree cache, with metrics "a" tagged probe:A and "b" tagged probe:B"""
+    metrics = Metrics.__new__(Metrics)
+    metrics.data = SimpleNamespace(
+        dataframe=pd.DataFrame(
+            [
+                {"name": "a", "stage": "Raw data", "tags": {"probe": "A"}},
+                {"name": "b", "stage": "Raw data", "tags": {"probe": "B"}},
+            ]
+        ),
+        metric_status=pd.DataFrame({"name": list(statuses), "evaluated_status": list(statuses.values())}),
+    )
+    metrics.settings = SimpleNamespace(default_grouping=["stage"])
+    metrics.tree = SimpleNamespace(items=[])
+    metrics._all_metrics = None
+    metrics._tree_cache = {}
+    metrics._stale_tree_keys = set()
+
+    def submit_change(metric_name, column_name, value):
+        """Apply a status change to the metric status table, as the submit callback does"""
+        status = metrics.data.metric_status
+        status.loc[status["name"] == metric_name, "evaluated_status"] = value
+
+    metrics._submit_change_callback = submit_change
+    return metrics
+
+
+class TestTreeCache(unittest.TestCase):
+    """Tests for caching the tree of each grouping across status changes"""
+
+    def test_grouping_is_built_once(self):
+        """Getting a grouping again returns the cached nodes"""
+        metrics = make_tree_metrics({"a": "Pass", "b": "Pass"})
+        nodes = metrics._get_tree_nodes(["probe"])
+
+        self.assertIs(metrics._get_tree_nodes([("probe",)]), nodes)
+        self.assertEqual([node["label"] for node in nodes], ["probe: A (1)", "probe: B (1)"])
+
+    def test_status_change_refreshes_other_groupings_when_shown(self):
+        """A status change marks the other cached groupings stale, they are refreshed when next shown"""
+        metrics = make_tree_metrics({"a": "Pass", "b": "Pass"})
+        metrics._get_tree_nodes(["stage"])
+        probe_nodes = metrics._get_tree_nodes(["probe"])
+
+        metrics._handle_change("a", "status", "Fail")
+
+        self.assertEqual(metrics._stale_tree_keys, {get_grouping_key(["probe"])})
+        self.assertEqual(probe_nodes[0]["status"], "Pass")
+
+        refreshed = metrics._get_tree_nodes(["probe"])
+
+        self.assertIs(refreshed, probe_nodes)
+        self.assertEqual([node["status"] for node in refreshed], ["Fail", "Pass"])
+        self.assertEqual(refreshed[0]["color"], "error")
+        self.assertEqual(metrics._stale_tree_keys, set())
+
+    def test_value_change_keeps_cache_fresh(self):
+        """Changes to other columns don't mark cached groupings stale"""
+        metrics = make_tree_metrics({"a": "Pass", "b": "Pass"})
+        metrics._get_tree_nodes(["probe"])
+
+        metrics._handle_change("a", "value", "1")
+
+        self.assertEqual(metrics._stale_tree_keys, set())
+
+
+class TestStatusColors(unittest.TestCase):
+    """Tests for the status colors and icons of tree nodes"""
+
+    def test_palette_colors(self):
+        """Each status maps to a theme palette color"""
+        self.assertEqual(get_status_palette_color("Fail"), "error")
+        self.assertEqual(get_status_palette_color("Pending"), "info")
+        self.assertEqual(get_status_palette_color("Pass"), "success")
+
+    def test_update_tree_statuses_aggregates_children(self):
+        """Parents take the worst status of their metrics, children are updated recursively"""
+        child_a = {"metric_rows": [{"name": "a"}]}
+        child_b = {"metric_rows": [{"name": "b"}]}
+        nodes = [{"metric_rows": [{"name": "a"}, {"name": "b"}], "items": [child_a, child_b]}]
+        status_df = pd.DataFrame({"name": ["a", "b"], "evaluated_status": ["Pending", "Pass"]})
+
+        update_tree_statuses(nodes, status_df)
+
+        self.assertEqual(nodes[0]["status"], "Pending")
+        self.assertEqual(nodes[0]["color"], "info")
+        self.assertEqual(nodes[0]["icon"], get_status_icon("Pending"))
+        self.assertEqual((child_a["color"], child_b["color"]), ("info", "success"))
+
+
+class TreeSettings(param.Parameterized):
+    """Settings with the parameters the metrics panel watches"""
+
+    default_grouping = param.List(default=["probe"])
+    prefetch_media = param.Boolean(default=False)
+
+
+class TestLargeTree(unittest.TestCase):
+    """Tests for the document sent to the browser for a large tree"""
+
+    def test_status_colors_do_not_scale_with_the_tree(self):
+        """A 5000 node tree is colored by the same three CSS rules, no script runs on the tree's DOM"""
+        n_nodes = 5000
+        dataframe = pd.DataFrame(
+            [{"name": f"m{i}", "stage": "Raw data", "tags": {"probe": f"P{i}"}} for i in range(n_nodes)]
+        )
+        statuses = (["Pass", "Fail", "Pending"] * n_nodes)[:n_nodes]
+        data = SimpleNamespace(
+            dataframe=dataframe,
+            metric_status=pd.DataFrame({"name": dataframe["name"], "evaluated_status": statuses}),
+            default_grouping=["probe"],
+        )
+        with patch.object(type(pn.state), "location", new_callable=PropertyMock, return_value=Location()):
+            metrics = Metrics(data, MagicMock(), TreeSettings())
+
+        doc = Document()
+        doc.add_root(pn.panel(metrics).get_root(doc))
+        document_json = serialize_json(doc.to_json())
+
+        self.assertEqual(len(metrics.tree.items), n_nodes)
+        self.assertEqual(len(TREE_STATUS_SX), 3)
+        self.assertEqual(document_json.count(".labelIcon"), len(TREE_STATUS_SX))
+        self.assertEqual(document_json.count('["color","error"]'), statuses.count("Fail"))
+        self.assertNotIn("MutationObserver", document_json)
+        self.assertNotIn("&lt;script", document_json)
+        self.assertNotIn("<script", document_json)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,22 @@
 """Unit tests for plugin.py request handlers"""
 
 import json
+import os
+import tempfile
+import threading
 import unittest
 from unittest.mock import MagicMock, patch
-from urllib.parse import urlencode
+from urllib.parse import quote, urlencode
 
+import httpx
 from tornado.testing import AsyncHTTPTestCase
 from tornado.web import Application
 
 from aind_qc_portal import plugin
+from aind_qc_portal.view_contents.panels.media import transcode
+from aind_qc_portal.view_contents.panels.media.disk_cache import MediaDiskCache
+
+HTTPX_ASYNC_CLIENT = httpx.AsyncClient
 
 
 def _make_app() -> Application:
@@ -18,6 +26,7 @@ def _make_app() -> Application:
 def _reset_state() -> None:
     plugin._ISSUED_TOKENS.clear()
     plugin._PENDING_UPSERTS.clear()
+    plugin._LOCATED_REFERENCES.clear()
 
 
 class TestIssueMetadataTokenHandler(AsyncHTTPTestCase):
@@ -61,8 +70,7 @@ class TestIssueMetadataTokenHandler(AsyncHTTPTestCase):
     def test_test_domain_redirect_allowed(self):
         with patch.object(plugin, "_panel_user_from_handler", return_value="alice"):
             response = self._fetch_no_follow(
-                "/metadata/token?"
-                + urlencode({"redirect": "https://data.allenneuraldynamics-test.org/x", "id": "abc"})
+                "/metadata/token?" + urlencode({"redirect": "https://data.allenneuraldynamics-test.org/x", "id": "abc"})
             )
         self.assertEqual(response.code, 302)
 
@@ -351,9 +359,7 @@ class TestUpsertMetadataHandler(AsyncHTTPTestCase):
         self.assertIn(t1, plugin._ISSUED_TOKENS)
         self.assertIn(t2, plugin._ISSUED_TOKENS)
         key = next(iter(plugin._PENDING_UPSERTS))
-        self.assertEqual(
-            plugin._PENDING_UPSERTS[key]["submissions"], {"alice": t1, "bob": t2}
-        )
+        self.assertEqual(plugin._PENDING_UPSERTS[key]["submissions"], {"alice": t1, "bob": t2})
 
     def test_failed_upsert_then_retry_with_new_token_succeeds(self):
         t1 = self._issue("alice", "abc")
@@ -398,9 +404,7 @@ class TestUpsertMetadataHandler(AsyncHTTPTestCase):
 
     def test_expired_token_is_pruned(self):
         token = self._issue("alice", "abc")
-        plugin._ISSUED_TOKENS[token]["issued_at"] = (
-            plugin._now() - plugin.AUTH_TOKEN_TTL_SECONDS - 10
-        )
+        plugin._ISSUED_TOKENS[token]["issued_at"] = plugin._now() - plugin.AUTH_TOKEN_TTL_SECONDS - 10
         response = self._post("/metadata/v2", {"_id": "abc"}, token)
         self.assertEqual(response.code, 401)
         self.assertNotIn(token, plugin._ISSUED_TOKENS)
@@ -662,6 +666,240 @@ class TestCorsHeaders(AsyncHTTPTestCase):
         self.assertNotIn("Access-Control-Allow-Origin", response.headers)
 
 
+class TestMediaPreviewHandler(AsyncHTTPTestCase):
+    """Tests for GET /media-preview/<asset_name>"""
+
+    RECORD = {
+        "name": "asset",
+        "location": "s3://bucket/asset",
+        "quality_control": {"metrics": [{"reference": "qc/plot.png"}, {"reference": "qc/stack.tif"}]},
+    }
+
+    def get_app(self) -> Application:
+        return _make_app()
+
+    def setUp(self):
+        super().setUp()
+        _reset_state()
+        self.docdb = MagicMock()
+        self.docdb.retrieve_docdb_records.return_value = [self.RECORD]
+        for name, value in (("_docdb_client", self.docdb), ("get_s3_url", MagicMock(return_value="https://signed"))):
+            patcher = patch.object(plugin, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _fetch(self, reference: str, width: str = "1200"):
+        return self.fetch(
+            "/media-preview/asset?" + urlencode({"reference": reference, "width": width}), follow_redirects=False
+        )
+
+    def test_unknown_reference_is_forbidden(self):
+        response = self._fetch("qc/other.png")
+        self.assertEqual(response.code, 403)
+
+    def test_invalid_width(self):
+        response = self._fetch("qc/plot.png", width="123")
+        self.assertEqual(response.code, 400)
+
+    def test_full_resolution_png_redirects(self):
+        response = self._fetch("qc/plot.png", width="full")
+        self.assertEqual(response.code, 302)
+        self.assertEqual(response.headers["Location"], "https://signed")
+
+    def test_preview_is_served(self):
+        with tempfile.NamedTemporaryFile(suffix=".webp") as f:
+            f.write(b"webp-data")
+            f.flush()
+            with patch.object(plugin, "get_preview", return_value=f.name) as get_preview:
+                response = self._fetch("qc/stack.tif", width="full")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b"webp-data")
+        self.assertEqual(response.headers["Content-Type"], "image/webp")
+        get_preview.assert_called_once_with("https://signed", ".tif", None)
+
+    def test_tiles_are_served(self):
+        with tempfile.TemporaryDirectory() as pyramid_dir:
+            os.makedirs(os.path.join(pyramid_dir, "0"))
+            with open(os.path.join(pyramid_dir, "0", "1_2.webp"), "wb") as f:
+                f.write(b"tile-data")
+            with patch.object(plugin, "get_pyramid", return_value=pyramid_dir):
+                query = "?" + urlencode({"reference": "qc/plot.png"})
+                tile = self.fetch("/media-tiles/asset/0/1_2.webp" + query)
+                missing = self.fetch("/media-tiles/asset/0/9_9.webp" + query)
+                traversal = self.fetch("/media-tiles/asset/..%2Finfo.json" + query)
+        self.assertEqual(tile.code, 200)
+        self.assertEqual(tile.body, b"tile-data")
+        self.assertEqual(missing.code, 404)
+        self.assertEqual(traversal.code, 404)
+        # The reference is validated against DocDB once and then cached
+        self.docdb.retrieve_docdb_records.assert_called_once()
+
+
+class TestMediaProxyHandler(AsyncHTTPTestCase):
+    """Tests for GET /media/<asset_name>/<reference>"""
+
+    RECORD = {
+        "name": "asset",
+        "location": "s3://bucket/asset",
+        "quality_control": {"metrics": [{"reference": "qc/video.mp4"}, {"reference": "qc/missing.mp4"}]},
+    }
+    CONTENT = bytes(range(256)) * 4
+
+    def get_app(self) -> Application:
+        return _make_app()
+
+    def setUp(self):
+        super().setUp()
+        _reset_state()
+        docdb = MagicMock()
+        docdb.retrieve_docdb_records.return_value = [self.RECORD]
+        get_s3_url = MagicMock(side_effect=lambda bucket, key: f"https://{bucket}.s3.amazonaws.com/{key}")
+        client = MagicMock(side_effect=lambda: HTTPX_ASYNC_CLIENT(transport=httpx.MockTransport(self._s3)))
+        for obj, name, value in (
+            (plugin, "_docdb_client", docdb),
+            (plugin, "get_s3_url", get_s3_url),
+            (plugin.httpx, "AsyncClient", client),
+        ):
+            patcher = patch.object(obj, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _s3(self, request: httpx.Request) -> httpx.Response:
+        """Serve one object with Range and If-None-Match support"""
+        if request.url.path != "/asset/qc/video.mp4":
+            return httpx.Response(404, text="NoSuchKey")
+        headers = {"ETag": '"etag-1"', "Accept-Ranges": "bytes", "Content-Type": "video/mp4"}
+        if request.headers.get("If-None-Match") == '"etag-1"':
+            return httpx.Response(304, headers=headers)
+        if "Range" in request.headers:
+            start, end = (int(i) for i in request.headers["Range"].removeprefix("bytes=").split("-"))
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(self.CONTENT)}"
+            return self._streamed(206, self.CONTENT[start : end + 1], headers)
+        return self._streamed(200, self.CONTENT, headers)
+
+    @staticmethod
+    def _streamed(status_code: int, content: bytes, headers: dict) -> httpx.Response:
+        """Build a response that is streamed like a real one, MockTransport reads bytes content eagerly"""
+
+        async def chunks():
+            for i in range(0, len(content), 100):
+                yield content[i : i + 100]
+
+        headers["Content-Length"] = str(len(content))
+        return httpx.Response(status_code, content=chunks(), headers=headers)
+
+    def _fetch(self, reference: str, headers: dict | None = None):
+        return self.fetch(f"/media/asset/{quote(reference, safe='')}", headers=headers)
+
+    def test_full_object(self):
+        response = self._fetch("qc/video.mp4")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, self.CONTENT)
+        self.assertEqual(response.headers["ETag"], '"etag-1"')
+        self.assertEqual(response.headers["Accept-Ranges"], "bytes")
+        self.assertIn("max-age", response.headers["Cache-Control"])
+
+    def test_range_request(self):
+        response = self._fetch("qc/video.mp4", headers={"Range": "bytes=10-19"})
+        self.assertEqual(response.code, 206)
+        self.assertEqual(response.body, self.CONTENT[10:20])
+        self.assertEqual(response.headers["Content-Range"], f"bytes 10-19/{len(self.CONTENT)}")
+
+    def test_not_modified(self):
+        response = self._fetch("qc/video.mp4", headers={"If-None-Match": '"etag-1"'})
+        self.assertEqual(response.code, 304)
+
+    def test_unknown_reference_is_forbidden(self):
+        response = self._fetch("qc/other.mp4")
+        self.assertEqual(response.code, 403)
+
+    def test_s3_error(self):
+        response = self._fetch("qc/missing.mp4")
+        self.assertEqual(response.code, 502)
+
+
+class TestMediaVideoHandler(AsyncHTTPTestCase):
+    """Tests for GET /media-video/<asset_name>/<reference>/<file>"""
+
+    RECORD = {
+        "name": "asset",
+        "location": "s3://bucket/asset",
+        "quality_control": {"metrics": [{"reference": "qc/video.avi"}]},
+    }
+
+    def get_app(self) -> Application:
+        return _make_app()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.cache = MediaDiskCache(self.tmp_dir.name)
+        super().setUp()
+        _reset_state()
+        docdb = MagicMock()
+        docdb.retrieve_docdb_records.return_value = [self.RECORD]
+        self.start_transcode = MagicMock()
+        self.streamable_name = MagicMock(return_value="name")
+        for module, name, value in (
+            (plugin, "_docdb_client", docdb),
+            (plugin, "get_s3_url", MagicMock(return_value="https://signed")),
+            (plugin, "get_media_disk_cache", MagicMock(return_value=self.cache)),
+            (plugin, "streamable_name", self.streamable_name),
+            (plugin, "start_transcode", self.start_transcode),
+            (transcode, "get_media_disk_cache", MagicMock(return_value=self.cache)),
+        ):
+            patcher = patch.object(module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _fetch(self, file_name: str, headers: dict | None = None):
+        return self.fetch(f"/media-video/asset/{quote('qc/video.avi', safe='')}/{file_name}", headers=headers)
+
+    def test_video_not_ready_starts_transcode(self):
+        response = self._fetch("video.mp4")
+        self.assertEqual(response.code, 404)
+        self.start_transcode.assert_called_once_with("https://signed", "name", "asset/qc/video.avi")
+
+    def test_video_is_served_with_ranges(self):
+        (self.cache.data_dir / "name_video.mp4").write_bytes(b"0123456789")
+        response = self._fetch("video.mp4", headers={"Range": "bytes=2-5"})
+        self.assertEqual(response.code, 206)
+        self.assertEqual(response.body, b"2345")
+        self.assertIn("max-age", response.headers["Cache-Control"])
+
+    def test_poster_is_extracted(self):
+        def make_poster(url, name):
+            path = self.cache.data_dir / f"{name}_poster.jpg"
+            path.write_bytes(b"jpeg-data")
+            return str(path)
+
+        transcoded = threading.Event()
+
+        # Extracted by the video's transcode job before it transcodes
+        with (
+            patch.object(transcode, "make_poster", side_effect=make_poster),
+            patch.object(transcode, "transcode", side_effect=lambda *args: transcoded.set()),
+        ):
+            response = self._fetch("poster.jpg")
+            self.assertTrue(transcoded.wait(5))
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b"jpeg-data")
+
+    def test_cached_poster_is_served_without_a_job(self):
+        (self.cache.data_dir / "name_poster.jpg").write_bytes(b"jpeg-data")
+        with patch.object(transcode, "_start_job") as start_job:
+            response = self._fetch("poster.jpg")
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.body, b"jpeg-data")
+        start_job.assert_not_called()
+
+    def test_streamable_video(self):
+        self.streamable_name.return_value = None
+        response = self._fetch("video.mp4")
+        self.assertEqual(response.code, 404)
+        self.start_transcode.assert_not_called()
+
+
 class TestCanonicalBody(unittest.TestCase):
     """Tests for _canonical_body helper"""
 
@@ -743,14 +981,10 @@ class TestPanelUserFromHandler(unittest.TestCase):
         self.assertIsNone(plugin._panel_user_from_handler(self._handler(b"")))
 
     def test_valid_user(self):
-        self.assertEqual(
-            plugin._panel_user_from_handler(self._handler(b"alice")), "alice"
-        )
+        self.assertEqual(plugin._panel_user_from_handler(self._handler(b"alice")), "alice")
 
     def test_non_utf8_returns_none(self):
-        self.assertIsNone(
-            plugin._panel_user_from_handler(self._handler(b"\xff\xfe\xff"))
-        )
+        self.assertIsNone(plugin._panel_user_from_handler(self._handler(b"\xff\xfe\xff")))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+"""Unit tests for view_contents/panels/media/prefetch.py"""
+
+import gc
+import unittest
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from aind_qc_portal.view_contents.panels.media.prefetch import MediaPrefetcher
+
+
+class FakeMedia:
+    """Media stand-in that counts resolutions"""
+
+    def __init__(self, reference):
+        """Create unresolved media for a reference"""
+        self.reference = reference
+        self.loaded = False
+        self.resolved = False
+        self.resolve_calls = 0
+
+    def resolve(self):
+        """Mark the media as resolved"""
+        self.resolve_calls += 1
+        self.resolved = True
+
+
+class TestMediaPrefetcher(unittest.TestCase):
+    """Tests for MediaPrefetcher"""
+
+    def setUp(self):
+        """Run prefetches on a private pool"""
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        patcher = patch(
+            "aind_qc_portal.view_contents.panels.media.prefetch.get_thread_pool", return_value=self.executor
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.executor.shutdown)
+
+    def prefetch(self, prefetcher, media_panels):
+        """Prefetch and wait for the work to finish"""
+        prefetcher.prefetch(media_panels)
+        self.executor.submit(lambda: None).result()
+
+    def test_counts_hits_and_misses(self):
+        """Loading prefetched media is a hit, loading other media a miss"""
+        prefetcher = MediaPrefetcher()
+        warm, cold = FakeMedia("warm"), FakeMedia("cold")
+        self.prefetch(prefetcher, [warm])
+
+        prefetcher.record_load(warm)
+        prefetcher.record_load(cold)
+
+        self.assertEqual((prefetcher.hits, prefetcher.misses), (1, 1))
+        self.assertEqual(prefetcher.hit_rate, 0.5)
+
+    def test_loaded_media_is_not_counted(self):
+        """Media that is already loaded is neither resolved again nor counted"""
+        prefetcher = MediaPrefetcher()
+        media = FakeMedia("loaded")
+        media.loaded = True
+        self.prefetch(prefetcher, [media])
+        prefetcher.record_load(media)
+
+        self.assertEqual(media.resolve_calls, 0)
+        self.assertEqual((prefetcher.hits, prefetcher.misses), (0, 0))
+
+    def test_does_not_keep_media_alive(self):
+        """Prefetched media that is dropped elsewhere can be collected"""
+        prefetcher = MediaPrefetcher()
+        media = FakeMedia("dropped")
+        ref = weakref.ref(media)
+        self.prefetch(prefetcher, [media])
+        prefetcher.cancel()
+
+        del media
+        gc.collect()
+
+        self.assertIsNone(ref())
+        self.assertEqual(len(prefetcher._prefetched), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
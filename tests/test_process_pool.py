@@ -0,0 +1,117 @@
+"""Unit tests for view_contents/panels/media/process_pool.py"""
+
+import io
+import threading
+import unittest
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from aind_qc_portal.view_contents.panels.media.process_pool import (
+    SessionTasks,
+    SharedArray,
+    encode_png,
+    get_process_pool,
+    get_session_tasks,
+)
+
+
+def fill(shared: SharedArray, value: int) -> int:
+    """Fill a shared array in a worker and return its previous sum"""
+    try:
+        total = int(shared.array.sum())
+        shared.array[...] = value
+        return total
+    finally:
+        shared.detach()
+
+
+class FakeDocument:
+    """Session document, only used as a key"""
+
+
+class TestSharedArray(unittest.TestCase):
+    """Test handing arrays to worker processes"""
+
+    def test_worker_process(self):
+        """Test that a worker reads and writes the same memory"""
+        with SharedArray.copy_of(np.arange(12, dtype=np.int32).reshape(3, 4)) as shared:
+            self.assertEqual(get_process_pool().submit(fill, shared, 7).result(), 66)
+            np.testing.assert_array_equal(shared.array, np.full((3, 4), 7))
+
+    def test_close(self):
+        """Test that closing twice is fine and drops the array"""
+        shared = SharedArray((2, 2), np.uint8)
+        shared.close()
+        shared.close()
+        self.assertIsNone(shared.array)
+
+    def test_encode_png(self):
+        """Test that images and palette images are encoded"""
+        with SharedArray.copy_of(np.arange(256, dtype=np.uint8).reshape(16, 16)) as shared:
+            gray = Image.open(io.BytesIO(encode_png(shared)))
+            self.assertEqual(gray.mode, "L")
+            colored = Image.open(io.BytesIO(encode_png(shared, [255 - i // 3 for i in range(768)])))
+            self.assertEqual(colored.mode, "P")
+            np.testing.assert_array_equal(np.asarray(colored), shared.array)
+
+
+class TestSessionTasks(unittest.TestCase):
+    """Test per-session limits and replacement of stale tasks"""
+
+    def setUp(self):
+        """Create a session queue over one thread, blocked until release is set"""
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.executor.shutdown)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.tasks = SessionTasks(max_tasks=2, executor=lambda: self.executor)
+        self.running = self.tasks.submit(self.release.wait, 5)
+
+    def test_newer_task_replaces_stale(self):
+        """Test that a task that hasn't started is cancelled at the limit"""
+        stale = self.tasks.submit(int, 1)
+        latest = self.tasks.submit(int, 2)
+        self.assertTrue(stale.cancelled())
+        self.assertEqual(len(self.tasks), 2)
+        self.release.set()
+        self.assertEqual(latest.result(), 2)
+        with self.assertRaises(CancelledError):
+            stale.result()
+
+    def test_background_tasks_are_replaced_first(self):
+        """Test that prefetches are replaced before older tasks the user is waiting for"""
+        tasks = SessionTasks(max_tasks=3, executor=lambda: self.executor)
+        render = tasks.submit(int, 1)
+        prefetch = tasks.submit(int, 2, background=True)
+        tasks.submit(int, 3)
+        newer = tasks.submit(int, 4)
+        self.assertTrue(prefetch.cancelled())
+        self.assertFalse(render.cancelled())
+        self.release.set()
+        self.assertEqual((render.result(), newer.result()), (1, 4))
+
+    def test_background_task_never_replaces_render(self):
+        """Test that a prefetch waits instead of cancelling a render"""
+        render = self.tasks.submit(int, 1)
+        prefetch = []
+        thread = threading.Thread(target=lambda: prefetch.append(self.tasks.submit(int, 2, background=True)))
+        thread.start()
+        thread.join(0.2)
+        self.assertFalse(prefetch)
+        self.release.set()
+        thread.join(5)
+        self.assertEqual(render.result(), 1)
+        self.assertEqual(prefetch[0].result(), 2)
+
+    def test_session_tasks(self):
+        """Test that each session has its own queue"""
+        doc = FakeDocument()
+        self.assertIs(get_session_tasks(doc), get_session_tasks(doc))
+        self.assertIsNot(get_session_tasks(doc), get_session_tasks(FakeDocument()))
+        self.assertIs(get_session_tasks(None), get_session_tasks(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""Unit tests for view_contents/panels/media/curation_apps/projection_cache.py"""
+
+import threading
+import unittest
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from aind_qc_portal.view_contents.panels.media.curation_apps.projection_cache import ProjectionCache
+
+
+class Counter:
+    """Compute function that records its calls"""
+
+    def __init__(self):
+        """No calls yet"""
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, z: int, w: int) -> int:
+        """Record the call"""
+        with self.lock:
+            self.calls.append((z, w))
+        return z * 100 + w
+
+
+class TestProjectionCache(unittest.TestCase):
+    """Test caching, eviction and prefetching"""
+
+    def setUp(self):
+        """Create a cache and an executor"""
+        self.compute = Counter()
+        self.cache = ProjectionCache(self.compute, max_entries=3)
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.executor.shutdown)
+
+    def test_cached(self):
+        """Test that values are computed once"""
+        self.assertEqual(self.cache.get((1, 2)), 102)
+        self.assertEqual(self.cache.get((1, 2)), 102)
+        self.assertEqual(self.compute.calls, [(1, 2)])
+
+    def test_bounded(self):
+        """Test that the least recently used entry is dropped"""
+        for z in range(3):
+            self.cache.get((z, 0))
+        self.cache.get((0, 0))
+        self.cache.get((3, 0))
+        self.assertEqual(len(self.cache), 3)
+        self.assertNotIn((1, 0), self.cache)
+        self.assertIn((0, 0), self.cache)
+
+    def test_prefetched_values_are_not_recomputed(self):
+        """Test that get() waits for a running prefetch instead of computing again"""
+        futures = self.cache.prefetch([(5, 1), (6, 1)], self.executor)
+        self.assertEqual(self.cache.get((6, 1)), 601)
+        for future in futures:
+            future.result()
+        self.assertEqual(sorted(self.compute.calls), [(5, 1), (6, 1)])
+        self.assertEqual(self.cache.prefetch([(5, 1)], self.executor), [])
+
+    def test_cancelled_prefetch(self):
+        """Test that a prefetch cancelled before it ran is computed on demand"""
+        release = threading.Event()
+        blocker = self.executor.submit(release.wait, 5)
+        self.executor.submit(release.wait, 5)
+        [future] = self.cache.prefetch([(7, 0)], self.executor)
+        self.assertTrue(future.cancel())
+        release.set()
+        blocker.result()
+        self.assertEqual(self.cache.get((7, 0)), 700)
+        self.assertEqual(self.compute.calls, [(7, 0)])
+
+    def test_failed_prefetch_is_retried(self):
+        """Test that errors in the background are retried so that the caller sees them"""
+        fail = [True]
+
+        def compute(z):
+            """Fail the first time"""
+            if fail.pop() if fail else False:
+                raise ValueError("read failed")
+            return z
+
+        cache = ProjectionCache(compute)
+        cache.prefetch([(1,)], self.executor)[0].exception()
+        self.assertEqual(cache.get((1,)), 1)
+
+    def test_bound_method_held_weakly(self):
+        """Test that the cache doesn't keep the object computing its values alive"""
+
+        class Owner:
+            """Object with a cache of its own method"""
+
+            def __init__(self):
+                """Create the cache"""
+                self.cache = ProjectionCache(self.compute)
+
+            def compute(self, z):
+                """Compute a value"""
+                return z
+
+        owner = Owner()
+        cache = owner.cache
+        self.assertEqual(cache.get((3,)), 3)
+        ref = weakref.ref(owner)
+        del owner
+        self.assertIsNone(ref())
+        with self.assertRaises(ReferenceError):
+            cache.get((4,))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+"""Unit tests for view_contents/panels/media/refresh.py"""
+
+import gc
+import unittest
+from unittest.mock import MagicMock
+
+from aind_qc_portal.view_contents.panels.media.refresh import REFRESH_BATCH_WINDOW, URLRefreshScheduler
+from aind_qc_portal.view_contents.panels.media.utils import PRESIGNED_URL_MARGIN
+
+NOW = 1_800_000_000
+
+
+def signed_url(expires: float) -> str:
+    """A presigned URL (SigV2 style) that expires at the given time"""
+    return f"https://bucket.s3.amazonaws.com/key.png?AWSAccessKeyId=KEY&Signature=abc&Expires={int(expires)}"
+
+
+class FakeMedia:
+    """Implements the interface the scheduler expects from Media"""
+
+    def __init__(self, next_url: str | None = None):
+        """Return next_url when re-signed"""
+        self.reference = "key.png"
+        self.next_url = next_url
+        self.urls = []
+
+    def resign_url(self) -> str | None:
+        """Return the next URL"""
+        return self.next_url
+
+    def set_url(self, url: str):
+        """Record the URLs that were applied"""
+        self.urls.append(url)
+
+
+class TestURLRefreshScheduler(unittest.TestCase):
+    """Test scheduling, batching and releasing refreshes"""
+
+    def setUp(self):
+        """Create a scheduler without starting its thread"""
+        self.scheduler = URLRefreshScheduler()
+
+    def test_refreshed_when_due(self):
+        """Test that URLs are refreshed PRESIGNED_URL_MARGIN before they expire, then rescheduled"""
+        expiry = NOW + 3600
+        media = FakeMedia(next_url=signed_url(expiry + 3600))
+        self.assertTrue(self.scheduler.schedule(media, signed_url(expiry)))
+
+        self.assertEqual(self.scheduler.refresh_due(expiry - PRESIGNED_URL_MARGIN - 1), 0)
+        self.assertEqual(self.scheduler.refresh_due(expiry - PRESIGNED_URL_MARGIN), 1)
+        self.assertEqual(media.urls, [signed_url(expiry + 3600)])
+        # Rescheduled for the new URL
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(self.scheduler.refresh_due(expiry - PRESIGNED_URL_MARGIN), 0)
+
+    def test_entries_due_soon_are_batched(self):
+        """Test that entries due shortly after the first due entry are refreshed with it"""
+        due = NOW + PRESIGNED_URL_MARGIN
+        media = [FakeMedia(signed_url(NOW + 7200)) for _ in range(3)]
+        self.scheduler.schedule(media[0], signed_url(due))
+        self.scheduler.schedule(media[1], signed_url(due + REFRESH_BATCH_WINDOW - 1))
+        self.scheduler.schedule(media[2], signed_url(due + REFRESH_BATCH_WINDOW + 1))
+
+        self.assertEqual(self.scheduler.refresh_due(NOW), 2)
+        self.assertEqual(len(media[2].urls), 0)
+
+    def test_urls_without_expiry_are_not_scheduled(self):
+        """Test that local files and unsigned URLs are not scheduled"""
+        media = FakeMedia()
+        self.assertFalse(self.scheduler.schedule(media, "/tmp/image.png"))
+        self.assertFalse(self.scheduler.schedule(media, "https://example.com/image.png"))
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_rescheduling_replaces_entry(self):
+        """Test that a media only has one entry"""
+        media = FakeMedia(signed_url(NOW + 7200))
+        self.scheduler.schedule(media, signed_url(NOW + PRESIGNED_URL_MARGIN))
+        self.scheduler.schedule(media, signed_url(NOW + 3600))
+        self.assertEqual(len(self.scheduler), 1)
+        self.assertEqual(self.scheduler.refresh_due(NOW), 0)
+
+    def test_failed_resign_is_retried(self):
+        """Test that a failed re-sign keeps the entry and retries after REFRESH_BATCH_WINDOW"""
+        media = FakeMedia(next_url=None)
+        self.scheduler.schedule(media, signed_url(NOW + PRESIGNED_URL_MARGIN))
+        self.assertEqual(self.scheduler.refresh_due(NOW), 0)
+        self.assertEqual(len(self.scheduler), 1)
+
+        media.next_url = signed_url(NOW + 7200)
+        self.assertEqual(self.scheduler.refresh_due(NOW + REFRESH_BATCH_WINDOW), 1)
+
+    def test_release(self):
+        """Test that released and garbage collected media are not refreshed"""
+        released = FakeMedia(signed_url(NOW + 7200))
+        collected = FakeMedia(signed_url(NOW + 7200))
+        self.scheduler.schedule(released, signed_url(NOW + PRESIGNED_URL_MARGIN))
+        self.scheduler.schedule(collected, signed_url(NOW + PRESIGNED_URL_MARGIN))
+
+        self.scheduler.release(released)
+        del collected
+        gc.collect()
+
+        self.assertEqual(self.scheduler.refresh_due(NOW), 0)
+        self.assertEqual(released.urls, [])
+
+    def test_collected_media_do_not_leak_or_collide(self):
+        """Test that collected media leave no current entry behind to be matched by a later media"""
+        collected = FakeMedia(signed_url(NOW + 7200))
+        self.scheduler.schedule(collected, signed_url(NOW + PRESIGNED_URL_MARGIN))
+        del collected
+        gc.collect()
+
+        self.assertEqual(len(self.scheduler._current), 0)
+
+        media = FakeMedia(signed_url(NOW + 7200))
+        self.scheduler.schedule(media, signed_url(NOW + PRESIGNED_URL_MARGIN))
+        self.assertEqual(self.scheduler.refresh_due(NOW), 1)
+
+    def test_session_destroyed_releases_document(self):
+        """Test that destroying a session releases its media and that updates go through the document"""
+        doc = MagicMock()
+        media = [FakeMedia(signed_url(NOW + 7200)) for _ in range(2)]
+        for m in media:
+            self.scheduler._push(m, doc, NOW)
+        doc.on_session_destroyed.assert_called_once()
+
+        self.assertEqual(self.scheduler.refresh_due(NOW), 2)
+        doc.add_next_tick_callback.assert_called_once()
+        self.assertEqual(media[0].urls, [])
+
+        destroyed = doc.on_session_destroyed.call_args[0][0]
+        destroyed(MagicMock())
+        self.assertEqual(len(self.scheduler), 0)
+        # Updates queued before the session was destroyed are dropped
+        doc.add_next_tick_callback.call_args[0][0]()
+        self.assertEqual(media[0].urls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
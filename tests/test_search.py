@@ -0,0 +1,133 @@
+"""Unit tests for search.py"""
+
+import unittest
+from types import SimpleNamespace
+
+import pandas as pd
+
+from aind_qc_portal.view_contents.data import ViewData
+from aind_qc_portal.view_contents.data_utils import encode_dict_value
+from aind_qc_portal.view_contents.search import MetricSearchIndex, parse_query, tokenize
+
+
+def make_dataframe():
+    """Build a small metrics dataframe in the same shape as ViewData.dataframe"""
+    metrics = [
+        {
+            "name": "Probe drift",
+            "description": "Drift of the probe over the session",
+            "tags": {"probe": "ProbeA", "type": "Drift"},
+            "modality": {"abbreviation": "ecephys"},
+            "stage": "Raw data",
+        },
+        {
+            "name": "PSD wide band",
+            "description": "Power spectral density",
+            "tags": {"probe": "ProbeB", "type": "PSD"},
+            "modality": {"abbreviation": "ecephys"},
+            "stage": "Raw data",
+        },
+        {
+            "name": "Unit yield",
+            "description": "Number of units passing the probe drift threshold",
+            "tags": {"probe": "ProbeA", "type": "Yield"},
+            "modality": {"abbreviation": "ecephys"},
+            "stage": "Processing",
+        },
+    ]
+    for metric in metrics:
+        metric["tags"] = encode_dict_value(metric["tags"])
+    return pd.DataFrame.from_records(metrics)
+
+
+def make_status(dataframe, statuses):
+    """Build a metric_status dataframe"""
+    return pd.DataFrame({"name": dataframe["name"], "evaluated_status": statuses})
+
+
+class TestQueryParsing(unittest.TestCase):
+    """Test tokenizing text and parsing queries"""
+
+    def test_tokenize(self):
+        """Test that text is lowercased and split on non-alphanumeric characters"""
+        self.assertEqual(tokenize("PSD (Wide Band)"), ["psd", "wide", "band"])
+        self.assertEqual(tokenize(None), [])
+
+    def test_parse_query(self):
+        """Test that filters are separated from free-text terms"""
+        terms, filters = parse_query('drift status:Pending stage:"Raw data"')
+        self.assertEqual(terms, ["drift"])
+        self.assertEqual(filters, [("status", "pending"), ("stage", "raw data")])
+
+
+class TestMetricSearchIndex(unittest.TestCase):
+    """Test searching metrics"""
+
+    def setUp(self):
+        """Build an index over the test metrics"""
+        self.dataframe = make_dataframe()
+        self.index = MetricSearchIndex(self.dataframe, make_status(self.dataframe, ["Pending", "Pass", "Fail"]))
+
+    def test_name_ranks_above_description(self):
+        """Test that a term in the name ranks above the same term in the description"""
+        self.assertEqual(self.index.search("drift"), [0, 2])
+
+    def test_all_terms_must_match(self):
+        """Test that multiple terms are combined with AND"""
+        self.assertEqual(self.index.search("drift units"), [2])
+        self.assertEqual(self.index.search("drift psd"), [])
+
+    def test_prefix_match(self):
+        """Test that a partial term matches the start of a token"""
+        self.assertEqual(self.index.search("spect"), [1])
+        self.assertEqual(self.index.search("prob"), [0, 1, 2])
+
+    def test_tag_values_are_searchable(self):
+        """Test that tag values are indexed as text"""
+        self.assertEqual(self.index.search("probeb"), [1])
+
+    def test_filters(self):
+        """Test status, stage, modality and tag filters"""
+        self.assertEqual(self.index.search("status:pending"), [0])
+        self.assertEqual(self.index.search('stage:"Raw data"'), [0, 1])
+        self.assertEqual(self.index.search("modality:ecephys probe:ProbeA"), [0, 2])
+        self.assertEqual(self.index.search("drift status:Fail"), [2])
+        self.assertEqual(self.index.search("status:unknown"), [])
+
+    def test_update_status(self):
+        """Test that status changes are reflected in filters"""
+        self.index.update_status("Unit yield", "Pending")
+        self.assertEqual(self.index.search("status:Pending"), [0, 2])
+        self.assertEqual(self.index.search("status:Fail"), [])
+
+    def test_limit_and_empty_query(self):
+        """Test limiting results and that an empty query matches nothing"""
+        self.assertEqual(self.index.search("probe", limit=1), [0])
+        self.assertEqual(self.index.search(""), [])
+
+
+class TestSearchMetrics(unittest.TestCase):
+    """Test searching the metric rows of a ViewData"""
+
+    def setUp(self):
+        """Build a data stand-in with a search index over the test metrics"""
+        dataframe = make_dataframe()
+        index = MetricSearchIndex(dataframe, make_status(dataframe, ["Pending", "Pass", "Fail"]))
+        self.data = SimpleNamespace(dataframe=dataframe, search_index=index)
+
+    def test_limit_returns_first_rows_and_total(self):
+        """Test that only the first rows are returned while the total counts every match"""
+        rows, total = ViewData.search_metrics(self.data, "probe", limit=2)
+        self.assertEqual([row["name"] for row in rows], ["Probe drift", "PSD wide band"])
+        self.assertEqual(total, 3)
+
+    def test_no_limit_and_no_index(self):
+        """Test that all rows are returned without a limit, and nothing before the index is built"""
+        rows, total = ViewData.search_metrics(self.data, "drift")
+        self.assertEqual([row["name"] for row in rows], ["Probe drift", "Unit yield"])
+        self.assertEqual(total, 2)
+        self.assertEqual(ViewData.search_metrics(SimpleNamespace(search_index=None), "drift"), ([], 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
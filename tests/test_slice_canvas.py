@@ -0,0 +1,61 @@
+"""Unit tests for view_contents/panels/media/curation_apps/slice_canvas.py"""
+
+import unittest
+
+import numpy as np
+
+from aind_qc_portal.view_contents.panels.media.curation_apps.contrast import ContrastHistogram
+from aind_qc_portal.view_contents.panels.media.curation_apps.slice_canvas import (
+    SliceCanvas,
+    apply_colormap,
+    colormap_palette,
+)
+
+
+class TestSliceCanvas(unittest.TestCase):
+    """Test the buffers sent to the browser"""
+
+    def test_uint8_buffer(self):
+        """Test that images with at most 256 bins are sent as one byte per pixel"""
+        arr = np.arange(200, dtype=np.uint16).reshape(10, 20)
+        canvas = SliceCanvas()
+        canvas.set_image(ContrastHistogram(arr))
+        self.assertEqual(canvas.image_shape, [10, 20])
+        self.assertEqual(canvas.bins, 200)
+        np.testing.assert_array_equal(np.frombuffer(canvas.data, dtype=np.uint8).reshape(10, 20), arr)
+
+    def test_uint16_buffer(self):
+        """Test that images with more bins are sent as little endian uint16"""
+        arr = np.arange(1000, 1600, dtype=np.uint16).reshape(20, 30)
+        canvas = SliceCanvas()
+        canvas.set_image(ContrastHistogram(arr))
+        self.assertEqual(canvas.bins, 600)
+        np.testing.assert_array_equal(np.frombuffer(canvas.data, dtype="<u2").reshape(20, 30), arr - 1000)
+
+    def test_unload(self):
+        """Test that unload callbacks run when the browser reports the page going away"""
+        calls = []
+        canvas = SliceCanvas()
+        canvas.on_unload(lambda: calls.append("first"))
+        canvas.on_unload(lambda: 1 / 0)
+        canvas.on_unload(lambda: calls.append("last"))
+        canvas._handle_msg("other")
+        self.assertEqual(calls, [])
+        canvas._handle_msg("unload")
+        self.assertEqual(calls, ["first", "last"])
+
+
+class TestColormap(unittest.TestCase):
+    """Test colormaps of server-rendered images"""
+
+    def test_apply_colormap(self):
+        """Test that gray stays grayscale and other colormaps use the palette"""
+        arr = np.array([[0, 255]], dtype=np.uint8)
+        self.assertEqual(apply_colormap(arr, "gray").mode, "L")
+        image = apply_colormap(arr, "viridis")
+        self.assertEqual(image.mode, "P")
+        self.assertEqual(image.convert("RGB").getpixel((0, 0)), tuple(colormap_palette("viridis")[:3]))
+
+
+if __name__ == "__main__":
+    unittest.main()
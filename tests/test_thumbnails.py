@@ -0,0 +1,104 @@
+"""Unit tests for view_contents/panels/media/thumbnails.py"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+from PIL import Image
+
+from aind_qc_portal.view_contents.panels.media.thumbnails import (
+    make_preview,
+    needs_conversion,
+    preview_url,
+    supports_preview,
+)
+
+
+class TestPreviewHelpers(unittest.TestCase):
+    """Test choosing and addressing previews"""
+
+    def test_supports_preview(self):
+        """Test that only raster images get previews"""
+        self.assertTrue(supports_preview("figures/plot.PNG"))
+        self.assertTrue(supports_preview("stack.tiff"))
+        self.assertFalse(supports_preview("figure.svg"))
+        self.assertFalse(supports_preview("video.mp4"))
+
+    def test_needs_conversion(self):
+        """Test that only formats browsers can't display are converted"""
+        self.assertTrue(needs_conversion("stack.tif"))
+        self.assertFalse(needs_conversion("plot.png"))
+
+    def test_preview_url(self):
+        """Test that the asset name and reference are quoted"""
+        self.assertEqual(
+            preview_url("asset_1", "qc/a b.png", 400),
+            "/media-preview/asset_1?reference=qc%2Fa%20b.png&width=400",
+        )
+
+
+class TestMakePreview(unittest.TestCase):
+    """Test generating WebP previews"""
+
+    def setUp(self):
+        """Create a temporary directory for the images"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.dest = os.path.join(self.tmp_dir.name, "preview.webp")
+
+    def _source(self, img: Image.Image, name: str) -> str:
+        """Save a source image and return its path"""
+        path = os.path.join(self.tmp_dir.name, name)
+        img.save(path)
+        return path
+
+    def test_downscales_and_keeps_aspect_ratio(self):
+        """Test that wide images are scaled down to the preview width"""
+        source = self._source(Image.new("RGB", (2400, 600), "red"), "wide.png")
+        make_preview(source, self.dest, 1200)
+        with Image.open(self.dest) as img:
+            self.assertEqual(img.format, "WEBP")
+            self.assertEqual(img.size, (1200, 300))
+        self.assertFalse(os.path.exists(f"{self.dest}.part"))
+
+    def test_small_images_are_not_upscaled(self):
+        """Test that images narrower than the preview width keep their size"""
+        source = self._source(Image.new("RGB", (200, 100), "red"), "small.jpg")
+        make_preview(source, self.dest, 1200)
+        with Image.open(self.dest) as img:
+            self.assertEqual(img.size, (200, 100))
+
+    def test_transparency_is_kept(self):
+        """Test that RGBA images keep their alpha channel"""
+        source = self._source(Image.new("RGBA", (100, 100), (255, 0, 0, 0)), "alpha.png")
+        make_preview(source, self.dest)
+        with Image.open(self.dest) as img:
+            self.assertEqual(img.mode, "RGBA")
+
+    def test_16_bit_tiff_is_scaled_to_8_bit(self):
+        """Test that high bit-depth images are scaled to their full range"""
+        arr = np.linspace(1000, 3000, 64 * 64).reshape(64, 64).astype(np.uint16)
+        source = self._source(Image.fromarray(arr), "stack.tif")
+        make_preview(source, self.dest, None)
+        with Image.open(self.dest) as img:
+            self.assertEqual(img.size, (64, 64))
+            low, high = img.convert("L").getextrema()
+        self.assertLess(low, 10)
+        self.assertGreater(high, 245)
+
+    def test_large_images_allowed_only_while_opening(self):
+        """Test that images above PIL's decompression bomb limit get previews without lifting the limit"""
+        source = self._source(Image.new("RGB", (200, 100), "red"), "large.png")
+        with patch.object(Image, "MAX_IMAGE_PIXELS", 1000):
+            with self.assertRaises(Image.DecompressionBombError):
+                Image.open(source)
+            make_preview(source, self.dest, 100)
+            self.assertEqual(Image.MAX_IMAGE_PIXELS, 1000)
+        with Image.open(self.dest) as img:
+            self.assertEqual(img.size, (100, 50))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""Unit tests for view_contents/panels/media/tiles.py"""
+
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import httpx
+from PIL import Image
+
+from aind_qc_portal.view_contents.panels.media import tiles
+from aind_qc_portal.view_contents.panels.media.tiles import (
+    build_pyramid,
+    is_tile_info_url,
+    needs_tiling,
+    pyramid_levels,
+    tile_info_url,
+    url_needs_tiling,
+)
+
+
+def png_bytes(size: tuple[int, int]) -> bytes:
+    """Encode a blank PNG of the given size"""
+    buffer = io.BytesIO()
+    Image.new("1", size).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class TestTileHelpers(unittest.TestCase):
+    """Test pyramid geometry and URLs"""
+
+    def test_pyramid_levels(self):
+        """Test that levels halve, rounding up, until the image fits in one tile"""
+        self.assertEqual(pyramid_levels(1000, 300, 256), [(1000, 300), (500, 150), (250, 75)])
+        self.assertEqual(pyramid_levels(200, 100, 256), [(200, 100)])
+
+    def test_tile_info_url(self):
+        """Test that the URL is recognized and the reference is quoted"""
+        url = tile_info_url("asset_1", "qc/big overview.png")
+        self.assertEqual(url, "/media-tiles/asset_1/info.json?reference=qc%2Fbig%20overview.png")
+        self.assertTrue(is_tile_info_url(url))
+        self.assertFalse(is_tile_info_url("/media-preview/asset_1?reference=a.png"))
+        self.assertFalse(is_tile_info_url(None))
+
+    def test_needs_tiling(self):
+        """Test that only images above the pixel threshold are tiled"""
+        with tempfile.NamedTemporaryFile(suffix=".png") as f:
+            Image.new("RGB", (100, 50)).save(f.name)
+            with patch.object(tiles, "TILING_MIN_PIXELS", 5000):
+                self.assertTrue(needs_tiling(f.name))
+            with patch.object(tiles, "TILING_MIN_PIXELS", 5001):
+                self.assertFalse(needs_tiling(f.name))
+            self.assertFalse(needs_tiling(f"{f.name}.missing"))
+
+    def test_url_needs_tiling_reads_only_the_header(self):
+        """Test that the size is read from a range request for the first bytes of the image"""
+        response = MagicMock(content=png_bytes((100, 50))[: tiles.IMAGE_HEADER_BYTES])
+        with patch.object(tiles.httpx, "get", return_value=response) as get:
+            with patch.object(tiles, "TILING_MIN_PIXELS", 5000):
+                self.assertTrue(url_needs_tiling("https://s3/bucket/big.png"))
+            with patch.object(tiles, "TILING_MIN_PIXELS", 5001):
+                self.assertFalse(url_needs_tiling("https://s3/bucket/big.png"))
+        self.assertEqual(get.call_args.kwargs["headers"], {"Range": f"bytes=0-{tiles.IMAGE_HEADER_BYTES - 1}"})
+
+    def test_url_needs_tiling_above_decompression_bomb_limit(self):
+        """Test that images too large for PIL's default limit are tiled without lifting the limit"""
+        response = MagicMock(content=png_bytes((100, 50)))
+        with patch.object(tiles.httpx, "get", return_value=response), patch.object(Image, "MAX_IMAGE_PIXELS", 1000):
+            self.assertTrue(url_needs_tiling("https://s3/bucket/huge.png"))
+
+    def test_url_needs_tiling_unknown(self):
+        """Test that None is returned when the header can't be read or fetched"""
+        with patch.object(tiles.httpx, "get", return_value=MagicMock(content=b"II*\x00\xff\xff\xff\x00")):
+            self.assertIsNone(url_needs_tiling("https://s3/bucket/stack.tif"))
+        with patch.object(tiles.httpx, "get", side_effect=httpx.ConnectError("offline")):
+            self.assertIsNone(url_needs_tiling("https://s3/bucket/big.png"))
+
+
+class TestBuildPyramid(unittest.TestCase):
+    """Test writing tile pyramids"""
+
+    def test_tiles_cover_every_level(self):
+        """Test that each level is fully covered by tiles, with partial tiles at the edges"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = os.path.join(tmp_dir, "source.png")
+            Image.new("RGB", (600, 300), "blue").save(source)
+            dest = os.path.join(tmp_dir, "pyramid")
+
+            info = build_pyramid(source, dest, tile_size=256)
+
+            self.assertEqual(json.loads(open(os.path.join(dest, "info.json")).read()), info)
+            self.assertEqual(info["levels"], [[600, 300], [300, 150], [150, 75]])
+            self.assertEqual(
+                sorted(os.listdir(os.path.join(dest, "0"))), [f"{c}_{r}.webp" for c in range(3) for r in range(2)]
+            )
+            self.assertEqual(sorted(os.listdir(os.path.join(dest, "1"))), ["0_0.webp", "1_0.webp"])
+            with Image.open(os.path.join(dest, "0", "2_1.webp")) as tile:
+                self.assertEqual(tile.size, (88, 44))
+            with Image.open(os.path.join(dest, "2", "0_0.webp")) as tile:
+                self.assertEqual(tile.size, (150, 75))
+            self.assertFalse(os.path.exists(f"{dest}.part"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+"""Unit tests for view_contents/panels/media/transcode.py"""
+
+import threading
+import unittest
+from concurrent.futures import Future
+from unittest.mock import MagicMock, patch
+
+import httpx
+
+from aind_qc_portal.view_contents.panels.media import transcode
+from aind_qc_portal.view_contents.panels.media.transcode import (
+    is_transcoded_video_url,
+    probe_video,
+    start_poster,
+    start_transcode,
+    streamable_name,
+    transcoded_video_url,
+)
+
+HTTPX_CLIENT = httpx.Client
+URL = "https://bucket.s3.amazonaws.com/qc/video.mp4?X-Amz-Signature=abc"
+
+
+def box(box_type: bytes, size: int) -> bytes:
+    """An mp4 box header padded to its size"""
+    return size.to_bytes(4, "big") + box_type + bytes(size - 8)
+
+
+class FakeS3:
+    """Serve one object with Range support"""
+
+    def __init__(self, content: bytes):
+        """Serve content with a fixed ETag"""
+        self.content = content
+        self.requests = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        """Handle a ranged GET"""
+        self.requests += 1
+        start, end = (int(i) for i in request.headers["Range"].removeprefix("bytes=").split("-"))
+        end = min(end, len(self.content) - 1)
+        headers = {"ETag": '"etag-1"', "Content-Range": f"bytes {start}-{end}/{len(self.content)}"}
+        return httpx.Response(206, content=self.content[start : end + 1], headers=headers)
+
+    def client(self, *args, **kwargs):
+        """Build an httpx client that uses this fake"""
+        return HTTPX_CLIENT(transport=httpx.MockTransport(self.handler))
+
+
+class TestProbeVideo(unittest.TestCase):
+    """Test finding the moov box with ranged reads"""
+
+    def setUp(self):
+        """Clear the probe cache"""
+        transcode._probes.clear()
+        self.addCleanup(transcode._probes.clear)
+
+    def _probe(self, content: bytes, url: str = URL, find_moov: bool = True):
+        """Probe content served by a fake S3"""
+        s3 = FakeS3(content)
+        with patch.object(transcode.httpx, "Client", side_effect=s3.client):
+            return probe_video(url, find_moov), s3
+
+    def test_faststart(self):
+        """Test that a moov box before mdat is detected"""
+        (etag, faststart), _ = self._probe(box(b"ftyp", 32) + box(b"free", 8) + box(b"moov", 100) + box(b"mdat", 1000))
+        self.assertEqual(etag, "etag-1")
+        self.assertTrue(faststart)
+
+    def test_not_faststart(self):
+        """Test that mdat before moov is detected without reading the media data"""
+        (_, faststart), s3 = self._probe(box(b"ftyp", 32) + box(b"mdat", 1000) + box(b"moov", 100))
+        self.assertFalse(faststart)
+        self.assertEqual(s3.requests, 2)
+
+    def test_etag_only(self):
+        """Test that only one request is made when the moov box isn't needed"""
+        (etag, faststart), s3 = self._probe(b"RIFF" + bytes(100), find_moov=False)
+        self.assertEqual((etag, faststart), ("etag-1", None))
+        self.assertEqual(s3.requests, 1)
+
+    def test_cached_per_key(self):
+        """Test that a probe is reused for other presigned URLs of the same object"""
+        content = box(b"ftyp", 32) + box(b"moov", 100) + box(b"mdat", 1000)
+        self._probe(content)
+        result, s3 = self._probe(content, url=URL.replace("abc", "def"))
+        self.assertEqual(result, ("etag-1", True))
+        self.assertEqual(s3.requests, 0)
+
+    def test_failures_not_cached(self):
+        """Test that a failed probe is retried"""
+        with patch.object(transcode.httpx, "Client", side_effect=httpx.ConnectError("unreachable")):
+            self.assertEqual(probe_video(URL), (None, None))
+        result, s3 = self._probe(box(b"ftyp", 32) + box(b"moov", 100) + box(b"mdat", 1000))
+        self.assertEqual(result, ("etag-1", True))
+        self.assertEqual(s3.requests, 2)
+
+
+class TestStreamableName(unittest.TestCase):
+    """Test deciding which videos are transcoded"""
+
+    def test_needs_transcoding(self):
+        """Test that non-faststart mp4s and avis are transcoded, other videos are not"""
+        with patch.object(transcode, "FFMPEG_PATH", "ffmpeg"):
+            with patch.object(transcode, "probe_video", return_value=("etag-1", False)):
+                name = streamable_name(URL, "qc/video.mp4")
+                self.assertTrue(name)
+                self.assertEqual(streamable_name(URL, "qc/video.avi"), name)
+                self.assertIsNone(streamable_name(URL, "qc/video.webm"))
+            with patch.object(transcode, "probe_video", return_value=("etag-1", True)):
+                self.assertIsNone(streamable_name(URL, "qc/video.mp4"))
+            with patch.object(transcode, "probe_video", return_value=("etag-2", False)):
+                self.assertNotEqual(streamable_name(URL, "qc/video.mp4"), name)
+
+    def test_without_ffmpeg(self):
+        """Test that nothing is transcoded when ffmpeg isn't installed"""
+        with patch.object(transcode, "FFMPEG_PATH", ""):
+            self.assertIsNone(streamable_name(URL, "qc/video.avi"))
+
+    def test_urls(self):
+        """Test building and recognizing the streamable copy URL"""
+        url = transcoded_video_url("asset", "qc/video.avi")
+        self.assertEqual(url, "/media-video/asset/qc%2Fvideo.avi/video.mp4")
+        self.assertTrue(is_transcoded_video_url(url))
+        self.assertFalse(is_transcoded_video_url(transcoded_video_url("asset", "qc/video.avi", "poster.jpg")))
+
+
+class TestStartTranscode(unittest.TestCase):
+    """Test sharing transcode jobs"""
+
+    def test_concurrent_requests_share_a_job(self):
+        """Test that a video is only transcoded once while its job is running"""
+        release = threading.Event()
+
+        def fake_transcode(url, name, reference):
+            """Wait until released"""
+            release.wait(5)
+            return "/tmp/video.mp4"
+
+        with (
+            patch.object(transcode, "transcode", side_effect=fake_transcode) as mock_transcode,
+            patch.object(transcode, "make_poster", return_value="/tmp/poster.jpg"),
+        ):
+            first = start_transcode(URL, "name", "qc/video.avi")
+            second = start_transcode(URL, "name", "qc/video.avi")
+            release.set()
+            self.assertIs(first, second)
+            self.assertEqual(first.result(5), "/tmp/video.mp4")
+        mock_transcode.assert_called_once()
+
+    def test_poster_extracted_before_transcode(self):
+        """Test that the poster frame is ready while the video is still being transcoded"""
+        release = threading.Event()
+
+        def fake_transcode(url, name, reference):
+            """Wait until released"""
+            release.wait(5)
+            return "/tmp/video.mp4"
+
+        with (
+            patch.object(transcode, "transcode", side_effect=fake_transcode),
+            patch.object(transcode, "make_poster", return_value="/tmp/poster.jpg") as mock_poster,
+        ):
+            video = start_transcode(URL, "poster-name", "qc/video.avi")
+            self.assertEqual(start_poster(URL, "poster-name", "qc/video.avi").result(5), "/tmp/poster.jpg")
+            self.assertFalse(video.done())
+            release.set()
+            video.result(5)
+        mock_poster.assert_called_once()
+
+    def test_poster_of_job_that_never_ran(self):
+        """Test that the poster resolves to None when the job is cancelled before it starts"""
+        pool = MagicMock()
+        pool.submit.return_value = Future()
+        with patch.object(transcode, "get_thread_pool", return_value=pool):
+            poster = start_poster(URL, "cancelled-name", "qc/video.avi")
+            pool.submit.return_value.cancel()
+        self.assertIsNone(poster.result(5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+"""Unit tests for view_contents/panels/media/curation_apps/volume.py"""
+
+import io
+import unittest
+from unittest.mock import patch
+
+import h5py
+import numpy as np
+import zarr
+
+from aind_qc_portal.view_contents.panels.media.curation_apps import volume as volume_module
+from aind_qc_portal.view_contents.panels.media.curation_apps.volume import (
+    H5Volume,
+    Volume,
+    _multiscale_paths,
+    is_zarr_url,
+    pick_level,
+)
+
+
+class FakeGroup:
+    """Group with attributes and array keys"""
+
+    def __init__(self, attrs: dict, keys: list[str]):
+        """Store attributes and keys"""
+        self.attrs = attrs
+        self.keys = keys
+
+    def array_keys(self):
+        """Names of the arrays in the group"""
+        return iter(self.keys)
+
+
+class TestVolume(unittest.TestCase):
+    """Test reading levels and picking the level to display"""
+
+    def setUp(self):
+        """Create a volume with a leading channel axis and two levels"""
+        self.data = np.arange(2 * 8 * 64 * 32, dtype=np.uint16).reshape(2, 8, 64, 32)
+        self.volume = Volume([self.data, self.data[:, ::2, ::2, ::2]])
+
+    def test_shapes(self):
+        """Test that shapes drop leading axes"""
+        self.assertEqual(self.volume.shape, (8, 64, 32))
+        self.assertEqual(self.volume.level_shape(1), (4, 32, 16))
+        self.assertEqual(self.volume.dtype, np.uint16)
+
+    def test_read(self):
+        """Test that reads select the first channel"""
+        selection = (slice(1, 3), slice(0, 4), slice(5, 6))
+        np.testing.assert_array_equal(self.volume.read(selection), self.data[0, 1:3, 0:4, 5:6])
+        np.testing.assert_array_equal(self.volume.read(selection, level=1), self.data[0, 2:6:2, 0:8:2, 10:12:2])
+
+    def test_pick_level(self):
+        """Test that the coarsest level filling the display is picked"""
+        self.assertEqual(pick_level(self.volume, (1, 2), zoom=1, display_size=32), 1)
+        self.assertEqual(pick_level(self.volume, (1, 2), zoom=2, display_size=32), 0)
+        self.assertEqual(pick_level(self.volume, (1, 2), zoom=1, display_size=100), 0)
+
+    def test_empty(self):
+        """Test that a volume needs an array"""
+        with self.assertRaises(ValueError):
+            Volume([])
+
+
+class TestH5Volume(unittest.TestCase):
+    """Test reading H5 datasets"""
+
+    def test_read(self):
+        """Test that reads match the dataset"""
+        data = np.random.default_rng(0).integers(0, 1000, size=(16, 32, 32), dtype=np.uint16)
+        buffer = io.BytesIO()
+        with h5py.File(buffer, "w") as f:
+            f.create_dataset("data", data=data, chunks=(4, 16, 16))
+        volume = H5Volume(buffer)
+        self.addCleanup(volume.close)
+        self.assertFalse(volume.can_prefetch)
+        self.assertEqual(volume.shape, (16, 32, 32))
+        np.testing.assert_array_equal(volume.read((slice(3, 9), slice(10, 20), slice(0, 32, 4))), data[3:9, 10:20, ::4])
+
+
+class TestOpenFiles(unittest.TestCase):
+    """Test the per-process cap on open H5 files"""
+
+    def setUp(self):
+        """Allow one open file"""
+        patcher = patch.object(volume_module, "_open_files", volume_module._OpenFiles(max_open=1))
+        self.open_files = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def open(self, value: int) -> H5Volume:
+        """Open a volume filled with a value"""
+        buffer = io.BytesIO()
+        with h5py.File(buffer, "w") as f:
+            f.create_dataset("data", data=np.full((4, 8, 8), value, dtype=np.uint8))
+        volume = H5Volume(buffer)
+        self.addCleanup(volume.close)
+        return volume
+
+    def test_least_recently_read_is_released(self):
+        """Test that opening a file over the cap closes the other one, which reopens when read"""
+        first = self.open(1)
+        second = self.open(2)
+        self.assertIsNone(first._h5file)
+        self.assertEqual(len(self.open_files), 1)
+        selection = (slice(0, 1), slice(None), slice(None))
+        self.assertEqual(first.read(selection).max(), 1)
+        self.assertIsNone(second._h5file)
+        self.assertEqual(first.shape, (4, 8, 8))
+        self.assertEqual(second.dtype, np.uint8)
+
+    def test_closed(self):
+        """Test that a closed volume can't be read"""
+        volume = self.open(1)
+        volume.close()
+        volume.close()
+        self.assertEqual(len(self.open_files), 0)
+        with self.assertRaises(ValueError):
+            volume.read((slice(0, 1), slice(None), slice(None)))
+
+
+class TestMultiscalePaths(unittest.TestCase):
+    """Test finding the arrays of a multiscale group"""
+
+    def test_ome_metadata(self):
+        """Test OME-Zarr multiscales metadata, before and after 0.5"""
+        multiscales = [{"datasets": [{"path": "0"}, {"path": "1"}]}]
+        self.assertEqual(_multiscale_paths(FakeGroup({"multiscales": multiscales}, [])), ["0", "1"])
+        self.assertEqual(_multiscale_paths(FakeGroup({"ome": {"multiscales": multiscales}}, [])), ["0", "1"])
+
+    def test_n5_scales(self):
+        """Test s0, s1, ... arrays sorted by number"""
+        self.assertEqual(_multiscale_paths(FakeGroup({}, ["s10", "s2", "s0", "other"])), ["s0", "s2", "s10"])
+
+    def test_single_array(self):
+        """Test a group with one array and no metadata"""
+        self.assertEqual(_multiscale_paths(FakeGroup({}, ["data"])), ["data"])
+        with self.assertRaises(ValueError):
+            _multiscale_paths(FakeGroup({}, ["labels"]))
+
+    def test_is_zarr_url(self):
+        """Test recognizing Zarr and N5 stores"""
+        self.assertTrue(is_zarr_url("s3://bucket/tile.ome.zarr/"))
+        self.assertTrue(is_zarr_url("s3://bucket/fused.N5"))
+        self.assertFalse(is_zarr_url("s3://bucket/volume.h5"))
+
+
+class TestZarrVolume(unittest.TestCase):
+    """Test opening an OME-Zarr store"""
+
+    def test_open(self):
+        """Test that levels are read in multiscales order"""
+        import tempfile
+
+        from aind_qc_portal.view_contents.panels.media.curation_apps.volume import ZarrVolume
+
+        data = np.arange(4 * 8 * 8, dtype=np.uint8).reshape(1, 4, 8, 8)
+        with tempfile.TemporaryDirectory() as directory:
+            url = f"{directory}/volume.ome.zarr"
+            group = zarr.open_group(url, mode="w")
+            group.array("0", data)
+            group.attrs["multiscales"] = [{"datasets": [{"path": "0"}]}]
+            volume = ZarrVolume(url)
+            self.assertEqual(volume.name, "volume.ome.zarr")
+            self.assertEqual(volume.shape, (4, 8, 8))
+            np.testing.assert_array_equal(volume.read((slice(1, 2), slice(None), slice(None))), data[0, 1:2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Unit tests for view_contents/panels/media/curation_apps/z_max_pyramid.py"""
+
+import unittest
+
+import numpy as np
+
+from aind_qc_portal.view_contents.panels.media.curation_apps.z_max_pyramid import ZMaxPyramid
+
+
+class CountingVolume:
+    """Numpy volume that counts the slices read from it"""
+
+    def __init__(self, n: int):
+        """Random uint16 volume with n slices"""
+        self.data = np.random.default_rng(0).integers(0, 60000, size=(n, 4, 5), dtype=np.uint16)
+        self.slices_read = 0
+
+    def read(self, start: int, stop: int, yx: tuple[slice, slice]) -> np.ndarray:
+        """Read a region of slices [start, stop)"""
+        self.slices_read += stop - start
+        return self.data[(slice(start, stop),) + yx]
+
+
+class TestZMaxPyramid(unittest.TestCase):
+    """Test that pyramid projections match direct projections while reading fewer slices"""
+
+    def test_every_window_matches_numpy(self):
+        """Test all windows of volumes whose size is and isn't a multiple of the block size"""
+        for n in (16, 21):
+            volume = CountingVolume(n)
+            pyramid = ZMaxPyramid(volume.read, volume.data.shape, volume.data.dtype, min_block=2)
+            pyramid.build()
+            self.assertTrue(pyramid.ready)
+            for start in range(n):
+                for stop in range(start + 1, n + 1):
+                    expected = volume.data[start:stop].max(axis=0)
+                    result = pyramid.project(start, stop)
+                    self.assertEqual(result.dtype, np.uint16)
+                    np.testing.assert_array_equal(result, expected, err_msg=f"window {start}:{stop}")
+
+    def test_reads_only_edge_slices(self):
+        """Test that a large window only reads the slices outside whole blocks"""
+        volume = CountingVolume(256)
+        pyramid = ZMaxPyramid(volume.read, volume.data.shape, volume.data.dtype, min_block=8)
+        pyramid.build()
+        volume.slices_read = 0
+
+        np.testing.assert_array_equal(pyramid.project(3, 250), volume.data[3:250].max(axis=0))
+        self.assertEqual(volume.slices_read, (8 - 3) + (250 - 248))
+
+    def test_region(self):
+        """Test projecting a downsampled region of the plane"""
+        volume = CountingVolume(64)
+        pyramid = ZMaxPyramid(volume.read, volume.data.shape, volume.data.dtype, min_block=8)
+        yx = (slice(1, 4, 2), slice(0, 5, 3))
+        for built in (False, True):
+            if built:
+                pyramid.build()
+            np.testing.assert_array_equal(pyramid.project(3, 50, yx), volume.data[3:50, 1:4:2, 0:5:3].max(axis=0))
+
+    def test_projection_does_not_modify_levels(self):
+        """Test that results are copies, not views into the pyramid"""
+        volume = CountingVolume(32)
+        pyramid = ZMaxPyramid(volume.read, volume.data.shape, volume.data.dtype, min_block=8)
+        pyramid.build()
+        pyramid.project(0, 8)[:] = 0
+        np.testing.assert_array_equal(pyramid.project(0, 8), volume.data[0:8].max(axis=0))
+
+    def test_budget(self):
+        """Test that the block size grows to fit the budget, and that small volumes are skipped"""
+        volume = CountingVolume(256)
+        plane_bytes = 4 * 5 * 2
+        pyramid = ZMaxPyramid(volume.read, volume.data.shape, volume.data.dtype, max_bytes=31 * plane_bytes)
+        self.assertEqual(pyramid.block, 16)
+        pyramid = ZMaxPyramid(volume.read, volume.data.shape, volume.data.dtype, max_bytes=30 * plane_bytes)
+        self.assertEqual(pyramid.block, 32)
+        self.assertFalse(ZMaxPyramid(volume.read, volume.data.shape, volume.data.dtype, max_bytes=1).enabled)
+        self.assertFalse(ZMaxPyramid(volume.read, (8, 4, 5), np.uint16).enabled)
+
+    def test_not_built(self):
+        """Test that projections are read directly until the pyramid is built, and after a cancelled build"""
+        volume = CountingVolume(64)
+        pyramid = ZMaxPyramid(volume.read, volume.data.shape, volume.data.dtype)
+        pyramid.cancel()
+        pyramid.build()
+        self.assertFalse(pyramid.ready)
+        np.testing.assert_array_equal(pyramid.project(0, 64), volume.data.max(axis=0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,227 @@
+"""Unit tests for view_contents/panels/media/curation_apps/z_slice_h5_viewer.py"""
+
+import gc
+import io
+import time
+import unittest
+import weakref
+from concurrent.futures import Future
+from unittest.mock import patch
+
+import h5py
+import numpy as np
+from PIL import Image
+
+from aind_qc_portal.view_contents.panels.media.curation_apps import z_slice_h5_viewer
+from aind_qc_portal.view_contents.panels.media.curation_apps.contrast import ContrastHistogram
+from aind_qc_portal.view_contents.panels.media.curation_apps.h5_reader import RangeCacheFile
+from aind_qc_portal.view_contents.panels.media.curation_apps.volume import Volume
+from aind_qc_portal.view_contents.panels.media.curation_apps.z_slice_h5_viewer import ZSliceH5Viewer
+from aind_qc_portal.view_contents.panels.media.process_pool import encode_png
+
+
+class FakeFileSystem:
+    """Serve one file from memory, counting the bytes read"""
+
+    def __init__(self, content: bytes):
+        """Serve content"""
+        self.content = content
+        self.bytes_read = 0
+
+    def size(self, path: str) -> int:
+        """Size of the file"""
+        return len(self.content)
+
+    def cat_file(self, path: str, start: int, end: int) -> bytes:
+        """Read bytes [start, end)"""
+        self.bytes_read += end - start
+        return self.content[start:end]
+
+
+class FakeDocument:
+    """Session document recording its session destroyed callbacks"""
+
+    def __init__(self):
+        """No callbacks yet"""
+        self.callbacks = []
+
+    def on_session_destroyed(self, callback):
+        """Record a callback"""
+        self.callbacks.append(callback)
+
+
+class RecordingVolume(Volume):
+    """Volume recording the levels it reads"""
+
+    def read(self, selection: tuple[slice, slice, slice], level: int = 0) -> np.ndarray:
+        """Record the level and read"""
+        self.read_levels.append(level)
+        return super().read(selection, level)
+
+
+def wait_until(condition, timeout: float = 5):
+    """Wait for a condition set by a background thread"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the condition")
+        time.sleep(0.01)
+
+
+class TestZSliceH5Viewer(unittest.TestCase):
+    """Test XY projections and orthogonal sections against numpy"""
+
+    def setUp(self):
+        """Open a chunked volume served from memory"""
+        self.volume = np.random.default_rng(0).integers(0, 1000, size=(32, 128, 96), dtype=np.uint16)
+        buffer = io.BytesIO()
+        with h5py.File(buffer, "w") as f:
+            f.create_dataset("data", data=self.volume, chunks=(8, 32, 32))
+        self.fs = FakeFileSystem(buffer.getvalue())
+        self.viewer = ZSliceH5Viewer(RangeCacheFile(self.fs, "volume.h5", block_size=4096), filename="volume.h5")
+        self.viewer._render_future.result()
+
+    def render(self, **params):
+        """Update the viewer and wait for it to render"""
+        self.viewer.param.update(**params)
+        self.viewer._render_future.result()
+
+    def assertShows(self, expected: np.ndarray):
+        """Assert that the current projection matches an array"""
+        np.testing.assert_array_equal(self.viewer._load_histogram().indices, ContrastHistogram(expected).indices)
+
+    def test_xy(self):
+        """Test XY max projections"""
+        self.render(z=10, window=2)
+        self.assertShows(self.volume[8:13].max(axis=0))
+
+    def test_sections(self):
+        """Test XZ and YZ sections with a max projection window"""
+        self.render(view="XZ", y=40, window=3)
+        self.assertShows(self.volume[:, 37:44, :].max(axis=1))
+        self.render(view="YZ", x=90, window=10)
+        self.assertShows(self.volume[:, :, 80:96].max(axis=2))
+
+    def test_png(self):
+        """Test rendering on the server, with the colormap applied"""
+        viewer = ZSliceH5Viewer(self.viewer.volume, render_in_browser=False, colormap="viridis")
+        viewer._render_future.result()
+        image = Image.open(io.BytesIO(viewer.image.object))
+        self.assertEqual((image.mode, image.size), ("P", (96, 128)))
+        np.testing.assert_array_equal(np.asarray(image), viewer._load_histogram().to_uint8(0, 99))
+
+    def test_render_path_from_environment(self):
+        """Test that QC_PORTAL_H5_RENDER_IN_BROWSER picks the browser canvas or server PNGs by default"""
+        with patch.object(z_slice_h5_viewer, "H5_RENDER_IN_BROWSER", False):
+            viewer = ZSliceH5Viewer(self.viewer.volume)
+        viewer._render_future.result()
+        wait_until(lambda: not viewer.image.loading)
+        self.assertFalse(viewer.render_in_browser)
+        self.assertIs(viewer.__panel__()[-1], viewer.image)
+        self.assertEqual(Image.open(io.BytesIO(viewer.image.object)).size, (96, 128))
+        self.assertIsNone(viewer.canvas.data)
+
+        with patch.object(z_slice_h5_viewer, "H5_RENDER_IN_BROWSER", True):
+            viewer = ZSliceH5Viewer(self.viewer.volume)
+        viewer._render_future.result()
+        wait_until(lambda: not viewer.canvas.loading)
+        self.assertTrue(viewer.render_in_browser)
+        self.assertIs(viewer.__panel__()[-1], viewer.canvas)
+        self.assertEqual(viewer.canvas.image_shape, [128, 96])
+        self.assertIsNone(viewer.image.object)
+
+    def test_png_task_replaced(self):
+        """Test that a render whose encoding task another render replaced in the queue is rendered again"""
+        viewer = ZSliceH5Viewer(self.viewer.volume, render_in_browser=False)
+        wait_until(lambda: not viewer.image.loading)
+        submit = viewer._cpu_tasks.submit
+        replaced = []
+
+        def replace_first_encoding(fn, *args, **kwargs):
+            """Return a cancelled task for the first PNG encoding, as SessionTasks does when replacing it"""
+            if fn is encode_png and not replaced:
+                future = Future()
+                future.cancel()
+                replaced.append(future)
+                return future
+            return submit(fn, *args, **kwargs)
+
+        with patch.object(viewer._cpu_tasks, "submit", side_effect=replace_first_encoding):
+            viewer.colormap = "viridis"
+            wait_until(lambda: not viewer.image.loading)
+
+        self.assertEqual(len(replaced), 1)
+        image = Image.open(io.BytesIO(viewer.image.object))
+        np.testing.assert_array_equal(np.asarray(image), viewer._load_histogram().to_uint8(0, 99))
+        self.assertEqual(image.getpalette()[:3], [68, 1, 84])
+
+    def test_release(self):
+        """Test that a released viewer drops its projections and reopens its file when used again"""
+        self.viewer.release()
+        self.assertEqual(len(self.viewer._projections), 0)
+        self.assertIsNone(self.viewer.volume._h5file)
+        self.render(z=10, window=2)
+        self.assertShows(self.volume[8:13].max(axis=0))
+
+    def test_closed_with_session(self):
+        """Test that the viewer is closed with its session, and that the session doesn't keep it alive"""
+        doc = FakeDocument()
+        self.viewer._close_with_session(doc)
+        [callback] = doc.callbacks
+        callback(None)
+        self.assertTrue(self.viewer._closed)
+        with self.assertRaises(ValueError):
+            self.viewer.volume.read((slice(0, 1), slice(None), slice(None)))
+
+        viewer = ZSliceH5Viewer(Volume([self.volume]))
+        viewer._render_future.result()
+        viewer._close_with_session(doc)
+        ref = weakref.ref(viewer)
+        del viewer
+        gc.collect()
+        self.assertIsNone(ref())
+        doc.callbacks[-1](None)
+
+    def test_section_reads_intersecting_chunks(self):
+        """Test that a section only reads the chunks its window intersects"""
+        before = self.fs.bytes_read
+        self.render(view="XZ", y=40, window=0)
+        # One of four rows of chunks along y
+        self.assertLess(self.fs.bytes_read - before, self.volume.nbytes / 3)
+
+    def test_window_bounds_follow_view(self):
+        """Test that the window is limited by the length of the axis normal to the view"""
+        self.viewer.view = "XZ"
+        self.viewer.window = 60
+        self.viewer.view = "XY"
+        self.assertEqual(self.viewer.window, 16)
+        self.assertEqual(self.viewer.param.window.bounds, (0, 16))
+
+
+class TestMultiscaleViewer(unittest.TestCase):
+    """Test that multiscale volumes are read at the coarsest level filling the display"""
+
+    def setUp(self):
+        """Open a volume with two levels"""
+        self.data = np.random.default_rng(0).integers(0, 1000, size=(16, 256, 256), dtype=np.uint16)
+        self.volume = RecordingVolume([self.data, self.data[::2, ::2, ::2]], name="volume.zarr")
+        self.volume.read_levels = []
+        self.viewer = ZSliceH5Viewer(self.volume, display_size=128)
+        self.viewer._render_future.result()
+
+    def test_levels(self):
+        """Test that the coarse level is shown unless zoomed in"""
+        self.assertEqual(self.viewer.filename, "volume.zarr")
+        self.viewer.param.update(z=6, window=0)
+        self.viewer._render_future.result()
+        np.testing.assert_array_equal(
+            self.viewer._load_histogram().indices, ContrastHistogram(self.data[6, ::2, ::2]).indices
+        )
+        self.assertNotIn(0, self.volume.read_levels)
+        self.viewer.zoom = 2
+        self.viewer._render_future.result()
+        self.assertEqual(self.volume.read_levels[-1], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()